@@ -1,5 +1,8 @@
 from dataclasses import dataclass
-from typing import Any
+from typing import Any, Optional
+
+# Seconds between the Windows FILETIME epoch (1601) and the Unix epoch
+FILETIME_EPOCH_OFFSET_S = 11_644_473_600
 
 
 @dataclass
@@ -20,3 +23,12 @@ def parse_alert(raw: dict[str, Any]) -> Alert:
         locations=raw["data"],
         description=raw["desc"],
     )
+
+
+def get_published_at_s(alert_id: str) -> Optional[float]:
+    # oref alert ids are the Windows FILETIME (100ns ticks) the alert was published at
+    if not alert_id.isdigit():
+        return None
+
+    published_at_s = int(alert_id) / 10_000_000 - FILETIME_EPOCH_OFFSET_S
+    return published_at_s if published_at_s > 0 else None
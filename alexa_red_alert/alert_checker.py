@@ -1,38 +1,195 @@
-from typing import Any, Optional
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+from dataclasses import dataclass, field
+from enum import Enum
+from threading import Lock, Thread
+from time import monotonic, perf_counter, time
+from typing import Any, Iterable, Optional
+import hashlib
 import json
+import math
 
 import urllib3
 
 from alexa_red_alert.alert import Alert, parse_alert
 from alexa_red_alert.alert_category import AlertCategory, parse_alert_category
 from alexa_red_alert.district import District, parse_district
+from alexa_red_alert.latency_window import LatencyWindow
+from alexa_red_alert.location_index import build_location_index
+from alexa_red_alert.metadata import Metadata
 
-HTTP_POOL = urllib3.PoolManager()
+# Connections are kept alive across polls, two of them so a hedged request reuses one too
+HTTP_POOL = urllib3.PoolManager(maxsize=2)
+OREF_BASE_URL = "https://www.oref.org.il"
+# Used when the caller doesn't pass a deadline, so a hung request can't eat the invocation
+DEFAULT_SCAN_TIMEOUT_S = 3.0
+# A second alerts request is sent when the first is slower than this percentile of recent
+# ones, and the first response wins
+HEDGE_PERCENTILE = 95
+# Until enough requests were seen for the percentile
+DEFAULT_HEDGE_AFTER_S = 1.0
+MIN_HEDGE_SAMPLES = 20
+MIN_HEDGE_AFTER_S = 0.05
+
+
+class ScanStatus(Enum):
+    NO_ALERT = "no alert"
+    UNCHANGED = "unchanged"
+    NEW_ALERT = "new alert"
+    NEW_LOCATIONS = "same alert, new locations"
+    RE_ALERT = "same alert, re-alert due"
+
+
+@dataclass
+class ScanResult:
+    status: ScanStatus
+    alert: Optional[Alert] = None
+    new_locations: list[str] = field(default_factory=list)
 
 
 class AlertChecker:
-    def __init__(self):
-        self.metadata_loaded = False
+    def __init__(
+        self,
+        metadata_ttl_s: float = 60 * 60,
+        min_forced_refresh_interval_s: float = 30,
+        metadata: Optional[Metadata] = None,
+        re_alert_after_s: float = 120,
+        base_url: str = OREF_BASE_URL,
+        hedge: bool = True,
+        default_hedge_after_s: float = DEFAULT_HEDGE_AFTER_S,
+    ):
+        # Points at a local stand-in for benchmarks
+        self._base_url = base_url
+        self._metadata_ttl_s = metadata_ttl_s
+        self._re_alert_after_s = re_alert_after_s
+        self._min_forced_refresh_interval_s = min_forced_refresh_interval_s
 
-        self._districts_by_hebrew_name: dict[str, District] = {}
-        self._alert_categories_by_id: dict[str, AlertCategory] = {}
+        # Swapped as a whole so readers never see districts and categories from
+        # different fetches
+        self._metadata = metadata
+        self._refresh_lock = Lock()
+        self._refresh_thread: Optional[Thread] = None
+        self._last_forced_refresh_at: Optional[float] = None
+        # Milliseconds spent in each phase of the last load_metadata and scan
+        self.metadata_timings: dict[str, float] = {}
+        self.scan_timings: dict[str, float] = {}
 
-    def load_metadata(self) -> None:
-        self._districts_by_hebrew_name = {
-            district.hebrew_name: district for district in self._get_districts()
-        }
-        self._alert_categories_by_id = {
-            str(alert_category.category_id): alert_category
-            for alert_category in self._get_alert_categories()
+        self._etag: Optional[str] = None
+        self._last_modified: Optional[str] = None
+        self._last_body_digest: Optional[bytes] = None
+        self._last_alert: Optional[Alert] = None
+        # Location -> monotonic time its re-alert window started, which is when its row was
+        # last written. Infinite while the write of a hand-out hasn't been reported yet.
+        self._seen_locations: dict[str, float] = {}
+        # The alert id and the time it was first seen at, kept when a scan is forgotten so
+        # retried writes still measure their latency from the first sighting
+        self._first_seen: Optional[tuple[str, float]] = None
+
+        self._hedge = hedge
+        self._default_hedge_after_s = default_hedge_after_s
+        # Kept across scans, a losing request may still be running when the next starts
+        self._fetch_executor = ThreadPoolExecutor(max_workers=4)
+        self._request_latencies = LatencyWindow()
+        self._requests = 0
+        self._hedged_requests = 0
+        self._hedge_wins = 0
+        # Whether the last scan sent a hedged request
+        self.scan_hedged = False
+
+    @property
+    def metadata(self) -> Optional[Metadata]:
+        return self._metadata
+
+    @property
+    def metadata_loaded(self) -> bool:
+        return self._metadata is not None
+
+    @property
+    def request_stats(self) -> dict[str, Any]:
+        stats: dict[str, Any] = {
+            "requests": self._requests,
+            "hedged": self._hedged_requests,
+            "hedge_wins": self._hedge_wins,
         }
+        for percent in (50, 95, 99):
+            latency_s = self._request_latencies.percentile(percent)
+            stats[f"p{percent}_ms"] = (
+                None if latency_s is None else round(latency_s * 1000, 1)
+            )
+
+        return stats
+
+    @property
+    def metadata_is_stale(self) -> bool:
+        return (
+            self._metadata is None
+            or time() - self._metadata.fetched_at_s >= self._metadata_ttl_s
+        )
+
+    def load_metadata(self) -> None:
+        start = perf_counter()
+        timings: dict[str, float] = {}
+
+        # Both fetches go out at once, so a cold start pays for the slower one only
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            districts_future = executor.submit(self._get_districts, timings)
+            alert_categories_future = executor.submit(
+                self._get_alert_categories, timings
+            )
+            districts = districts_future.result()
+            alert_categories_by_id = alert_categories_future.result()
+
+        index_start = perf_counter()
+        location_index = build_location_index(districts)
+        timings["location_index_ms"] = (perf_counter() - index_start) * 1000
+
+        timings["total_ms"] = (perf_counter() - start) * 1000
+        self.metadata_timings = timings
+        self._metadata = Metadata(
+            location_index=location_index,
+            alert_categories_by_id=alert_categories_by_id,
+            fetched_at_s=time(),
+        )
+
+    def refresh_metadata_in_background(self, force: bool = False) -> bool:
+        # Never blocks, alerts keep being handled with the current snapshot until the
+        # refreshed one is swapped in
+        with self._refresh_lock:
+            if self._refresh_thread and self._refresh_thread.is_alive():
+                return False
+
+            now = monotonic()
+            if force:
+                if (
+                    self._last_forced_refresh_at is not None
+                    and now - self._last_forced_refresh_at
+                    < self._min_forced_refresh_interval_s
+                ):
+                    return False
+
+                self._last_forced_refresh_at = now
+            elif not self.metadata_is_stale:
+                return False
 
-        self.metadata_loaded = True
+            self._refresh_thread = Thread(target=self._refresh_metadata, daemon=True)
+            self._refresh_thread.start()
 
-    @classmethod
-    def _get_districts(cls) -> list[District]:
+        return True
+
+    def wait_for_metadata_refresh(self, timeout_s: Optional[float] = None) -> None:
+        if refresh_thread := self._refresh_thread:
+            refresh_thread.join(timeout_s)
+
+    def _refresh_metadata(self) -> None:
+        try:
+            self.load_metadata()
+        except Exception as e:
+            print(f"Failed refreshing metadata, keeping current snapshot: {e!r}")
+
+    def _get_districts(self, timings: dict[str, float]) -> list[District]:
+        start = perf_counter()
         response = HTTP_POOL.request(
             method="GET",
-            url="https://www.oref.org.il//Shared/Ajax/GetDistricts.aspx?lang=en",
+            url=f"{self._base_url}//Shared/Ajax/GetDistricts.aspx?lang=en",
             headers={
                 "Accept": "*/*",
                 "Accept-Encoding": "gzip, deflate, br",
@@ -49,13 +206,32 @@ class AlertChecker:
         if response.status != 200:
             raise ValueError(f"Got status of {response.status}")
 
-        return [parse_district(district) for district in cls._parse_body(response)]
+        timings["districts_fetch_ms"] = (perf_counter() - start) * 1000
+
+        start = perf_counter()
+        districts: list[District] = []
+
+        # Districts are parsed while the payload is decoded, without a pass over dicts
+        def collect_district(raw: dict[str, Any]) -> Any:
+            if "label_he" not in raw:
+                return raw
 
-    @classmethod
-    def _get_alert_categories(cls) -> list[AlertCategory]:
+            district = parse_district(raw)
+            districts.append(district)
+            return district
+
+        json.loads(response.data.decode("utf-8-sig"), object_hook=collect_district)
+        timings["districts_parse_ms"] = (perf_counter() - start) * 1000
+
+        return districts
+
+    def _get_alert_categories(
+        self, timings: dict[str, float]
+    ) -> dict[str, AlertCategory]:
+        start = perf_counter()
         response = HTTP_POOL.request(
             method="GET",
-            url="https://www.oref.org.il/Leftovers/en.Leftovers.json",
+            url=f"{self._base_url}/Leftovers/en.Leftovers.json",
             headers={
                 "Accept": "application/json, text/javascript, */*; q=0.01",
                 "Accept-Encoding": "gzip, deflate, br",
@@ -72,9 +248,16 @@ class AlertChecker:
         if response.status != 200:
             raise ValueError(f"Got status of {response.status}")
 
-        body = cls._parse_body(response)
+        timings["alert_categories_fetch_ms"] = (perf_counter() - start) * 1000
 
-        return [parse_alert_category(alert_category) for alert_category in body]
+        start = perf_counter()
+        alert_categories_by_id = {}
+        for raw in self._parse_body(response):
+            alert_category = parse_alert_category(raw)
+            alert_categories_by_id[str(alert_category.category_id)] = alert_category
+        timings["alert_categories_parse_ms"] = (perf_counter() - start) * 1000
+
+        return alert_categories_by_id
 
     @staticmethod
     def _parse_body(response: Any) -> Any:
@@ -84,47 +267,258 @@ class AlertChecker:
         except json.JSONDecodeError:
             return None
 
-    def scan(self) -> Optional[Alert]:
+    def scan(self, timeout_s: Optional[float] = None) -> ScanResult:
         if not self.metadata_loaded:
             raise RuntimeError("Must load metadata before checking alerts")
 
-        response = HTTP_POOL.request(
-            method="GET",
-            url="https://www.oref.org.il/WarningMessages/alert/alerts.json",
-            headers={
-                "Accept": "*/*",
-                "Accept-Encoding": "gzip, deflate, br",
-                "Accept-Language": "en-US,en;q=0.9",
-                "Cache-Control": "no-cache",
-                "Host": "www.oref.org.il",
-                "Content-Type": "application/json",
-                "X-Requested-With": "XMLHttpRequest",
-                "Referer": "https://www.oref.org.il/en",
-                "User-Agent": (
-                    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 "
-                    "(KHTML, like Gecko) Chrome/117.0.0.0 Safari/537.36"
-                ),
-            },
-        )
+        self.refresh_metadata_in_background()
+        timeout_s = DEFAULT_SCAN_TIMEOUT_S if timeout_s is None else timeout_s
+        timings: dict[str, float] = {}
+        self.scan_timings = timings
+
+        headers = {
+            "Accept": "*/*",
+            "Accept-Encoding": "gzip, deflate, br",
+            "Accept-Language": "en-US,en;q=0.9",
+            "Cache-Control": "no-cache",
+            "Host": "www.oref.org.il",
+            "Content-Type": "application/json",
+            "X-Requested-With": "XMLHttpRequest",
+            "Referer": "https://www.oref.org.il/en",
+            "User-Agent": (
+                "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 "
+                "(KHTML, like Gecko) Chrome/117.0.0.0 Safari/537.36"
+            ),
+        }
+        if self._etag:
+            headers["If-None-Match"] = self._etag
+        if self._last_modified:
+            headers["If-Modified-Since"] = self._last_modified
+
+        start = perf_counter()
+        response = self._fetch_alerts(headers, timeout_s)
+        timings["fetch_ms"] = (perf_counter() - start) * 1000
+        received_at_s = time()
+
+        if response.status == 304:
+            return self._unchanged_result()
 
         if response.status != 200:
             raise ValueError(f"Got status of {response.status}")
 
-        if body := self._parse_body(response):
-            return parse_alert(body)
+        start = perf_counter()
+        body_digest = hashlib.blake2b(response.data, digest_size=16).digest()
+        if body_digest == self._last_body_digest:
+            return self._unchanged_result()
+
+        body = self._parse_body(response)
+        alert = parse_alert(body) if body else None
+        timings["parse_ms"] = (perf_counter() - start) * 1000
+
+        # Only remembered once the payload parsed, so a payload that fails to parse keeps
+        # failing loudly instead of being skipped as unchanged
+        self._etag = response.headers.get("ETag")
+        self._last_modified = response.headers.get("Last-Modified")
+        self._last_body_digest = body_digest
+
+        if not alert:
+            self._last_alert = None
+            self._seen_locations = {}
+            return ScanResult(status=ScanStatus.NO_ALERT)
+
+        is_new_alert = (
+            not self._last_alert or alert.alert_id != self._last_alert.alert_id
+        )
+        if is_new_alert:
+            self._seen_locations = {}
+        if not self._first_seen or self._first_seen[0] != alert.alert_id:
+            self._first_seen = (alert.alert_id, received_at_s)
+        self._last_alert = alert
+
+        new_locations = [
+            location
+            for location in dict.fromkeys(alert.locations)
+            if location not in self._seen_locations
+        ]
+        if is_new_alert:
+            status = ScanStatus.NEW_ALERT
+        elif new_locations:
+            status = ScanStatus.NEW_LOCATIONS
+        else:
+            return self._unchanged_result()
+
+        self._mark_handed_out(new_locations)
+        return ScanResult(status=status, alert=alert, new_locations=new_locations)
+
+    def _fetch_alerts(self, headers: dict[str, str], timeout_s: float) -> Any:
+        deadline = monotonic() + timeout_s
+        self.scan_hedged = False
+
+        def request(request_timeout_s: float) -> Any:
+            start = perf_counter()
+            response = HTTP_POOL.request(
+                method="GET",
+                url=f"{self._base_url}/WarningMessages/alert/alerts.json",
+                headers=headers,
+                timeout=urllib3.Timeout(
+                    connect=min(1.0, request_timeout_s), total=request_timeout_s
+                ),
+                retries=False,
+            )
+            self._request_latencies.add(perf_counter() - start)
+            return response
+
+        first = self._fetch_executor.submit(request, timeout_s)
+        futures = [first]
+        hedge_after_s = self._get_hedge_after_s(timeout_s)
+        if hedge_after_s is not None and not wait(futures, timeout=hedge_after_s).done:
+            futures.append(self._fetch_executor.submit(request, deadline - monotonic()))
+            self.scan_hedged = True
+            self._hedged_requests += 1
+        self._requests += len(futures)
+
+        # The first response wins, a failure is only raised once every request failed
+        errors = []
+        for future in as_completed(futures, timeout=max(deadline - monotonic(), 0)):
+            try:
+                response = future.result()
+            except Exception as e:
+                errors.append(e)
+                continue
+
+            if future is not first:
+                self._hedge_wins += 1
+            return response
+
+        raise errors[-1]
+
+    def _get_hedge_after_s(self, timeout_s: float) -> Optional[float]:
+        if not self._hedge:
+            return None
+
+        hedge_after_s = self._default_hedge_after_s
+        if len(self._request_latencies) >= MIN_HEDGE_SAMPLES:
+            percentile_s = self._request_latencies.percentile(HEDGE_PERCENTILE)
+            if percentile_s is not None:
+                # Not on jitter alone when every request is fast
+                hedge_after_s = max(percentile_s, MIN_HEDGE_AFTER_S)
+
+        # A hedge sent with less than half the budget left rarely answers in time
+        return hedge_after_s if hedge_after_s < timeout_s / 2 else None
+
+    def _unchanged_result(self) -> ScanResult:
+        # Locations of a still-active alert are handed out again once their re-alert
+        # window passed, the table's re_alert_at_s condition stays the authority
+        if not self._last_alert:
+            return ScanResult(status=ScanStatus.UNCHANGED)
+
+        # Locations that couldn't be resolved yet are handed out again as new, until a
+        # metadata refresh knows them
+        unresolved_locations = [
+            location
+            for location in dict.fromkeys(self._last_alert.locations)
+            if location not in self._seen_locations
+        ]
+        if unresolved_locations:
+            self._mark_handed_out(unresolved_locations)
+            return ScanResult(
+                status=ScanStatus.NEW_LOCATIONS,
+                alert=self._last_alert,
+                new_locations=unresolved_locations,
+            )
+
+        now = monotonic()
+        due_locations = [
+            location
+            for location in dict.fromkeys(self._last_alert.locations)
+            if now - self._seen_locations[location] >= self._re_alert_after_s
+        ]
+        if not due_locations:
+            return ScanResult(status=ScanStatus.UNCHANGED, alert=self._last_alert)
+
+        self._mark_handed_out(due_locations)
+        return ScanResult(
+            status=ScanStatus.RE_ALERT,
+            alert=self._last_alert,
+            new_locations=due_locations,
+        )
+
+    def _mark_handed_out(self, locations: list[str]) -> None:
+        # Not due again until mark_written, a failed write forgets the scan instead
+        for location in locations:
+            self._seen_locations[location] = math.inf
+
+    def mark_written(
+        self,
+        alert_id: str,
+        district_ids: Iterable[str],
+        written_at: Optional[float] = None,
+    ) -> None:
+        # Starts the re-alert window of the handed out locations whose districts were
+        # written (or suppressed by a row still in its window) at the time of the write,
+        # which the table counts the row's re_alert_at_s from as well. Counted from the
+        # hand-out instead, any delay before the write made the RE_ALERT arrive before
+        # re_alert_at_s, have its write suppressed and slip a whole window.
+        metadata = self._metadata
+        if (
+            not metadata
+            or not self._last_alert
+            or self._last_alert.alert_id != alert_id
+        ):
+            return
+
+        district_ids = set(district_ids)
+        written_at = monotonic() if written_at is None else written_at
+        for location, started_at in self._seen_locations.items():
+            if (
+                started_at == math.inf
+                and (district := metadata.location_index.get_district(location))
+                and district.district_id in district_ids
+            ):
+                self._seen_locations[location] = written_at
+
+    def forget_last_scan(self) -> None:
+        # Makes the next scan treat the current payload as new, e.g. when handling it failed
+        self._etag = None
+        self._last_modified = None
+        self._last_body_digest = None
+        self._last_alert = None
+        self._seen_locations = {}
+
+    def get_first_seen_at_s(self, alert: Alert) -> Optional[float]:
+        if self._first_seen and self._first_seen[0] == alert.alert_id:
+            return self._first_seen[1]
 
         return None
 
-    def get_districts(self, alert: Alert) -> list[District]:
-        if not self.metadata_loaded:
+    def get_districts(
+        self, alert: Alert, locations: Optional[list[str]] = None
+    ) -> list[District]:
+        if not (metadata := self._metadata):
             raise RuntimeError("Must load metadata before getting districts")
 
-        return [
-            self._districts_by_hebrew_name[location] for location in alert.locations
-        ]
+        resolved = metadata.location_index.resolve(
+            alert.locations if locations is None else locations
+        )
+
+        # Known locations are handled right away, unknown ones are retried by the next
+        # scans once the forced refresh has swapped in metadata that knows them
+        if resolved.unknown_locations:
+            print(
+                f"Unknown locations, refreshing metadata: {resolved.unknown_locations}"
+            )
+            for location in resolved.unknown_locations:
+                self._seen_locations.pop(location, None)
+            self.refresh_metadata_in_background(force=True)
+
+        return resolved.districts
 
     def get_alert_category(self, alert: Alert) -> AlertCategory:
-        if not self.metadata_loaded:
+        if not (metadata := self._metadata):
             raise RuntimeError("Must load metadata before getting alert category")
 
-        return self._alert_categories_by_id[alert.alert_category_id]
+        try:
+            return metadata.alert_categories_by_id[alert.alert_category_id]
+        except KeyError:
+            self.refresh_metadata_in_background(force=True)
+            raise
@@ -0,0 +1,61 @@
+from dataclasses import dataclass
+from enum import Enum
+from typing import Any, Optional
+
+
+class StatusView(Enum):
+    # Only what get_status_api returns by default
+    SUMMARY = "summary"
+    # The whole item
+    FULL = "full"
+
+
+# Attribute paths a summary reads, everything else (like the alert) is never transferred
+SUMMARY_ATTRIBUTE_PATHS = [
+    ["created_at_s"],
+    ["alert_category", "label"],
+    ["alert_category", "description"],
+    ["district", "area_name"],
+    ["district", "area_id"],
+    ["district", "district_id"],
+    ["district", "migun_time_s"],
+]
+
+
+@dataclass
+class AlertStatus:
+    category: str
+    area: str
+    area_id: str
+    district_id: str
+    migun_time_s: int
+    created_at_s: int
+    description: str
+    # Only read with StatusView.FULL
+    item: Optional[dict[str, Any]] = None
+
+
+def get_projection(view: StatusView) -> dict[str, Any]:
+    if view == StatusView.FULL:
+        return {}
+
+    names = {f"#{name}" for path in SUMMARY_ATTRIBUTE_PATHS for name in path}
+    return {
+        "ProjectionExpression": ", ".join(
+            ".".join(f"#{name}" for name in path) for path in SUMMARY_ATTRIBUTE_PATHS
+        ),
+        "ExpressionAttributeNames": {name: name[1:] for name in sorted(names)},
+    }
+
+
+def parse_alert_status(item: dict[str, Any], view: StatusView) -> AlertStatus:
+    return AlertStatus(
+        category=item["alert_category"]["label"],
+        area=item["district"]["area_name"],
+        area_id=item["district"]["area_id"],
+        district_id=item["district"]["district_id"],
+        migun_time_s=int(item["district"]["migun_time_s"]),
+        created_at_s=int(item["created_at_s"]),
+        description=item["alert_category"]["description"],
+        item=item if view == StatusView.FULL else None,
+    )
@@ -1,134 +1,554 @@
-from dataclasses import asdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import asdict, dataclass, field
+from threading import Lock
 from time import time
-from typing import Any, Generator, Optional
+from typing import Any, Callable, Iterable, Iterator, Optional
+import zlib
 
-from boto3.dynamodb.conditions import Attr, Key
+from boto3.dynamodb.conditions import Attr, ConditionBase, ConditionExpressionBuilder, Key
+from botocore.config import Config
 import boto3
 
 from alexa_red_alert.alert import Alert
 from alexa_red_alert.alert_category import AlertCategory
+from alexa_red_alert.alert_status import AlertStatus, StatusView, get_projection, parse_alert_status
 from alexa_red_alert.district import District
+from alexa_red_alert.re_alert_cache import ReAlertCache
 
-DYNAMODB_CLIENT = boto3.client("dynamodb", region_name="il-central-1")
+# Sparse index holding only alert rows, keyed by when they expire, so live alerts are a
+# bounded query per shard no matter how many expired rows TTL hasn't deleted yet. Rows are
+# spread over the shards by district, so a burst of district writes isn't capped by what
+# a single index partition takes.
+ACTIVE_INDEX_NAME = "active-expires_at_s"
+ACTIVE_SHARDS = 8
+# Projected besides the keys, what the status views read of a row
+ACTIVE_INDEX_ATTRIBUTES = [
+    "created_at_s",
+    "alert_id",
+    "alert",
+    "district",
+    "alert_category",
+]
+# Written before the index was sharded, moved to a shard by backfill_active_index
+UNSHARDED_ACTIVE_PARTITION = "ACTIVE"
+# The most keys a single BatchGetItem call takes
+BATCH_GET_SIZE = 100
+
+
+def build_expressions(**conditions: ConditionBase) -> dict[str, Any]:
+    # The table resource builds condition objects with one placeholder counter, shared by
+    # every thread using its client and reset on each call, so expressions sent from the
+    # worker threads are built here instead
+    builder = ConditionExpressionBuilder()
+    names: dict[str, str] = {}
+    values: dict[str, Any] = {}
+    expressions = {}
+
+    for parameter_name, condition in conditions.items():
+        built = builder.build_expression(
+            condition, is_key_condition=parameter_name == "KeyConditionExpression"
+        )
+        expressions[parameter_name] = built.condition_expression
+        names.update(built.attribute_name_placeholders)
+        values.update(built.attribute_value_placeholders)
+
+    return {
+        **expressions,
+        "ExpressionAttributeNames": names,
+        "ExpressionAttributeValues": values,
+    }
+
+
+def get_active_partition(district_id: str) -> str:
+    # crc32 rather than hash(), which differs between processes
+    return f"ACTIVE#{zlib.crc32(district_id.encode()) % ACTIVE_SHARDS}"
+
+
+def alert_key(alert_id: str) -> dict[str, str]:
+    # Alert-level data (like its locations) is stored once per alert instead of in every
+    # district row, which only keeps the alert_id
+    return {"pk": f"ALERT#{alert_id}", "sk": "ALERT"}
+
+
+@dataclass
+class UpsertResult:
+    written_district_ids: list[str] = field(default_factory=list)
+    suppressed_district_ids: list[str] = field(default_factory=list)
 
 
 class DataTable:
-    def __init__(self, table: Any, re_alert_at_s: int = 120):
-        self._table = table
+    def __init__(
+        self,
+        table: Optional[Any] = None,
+        re_alert_at_s: int = 120,
+        max_workers: int = 10,
+        re_alert_cache: Optional[ReAlertCache] = None,
+        table_factory: Optional[Callable[[], Any]] = None,
+    ):
+        # Either the table, or what creates it on first use, so handlers don't pay for
+        # creating AWS clients while importing
+        self._table_instance = table
+        self._table_factory = table_factory
+        self._table_lock = Lock()
         self._re_alert_at_s = re_alert_at_s
+        self._re_alert_cache = re_alert_cache
+        self._max_workers = max_workers
+
+    @property
+    def _table(self) -> Any:
+        if self._table_instance is None:
+            with self._table_lock:
+                if self._table_instance is None and self._table_factory is not None:
+                    self._table_instance = self._table_factory()
+
+        return self._table_instance
 
     @staticmethod
     def create_from_table_name(
         table_name: str = "alexa-red-alert-data-table",
         dynamodb_resource: Optional[Any] = None,
         re_alert_at_s: int = 120,
+        use_re_alert_cache: bool = True,
+        max_workers: int = 10,
     ) -> "DataTable":
-        dynamodb = dynamodb_resource or boto3.resource(
-            "dynamodb", region_name="il-central-1"
-        )
-        table = dynamodb.Table(table_name)
+        def create_table() -> Any:
+            # Throttled writes are retried by botocore, with jitter, inside the connection
+            # pool the write workers share
+            dynamodb = dynamodb_resource or boto3.resource(
+                "dynamodb",
+                region_name="il-central-1",
+                config=Config(
+                    max_pool_connections=max_workers,
+                    retries={"mode": "adaptive", "max_attempts": 4},
+                ),
+            )
+            return dynamodb.Table(table_name)
 
-        return DataTable(table, re_alert_at_s)
+        return DataTable(
+            re_alert_at_s=re_alert_at_s,
+            max_workers=max_workers,
+            re_alert_cache=ReAlertCache() if use_re_alert_cache else None,
+            table_factory=create_table,
+        )
 
     def upsert_alert(
-        self, alert: Alert, districts: list[District], alert_category: AlertCategory
-    ) -> None:
-        now_s = int(time())
+        self,
+        alert: Alert,
+        districts: list[District],
+        alert_category: AlertCategory,
+        detected_at_s: Optional[float] = None,
+    ) -> UpsertResult:
+        now_ms = int(time() * 1000)
+        now_s = now_ms // 1000
         ttl_s = now_s + (alert_category.duration_minutes * 60)
         re_alert_at_s = now_s + self._re_alert_at_s
+        alert_category_values = asdict(alert_category)
+        condition_expressions = build_expressions(
+            ConditionExpression=(
+                Attr("pk").not_exists() | Attr("re_alert_at_s").lte(now_s)
+            )
+        )
+
+        def upsert_district(district: District) -> bool:
+            if self._re_alert_cache is not None and self._re_alert_cache.is_suppressed(
+                district.district_id, alert_category.code_name, now_s
+            ):
+                return False
 
-        for district in districts:
             update_values = {
                 "expires_at_s": ttl_s,
                 "re_alert_at_s": re_alert_at_s,
                 "created_at_s": now_s,
-                "alert": asdict(alert),
+                "alert_id": alert.alert_id,
                 "district": asdict(district),
-                "alert_category": asdict(alert_category),
+                "alert_category": alert_category_values,
                 "pk1": f"DISTRICT#{district.district_id}",
                 "sk1": f"CATEGORY#{alert_category.code_name}",
+                "active": get_active_partition(district.district_id),
+                # For the notifier's end-to-end latency
+                "written_at_ms": now_ms,
             }
-            try:
-                self._table.update_item(
-                    Key={
-                        "pk": f"AREA#{district.area_id}",
-                        "sk": "#".join(
-                            [
-                                "DISTRICT",
-                                district.district_id,
-                                "CATEGORY",
-                                alert_category.code_name,
-                            ]
-                        ),
-                    },
-                    UpdateExpression=(
-                        f"SET {', '.join(f'#{field} = :{field}' for field in update_values)}"
-                    ),
-                    ExpressionAttributeNames={
-                        f"#{field}": f"{field}" for field in update_values
-                    },
-                    ExpressionAttributeValues={
-                        f":{key}": value for key, value in update_values.items()
-                    },
-                    ConditionExpression=(
-                        Attr("pk").not_exists() | Attr("re_alert_at_s").lte(now_s)
+            if detected_at_s is not None:
+                update_values["detected_at_ms"] = int(detected_at_s * 1000)
+
+            was_written, existing_re_alert_at_s = self._update_item(
+                Key={
+                    "pk": f"AREA#{district.area_id}",
+                    "sk": "#".join(
+                        [
+                            "DISTRICT",
+                            district.district_id,
+                            "CATEGORY",
+                            alert_category.code_name,
+                        ]
                     ),
+                },
+                UpdateExpression=(
+                    f"SET {', '.join(f'#{key} = :{key}' for key in update_values)}"
+                ),
+                ExpressionAttributeNames={
+                    **condition_expressions["ExpressionAttributeNames"],
+                    **{f"#{key}": key for key in update_values},
+                },
+                ExpressionAttributeValues={
+                    **condition_expressions["ExpressionAttributeValues"],
+                    **{f":{key}": value for key, value in update_values.items()},
+                },
+                ConditionExpression=condition_expressions["ConditionExpression"],
+            )
+
+            if self._re_alert_cache is not None:
+                cached_re_alert_at_s = (
+                    re_alert_at_s if was_written else existing_re_alert_at_s
                 )
-            except DYNAMODB_CLIENT.exceptions.ConditionalCheckFailedException:
-                pass
+                if cached_re_alert_at_s is not None:
+                    self._re_alert_cache.set(
+                        district.district_id,
+                        alert_category.code_name,
+                        cached_re_alert_at_s,
+                        now_s,
+                    )
+
+            return was_written
 
-    def get_status_by_area(self, area_id: str) -> Generator[None, None, dict[str, Any]]:
+        result = UpsertResult()
+        if not districts:
+            return result
+
+        # Written before the district rows, so readers resolving a row's alert find it
+        self._table.meta.client.put_item(
+            TableName=self._table.name,
+            Item={
+                **alert_key(alert.alert_id),
+                "alert": asdict(alert),
+                "expires_at_s": ttl_s,
+            },
+        )
+
+        # Every district gets its write attempt before the first failure is raised
+        with ThreadPoolExecutor(
+            max_workers=min(self._max_workers, len(districts))
+        ) as executor:
+            futures = [
+                executor.submit(upsert_district, district) for district in districts
+            ]
+        written = [future.result() for future in futures]
+
+        for district, was_written in zip(districts, written):
+            if was_written:
+                result.written_district_ids.append(district.district_id)
+            else:
+                result.suppressed_district_ids.append(district.district_id)
+
+        return result
+
+    def _update_item(self, **update_kwargs: Any) -> tuple[bool, Optional[int]]:
+        # Goes through the resource's low-level client, which unlike the Table resource is
+        # safe to share between the write workers (and still takes plain Python values).
+        # Returns whether the item was written, and if its condition suppressed the write,
+        # the re_alert_at_s of the existing item.
+        client = self._table.meta.client
+        try:
+            client.update_item(
+                TableName=self._table.name,
+                ReturnValuesOnConditionCheckFailure="ALL_OLD",
+                **update_kwargs,
+            )
+            return True, None
+        except client.exceptions.ConditionalCheckFailedException as e:
+            existing_item = e.response.get("Item") or {}
+            existing_re_alert_at_s = existing_item.get("re_alert_at_s", {}).get("N")
+            return (
+                False,
+                int(existing_re_alert_at_s) if existing_re_alert_at_s else None,
+            )
+
+    @staticmethod
+    def _active_queries() -> list[dict[str, Any]]:
         now_s = int(time())
-        query_kwargs = {
-            "ConsistentRead": True,
-            "KeyConditionExpression": Key("pk").eq(f"AREA#{area_id}"),
-            "FilterExpression": Attr("expires_at_s").gte(now_s),
+        return [
+            {
+                "IndexName": ACTIVE_INDEX_NAME,
+                **build_expressions(
+                    KeyConditionExpression=(
+                        Key("active").eq(f"ACTIVE#{shard}")
+                        & Key("expires_at_s").gte(now_s)
+                    )
+                ),
+            }
+            for shard in range(ACTIVE_SHARDS)
+        ]
+
+    @staticmethod
+    def _with_view(query: dict[str, Any], view: StatusView) -> dict[str, Any]:
+        projection = get_projection(view)
+        if not projection:
+            return query
+
+        return {
+            **query,
+            "ProjectionExpression": projection["ProjectionExpression"],
+            "ExpressionAttributeNames": {
+                **query["ExpressionAttributeNames"],
+                **projection["ExpressionAttributeNames"],
+            },
         }
 
+    @staticmethod
+    def _area_ids_queries(area_ids: Iterable[str]) -> list[dict[str, Any]]:
+        now_s = int(time())
+        return [
+            {
+                "ConsistentRead": True,
+                **build_expressions(
+                    KeyConditionExpression=Key("pk").eq(f"AREA#{area_id}"),
+                    FilterExpression=Attr("expires_at_s").gte(now_s),
+                ),
+            }
+            # Repeated ids are queried once, the rest keep the order they came in
+            for area_id in dict.fromkeys(area_ids)
+        ]
+
+    @staticmethod
+    def _district_ids_queries(district_ids: Iterable[str]) -> list[dict[str, Any]]:
+        now_s = int(time())
+        return [
+            {
+                "IndexName": "pk1-sk1",
+                **build_expressions(
+                    KeyConditionExpression=Key("pk1").eq(f"DISTRICT#{district_id}"),
+                    FilterExpression=Attr("expires_at_s").gte(now_s),
+                ),
+            }
+            for district_id in dict.fromkeys(district_ids)
+        ]
+
+    def get_status_by_area(
+        self, area_id: str, view: StatusView = StatusView.FULL
+    ) -> Iterator[AlertStatus]:
+        yield from self.get_status_by_area_ids([area_id], view)
+
+    def get_status_by_area_ids(
+        self, area_ids: Iterable[str], view: StatusView = StatusView.FULL
+    ) -> Iterator[AlertStatus]:
+        queries = [
+            self._with_view(query, view) for query in self._area_ids_queries(area_ids)
+        ]
+        for item in self._query_concurrently(queries):
+            yield parse_alert_status(item, view)
+
+    def get_status_by_district_ids(
+        self, district_ids: Iterable[str], view: StatusView = StatusView.FULL
+    ) -> Iterator[AlertStatus]:
+        queries = [
+            self._with_view(query, view)
+            for query in self._district_ids_queries(district_ids)
+        ]
+        for item in self._query_concurrently(queries):
+            yield parse_alert_status(item, view)
+
+    def has_status_by_area_ids(self, area_ids: Iterable[str]) -> bool:
+        return self._exists_concurrently(self._area_ids_queries(area_ids))
+
+    def has_status_by_district_ids(self, district_ids: Iterable[str]) -> bool:
+        return self._exists_concurrently(self._district_ids_queries(district_ids))
+
+    def has_status_all(self) -> bool:
+        return self._exists_concurrently(self._active_queries())
+
+    def _query(self, **query_kwargs: Any) -> list[dict[str, Any]]:
+        # Like _update_item, goes through the low-level client so the query workers can
+        # share it
+        client = self._table.meta.client
+        items = []
+
+        while True:
+            result = client.query(TableName=self._table.name, **query_kwargs)
+            items.extend(result["Items"])
+
+            if last_evaluated_key := result.get("LastEvaluatedKey"):
+                query_kwargs["ExclusiveStartKey"] = last_evaluated_key
+            else:
+                return items
+
+    def _query_concurrently(
+        self, queries: list[dict[str, Any]]
+    ) -> Iterator[dict[str, Any]]:
+        # Items are yielded in the order of the queries, each query's as soon as it and
+        # the ones before it are done
+        if not queries:
+            return
+
+        with ThreadPoolExecutor(
+            max_workers=min(self._max_workers, len(queries))
+        ) as executor:
+            futures = [executor.submit(self._query, **query) for query in queries]
+
+            for future in futures:
+                yield from future.result()
+
+    def _exists(self, **query_kwargs: Any) -> bool:
+        # Counted a page at a time without a Limit, which the filter would only apply to
+        # after it, so the expired rows of a partition are read in one round trip rather
+        # than one each. Stops at the first page with a live row.
+        client = self._table.meta.client
+
         while True:
-            result = self._table.query(**query_kwargs)
+            result = client.query(
+                TableName=self._table.name, Select="COUNT", **query_kwargs
+            )
 
-            yield from result["Items"]
+            if result["Count"]:
+                return True
 
             if last_evaluated_key := result.get("LastEvaluatedKey"):
                 query_kwargs["ExclusiveStartKey"] = last_evaluated_key
             else:
-                break
+                return False
 
-    def get_status_by_district_ids(
-        self, district_ids: list[str]
-    ) -> Generator[None, None, dict[str, Any]]:
+    def _exists_concurrently(self, queries: list[dict[str, Any]]) -> bool:
+        if not queries:
+            return False
+
+        executor = ThreadPoolExecutor(max_workers=min(self._max_workers, len(queries)))
+        try:
+            futures = [executor.submit(self._exists, **query) for query in queries]
+            return any(future.result() for future in as_completed(futures))
+        finally:
+            # Once one query found an item the rest are not waited for
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def get_status_all(
+        self, view: StatusView = StatusView.FULL
+    ) -> Iterator[AlertStatus]:
+        queries = [self._with_view(query, view) for query in self._active_queries()]
+        for item in self._query_concurrently(queries):
+            yield parse_alert_status(item, view)
+
+    def backfill_active_index(self) -> int:
+        # Migration for rows written before the active index existed or was sharded. Only
+        # rows that are still live need it, expired ones are left for TTL to delete.
         now_s = int(time())
-        for district_id in district_ids:
-            query_kwargs = {
-                "IndexName": "pk1-sk1",
-                "KeyConditionExpression": Key("pk1").eq(f"DISTRICT#{district_id}"),
-                "FilterExpression": Attr("expires_at_s").gte(now_s),
-            }
+        unindexed = Attr("active").not_exists() | Attr("active").eq(
+            UNSHARDED_ACTIVE_PARTITION
+        )
+        scan_kwargs = {
+            "ConsistentRead": True,
+            "FilterExpression": (
+                Attr("expires_at_s").gte(now_s)
+                & unindexed
+                & Attr("pk").begins_with("AREA#")
+            ),
+            "ProjectionExpression": "pk, sk",
+        }
+        backfilled = 0
 
-            while True:
-                result = self._table.query(**query_kwargs)
+        while True:
+            result = self._table.scan(**scan_kwargs)
 
-                yield from result["Items"]
+            for key in result["Items"]:
+                # DISTRICT#<district_id>#CATEGORY#<code_name>
+                district_id = key["sk"].split("#")[1]
+                try:
+                    self._table.update_item(
+                        Key=key,
+                        UpdateExpression="SET #active = :active",
+                        ExpressionAttributeNames={"#active": "active"},
+                        ExpressionAttributeValues={
+                            ":active": get_active_partition(district_id)
+                        },
+                        ConditionExpression=Attr("pk").exists() & unindexed,
+                    )
+                    backfilled += 1
+                except (
+                    self._table.meta.client.exceptions.ConditionalCheckFailedException
+                ):
+                    pass
 
-                if last_evaluated_key := result.get("LastEvaluatedKey"):
-                    query_kwargs["ExclusiveStartKey"] = last_evaluated_key
-                else:
-                    break
+            if last_evaluated_key := result.get("LastEvaluatedKey"):
+                scan_kwargs["ExclusiveStartKey"] = last_evaluated_key
+            else:
+                break
 
-    def get_status_all(self) -> Generator[None, None, dict[str, Any]]:
-        now_s = int(time())
+        return backfilled
+
+    def resolve_alerts(self, items: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        # Adds the alert to district rows that only hold its alert_id. Rows written before
+        # alerts were stored separately already have theirs.
+        alert_ids = list(
+            dict.fromkeys(item["alert_id"] for item in items if "alert" not in item)
+        )
+        alerts_by_id = {}
+        client = self._table.meta.client
+
+        for i in range(0, len(alert_ids), BATCH_GET_SIZE):
+            request_items = {
+                self._table.name: {
+                    "Keys": [
+                        alert_key(alert_id)
+                        for alert_id in alert_ids[i : i + BATCH_GET_SIZE]
+                    ],
+                    "ProjectionExpression": "alert",
+                }
+            }
+
+            while request_items:
+                result = client.batch_get_item(RequestItems=request_items)
+                for alert_item in result["Responses"].get(self._table.name, []):
+                    alerts_by_id[alert_item["alert"]["alert_id"]] = alert_item["alert"]
+                request_items = result.get("UnprocessedKeys")
+
+        return [
+            item
+            if "alert" in item
+            else {**item, "alert": alerts_by_id.get(item["alert_id"])}
+            for item in items
+        ]
+
+    def normalize_alert_items(self) -> int:
+        # Migration for district rows that still hold a full copy of their alert. The
+        # alert is stored once under its own key, and the row keeps only its alert_id.
         scan_kwargs = {
             "ConsistentRead": True,
-            "FilterExpression": Attr("expires_at_s").gte(now_s),
+            "FilterExpression": Attr("pk").begins_with("AREA#")
+            & Attr("alert").exists(),
+            "ProjectionExpression": "pk, sk, alert, expires_at_s",
         }
+        written_alert_ids = set()
+        normalized = 0
 
         while True:
             result = self._table.scan(**scan_kwargs)
 
-            yield from result["Items"]
+            for item in result["Items"]:
+                alert_id = item["alert"]["alert_id"]
+                if alert_id not in written_alert_ids:
+                    self._table.put_item(
+                        Item={
+                            **alert_key(alert_id),
+                            "alert": item["alert"],
+                            "expires_at_s": item["expires_at_s"],
+                        }
+                    )
+                    written_alert_ids.add(alert_id)
+
+                # created_at_s is left as is, so the notifier ignores the change
+                try:
+                    self._table.update_item(
+                        Key={"pk": item["pk"], "sk": item["sk"]},
+                        UpdateExpression="SET alert_id = :alert_id REMOVE alert",
+                        ExpressionAttributeValues={":alert_id": alert_id},
+                        ConditionExpression=Attr("alert").exists(),
+                    )
+                    normalized += 1
+                except (
+                    self._table.meta.client.exceptions.ConditionalCheckFailedException
+                ):
+                    pass
 
             if last_evaluated_key := result.get("LastEvaluatedKey"):
                 scan_kwargs["ExclusiveStartKey"] = last_evaluated_key
             else:
                 break
+
+        return normalized
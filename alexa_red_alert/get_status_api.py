@@ -1,56 +1,155 @@
-from typing import Any
-import decimal
-import json
+from dataclasses import dataclass
+from hashlib import blake2b
+from typing import Any, Optional
+import base64
+import gzip
 import os
 
+from alexa_red_alert.alert_status import StatusView
 from alexa_red_alert.data_table import DataTable
+from alexa_red_alert.metrics import Metrics, log_verbose
+from alexa_red_alert.response_cache import ResponseCache
+from alexa_red_alert.serialization import dumps
 
 DATA_TABLE = DataTable.create_from_table_name(os.environ["DATA_TABLE_NAME"])
+# Devices polling during an alert mostly ask the same few questions within the same
+# second, so reads scale with the number of distinct queries instead of devices
+RESPONSE_CACHE: ResponseCache["StatusBody"] = ResponseCache(
+    ttl_s=int(os.getenv("STATUS_CACHE_TTL_MS", "500")) / 1000
+)
+# Smaller bodies (like "no alerts") aren't worth the gzip header and CPU
+GZIP_MIN_BYTES = int(os.getenv("STATUS_GZIP_MIN_BYTES", "1024"))
 
 
-class DecimalEncoder(json.JSONEncoder):
-    def default(self, o):
-        if isinstance(o, decimal.Decimal):
-            return str(o)
+@dataclass(frozen=True)
+class StatusBody:
+    body: str
+    etag: str
+    gzipped: Optional[bytes] = None
 
-        return super().default(o)
 
+def create_status_body(body: str) -> StatusBody:
+    # Encoded once per cached answer, not once per request
+    encoded = body.encode()
+    return StatusBody(
+        body=body,
+        etag=f'"{blake2b(encoded, digest_size=16).hexdigest()}"',
+        gzipped=gzip.compress(encoded) if len(encoded) >= GZIP_MIN_BYTES else None,
+    )
+
+
+def get_exists_body(area_ids: list[str], district_ids: list[str]) -> str:
+    if area_ids:
+        exists = DATA_TABLE.has_status_by_area_ids(area_ids)
+    elif district_ids:
+        exists = DATA_TABLE.has_status_by_district_ids(district_ids)
+    else:
+        exists = DATA_TABLE.has_status_all()
+
+    return dumps({"exists": exists})
 
-def lambda_handler(event: dict[str, Any], _: Any) -> dict[str, Any]:
-    print(event)
-    multi_value_query_string_params = event.get("multiValueQueryStringParameters") or {}
-    print(f"{multi_value_query_string_params=}")
 
-    alerts = []
+def get_body(area_ids: list[str], district_ids: list[str], full: bool) -> str:
+    view = StatusView.FULL if full else StatusView.SUMMARY
 
-    if area_ids := multi_value_query_string_params.get("a"):
-        for area_id in area_ids:
-            alerts.extend(DATA_TABLE.get_status_by_area(area_id))
-    elif district_ids := multi_value_query_string_params.get("d"):
-        for district_id in district_ids:
-            alerts.extend(DATA_TABLE.get_status_by_district_ids(district_id))
+    if area_ids:
+        statuses = list(DATA_TABLE.get_status_by_area_ids(area_ids, view))
+    elif district_ids:
+        statuses = list(DATA_TABLE.get_status_by_district_ids(district_ids, view))
     else:
-        alerts.extend(DATA_TABLE.get_status_all())
+        statuses = list(DATA_TABLE.get_status_all(view))
 
-    payload = {"alerts": alerts, "exists": bool(alerts), "full": True}
+    payload: dict[str, Any] = {"exists": bool(statuses), "full": full}
 
-    if multi_value_query_string_params.get("full", [0])[0] != "1":
-        payload["full"] = False
+    if full:
+        payload["alerts"] = DATA_TABLE.resolve_alerts(
+            [status.item for status in statuses if status.item is not None]
+        )
+    else:
         payload["alerts"] = [
             {
-                "category": alert["alert_category"]["label"],
-                "area": alert["district"]["area_name"],
-                "area_id": alert["district"]["area_id"],
-                "district_id": alert["district"]["district_id"],
-                "migun_time_s": alert["district"]["migun_time_s"],
-                "created_at_s": alert["created_at_s"],
-                "description": alert["alert_category"]["description"],
+                "category": status.category,
+                "area": status.area,
+                "area_id": status.area_id,
+                "district_id": status.district_id,
+                # The API has always returned numbers as strings
+                "migun_time_s": str(status.migun_time_s),
+                "created_at_s": str(status.created_at_s),
+                "description": status.description,
             }
-            for alert in alerts
+            for status in statuses
         ]
 
-    return {
-        "statusCode": 200,
-        "headers": {"content-type": "application/json"},
-        "body": json.dumps(payload, cls=DecimalEncoder),
+    return dumps(payload)
+
+
+def lambda_handler(event: dict[str, Any], _: Any) -> dict[str, Any]:
+    log_verbose(event)
+    metrics = Metrics("get_status_api")
+    multi_value_query_string_params = event.get("multiValueQueryStringParameters") or {}
+
+    area_ids = sorted(set(multi_value_query_string_params.get("a") or []))
+    district_ids = sorted(set(multi_value_query_string_params.get("d") or []))
+    full = multi_value_query_string_params.get("full", [0])[0] == "1"
+    # Routines that only ask whether there is an alert don't need the alerts read
+    exists_only = multi_value_query_string_params.get("exists_only", [0])[0] == "1"
+
+    def compute_status_body() -> StatusBody:
+        # Only timed when this request read the table itself
+        with metrics.time("read"):
+            body = (
+                get_exists_body(area_ids, district_ids)
+                if exists_only
+                else get_body(area_ids, district_ids, full)
+            )
+        with metrics.time("encode"):
+            return create_status_body(body)
+
+    with metrics.time("total"):
+        status_body = RESPONSE_CACHE.get_or_compute(
+            (
+                tuple(area_ids),
+                () if area_ids else tuple(district_ids),
+                full and not exists_only,
+                exists_only,
+            ),
+            compute_status_body,
+        )
+        response = get_response(status_body, event.get("headers") or {})
+
+    metrics.properties["query"] = (
+        "area_ids" if area_ids else "district_ids" if district_ids else "all"
+    )
+    metrics.properties["exists_only"] = exists_only
+    metrics.properties["full"] = full
+    metrics.properties["status_code"] = response["statusCode"]
+    metrics.properties["response_cache"] = RESPONSE_CACHE.counters
+    metrics.emit()
+
+    return response
+
+
+def get_response(status_body: StatusBody, headers: dict[str, str]) -> dict[str, Any]:
+    headers = {key.lower(): value for key, value in headers.items()}
+    response_headers = {
+        "content-type": "application/json",
+        "etag": status_body.etag,
+        "vary": "accept-encoding",
     }
+
+    # Devices polling between alerts mostly already have the answer
+    if_none_match = headers.get("if-none-match", "")
+    if status_body.etag in (
+        etag.strip().removeprefix("W/") for etag in if_none_match.split(",")
+    ):
+        return {"statusCode": 304, "headers": response_headers, "body": ""}
+
+    if status_body.gzipped is not None and "gzip" in headers.get("accept-encoding", ""):
+        return {
+            "statusCode": 200,
+            "headers": {**response_headers, "content-encoding": "gzip"},
+            "body": base64.b64encode(status_body.gzipped).decode(),
+            "isBase64Encoded": True,
+        }
+
+    return {"statusCode": 200, "headers": response_headers, "body": status_body.body}
@@ -0,0 +1,99 @@
+from typing import Any, Iterable, Optional, TextIO
+import argparse
+import fileinput
+import json
+import math
+import sys
+
+# The end-to-end latencies the notifier logs with every published message
+LATENCY_NAMES = [
+    "publish_to_detection_ms",
+    "detection_to_write_ms",
+    "write_to_send_ms",
+    "publish_to_send_ms",
+]
+# Upper bounds of the histogram buckets, in ms
+BUCKET_BOUNDS_MS = [100, 250, 500, 1000, 2000, 5000, 10_000, 30_000, math.inf]
+
+
+def parse_record(line: str) -> Optional[dict[str, Any]]:
+    # Lines exported from CloudWatch Logs may have a timestamp and request id before the
+    # JSON, other log lines aren't JSON at all
+    start = line.find("{")
+    if start == -1:
+        return None
+
+    try:
+        record = json.loads(line[start:])
+    except json.JSONDecodeError:
+        return None
+
+    return record if isinstance(record, dict) else None
+
+
+def collect_latencies(lines: Iterable[str]) -> dict[str, list[float]]:
+    latencies_ms: dict[str, list[float]] = {name: [] for name in LATENCY_NAMES}
+
+    for line in lines:
+        record = parse_record(line)
+        if not record or record.get("service") != "notifier":
+            continue
+
+        for name in LATENCY_NAMES:
+            latencies_ms[name].extend(record.get(name, []))
+
+    return latencies_ms
+
+
+def percentile(values: list[float], percent: float) -> float:
+    ordered = sorted(values)
+    return ordered[max(math.ceil(len(ordered) * percent / 100) - 1, 0)]
+
+
+def get_histogram(values: list[float]) -> list[tuple[float, int]]:
+    counts = [0] * len(BUCKET_BOUNDS_MS)
+    for value in values:
+        counts[
+            next(i for i, bound in enumerate(BUCKET_BOUNDS_MS) if value <= bound)
+        ] += 1
+
+    return list(zip(BUCKET_BOUNDS_MS, counts))
+
+
+def write_report(latencies_ms: dict[str, list[float]], out: TextIO) -> None:
+    for name, values in latencies_ms.items():
+        if not values:
+            print(f"{name}: no messages", file=out)
+            continue
+
+        print(
+            f"{name}: count={len(values)} p50={percentile(values, 50):.0f}ms "
+            f"p90={percentile(values, 90):.0f}ms p99={percentile(values, 99):.0f}ms "
+            f"max={max(values):.0f}ms",
+            file=out,
+        )
+        for bound, count in get_histogram(values):
+            label = (
+                f"<= {bound:.0f}ms"
+                if bound != math.inf
+                else f"> {BUCKET_BOUNDS_MS[-2]:.0f}ms"
+            )
+            bars = "#" * math.ceil(count / len(values) * 50)
+            print(f"  {label:>10} {count:>6} {bars}", file=out)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Latency histograms from the notifier's logs, e.g. "
+        "aws logs tail /aws/lambda/alexa-red-alert-notifier --since 1d "
+        "| python -m alexa_red_alert.latency_report"
+    )
+    parser.add_argument("files", nargs="*", help="Log files, stdin when none are given")
+    args = parser.parse_args()
+
+    with fileinput.input(args.files, encoding="utf-8") as lines:
+        write_report(collect_latencies(lines), sys.stdout)
+
+
+if __name__ == "__main__":
+    main()
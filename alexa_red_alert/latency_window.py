@@ -0,0 +1,28 @@
+from collections import deque
+from threading import Lock
+from typing import Optional
+import math
+
+
+# Latencies of the last requests, so percentiles follow current conditions instead of the
+# whole life of a warm container. Written to by concurrent (hedged) requests.
+class LatencyWindow:
+    def __init__(self, size: int = 200):
+        self._latencies_s: deque[float] = deque(maxlen=size)
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self._latencies_s)
+
+    def add(self, latency_s: float) -> None:
+        with self._lock:
+            self._latencies_s.append(latency_s)
+
+    def percentile(self, percent: float) -> Optional[float]:
+        with self._lock:
+            ordered = sorted(self._latencies_s)
+
+        if not ordered:
+            return None
+
+        return ordered[max(math.ceil(len(ordered) * percent / 100) - 1, 0)]
@@ -0,0 +1,86 @@
+from dataclasses import dataclass, field
+from typing import Iterable, Optional
+import re
+import unicodedata
+
+from alexa_red_alert.district import District
+
+# Punctuation the alerts and the districts list don't always agree on, like Hebrew
+# geresh/gershayim vs ASCII quotes
+PUNCTUATION_TRANSLATION = str.maketrans(
+    {"׳": "'", "״": '"', "`": "'", "–": "-", "—": "-", "־": "-"}
+)
+SPACES_AROUND_DASH_PATTERN = re.compile(r"\s*-\s*")
+
+
+def normalize_location_name(name: str) -> str:
+    name = unicodedata.normalize("NFKC", name).translate(PUNCTUATION_TRANSLATION)
+    return SPACES_AROUND_DASH_PATTERN.sub("-", " ".join(name.casefold().split()))
+
+
+@dataclass
+class ResolvedLocations:
+    districts_by_area_id: dict[str, list[District]] = field(default_factory=dict)
+    unknown_locations: list[str] = field(default_factory=list)
+
+    @property
+    def districts(self) -> list[District]:
+        # Districts of the same area (and so the same partition) are next to each other
+        return [
+            district
+            for districts in self.districts_by_area_id.values()
+            for district in districts
+        ]
+
+
+@dataclass(frozen=True)
+class LocationIndex:
+    # Exact Hebrew names, and normalized Hebrew and English names
+    districts_by_name: dict[str, District]
+    districts_by_id: dict[str, District]
+    districts_by_area_id: dict[str, list[District]]
+
+    def get_district(self, location: str) -> Optional[District]:
+        return self.districts_by_name.get(location) or self.districts_by_name.get(
+            normalize_location_name(location)
+        )
+
+    def resolve(self, locations: Iterable[str]) -> ResolvedLocations:
+        resolved = ResolvedLocations()
+        resolved_district_ids = set()
+
+        for location in locations:
+            district = self.get_district(location)
+
+            if district is None:
+                resolved.unknown_locations.append(location)
+            # Spelling variants of the same location resolve to the same district
+            elif district.district_id not in resolved_district_ids:
+                resolved_district_ids.add(district.district_id)
+                resolved.districts_by_area_id.setdefault(district.area_id, []).append(
+                    district
+                )
+
+        return resolved
+
+
+def build_location_index(districts: Iterable[District]) -> LocationIndex:
+    districts_by_name: dict[str, District] = {}
+    districts_by_id: dict[str, District] = {}
+    districts_by_area_id: dict[str, list[District]] = {}
+
+    for district in districts:
+        districts_by_name[normalize_location_name(district.english_name)] = district
+        districts_by_name[normalize_location_name(district.hebrew_name)] = district
+        districts_by_id[district.district_id] = district
+        districts_by_area_id.setdefault(district.area_id, []).append(district)
+
+    # Exact names win over anything that only matches once normalized
+    for district in districts_by_id.values():
+        districts_by_name[district.hebrew_name] = district
+
+    return LocationIndex(
+        districts_by_name=districts_by_name,
+        districts_by_id=districts_by_id,
+        districts_by_area_id=districts_by_area_id,
+    )
@@ -0,0 +1,11 @@
+from dataclasses import dataclass
+
+from alexa_red_alert.alert_category import AlertCategory
+from alexa_red_alert.location_index import LocationIndex
+
+
+@dataclass(frozen=True)
+class Metadata:
+    location_index: LocationIndex
+    alert_categories_by_id: dict[str, AlertCategory]
+    fetched_at_s: float
@@ -0,0 +1,91 @@
+from pathlib import Path
+from time import perf_counter
+from typing import Optional
+import argparse
+import json
+import pickle
+
+from alexa_red_alert.metadata import Metadata
+
+# Written by deploy.sh into the packaged code, so cold starts can handle alerts before
+# the live metadata has been fetched
+SNAPSHOT_PATH = Path(__file__).parent / "metadata_snapshot.pickle"
+
+
+def write_snapshot(metadata: Metadata, path: Path = SNAPSHOT_PATH) -> None:
+    with open(path, "wb") as snapshot_file:
+        pickle.dump(metadata, snapshot_file, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def read_snapshot(path: Path = SNAPSHOT_PATH) -> Optional[Metadata]:
+    try:
+        with open(path, "rb") as snapshot_file:
+            metadata = pickle.load(snapshot_file)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"Ignoring unreadable metadata snapshot {path}: {e!r}")
+        return None
+
+    if not isinstance(metadata, Metadata):
+        print(f"Ignoring metadata snapshot {path} of type {type(metadata)}")
+        return None
+
+    return metadata
+
+
+def measure_cold_start(path: Path = SNAPSHOT_PATH) -> dict[str, float]:
+    # Time from an empty AlertChecker to the end of its first scan, with metadata fetched
+    # live as before the snapshot existed, and with metadata read from the snapshot
+    # pylint: disable=import-outside-toplevel
+    from alexa_red_alert.alert_checker import AlertChecker
+
+    start = perf_counter()
+    live_alert_checker = AlertChecker()
+    live_alert_checker.load_metadata()
+    live_alert_checker.scan()
+    live_s = perf_counter() - start
+
+    start = perf_counter()
+    snapshot_alert_checker = AlertChecker(metadata=read_snapshot(path))
+    if not snapshot_alert_checker.metadata_loaded:
+        raise RuntimeError(f"No usable metadata snapshot at {path}")
+    snapshot_alert_checker.scan()
+    snapshot_s = perf_counter() - start
+
+    return {"live_metadata_ms": live_s * 1000, "snapshot_ms": snapshot_s * 1000}
+
+
+def main() -> None:
+    # pylint: disable=import-outside-toplevel
+    from alexa_red_alert.alert_checker import AlertChecker
+
+    parser = argparse.ArgumentParser(
+        description="Build the bundled metadata snapshot, or time cold starts with it"
+    )
+    parser.add_argument("path", nargs="?", type=Path, default=SNAPSHOT_PATH)
+    parser.add_argument(
+        "--measure",
+        action="store_true",
+        help="Time an AlertChecker's first scan with live metadata and with the snapshot",
+    )
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure_cold_start(args.path)))
+        return
+
+    alert_checker = AlertChecker()
+    alert_checker.load_metadata()
+    if not (metadata := alert_checker.metadata):
+        raise RuntimeError("Metadata was not loaded")
+
+    write_snapshot(metadata, args.path)
+    print(
+        f"Wrote {len(metadata.location_index.districts_by_id)} districts and "
+        f"{len(metadata.alert_categories_by_id)} alert categories to {args.path}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+from contextlib import contextmanager
+from time import perf_counter, time
+from typing import Any, Iterator, Optional
+import os
+
+from alexa_red_alert.serialization import dumps
+
+METRICS_NAMESPACE = os.getenv("METRICS_NAMESPACE", "AlexaRedAlert")
+# Whole events, alerts and district lists are only logged when asked for, logging them on
+# every call is a noticeable part of the hot paths
+VERBOSE_LOGGING = os.getenv("VERBOSE_LOGGING", "false").lower() == "true"
+
+
+def log_verbose(*values: Any) -> None:
+    if VERBOSE_LOGGING:
+        print(*values)
+
+
+# One CloudWatch Embedded Metric Format record, a log line CloudWatch turns into metrics.
+# Each call logs its own values, so p50/p99 of every stage can be read off the metrics.
+class Metrics:
+    def __init__(self, service: str):
+        self.service = service
+        self.values: dict[str, float] = {}
+        # Metrics with a value per item handled in the call, like per published message
+        self.value_lists: dict[str, list[float]] = {}
+        self.units: dict[str, str] = {}
+        # Logged with the record for searching logs, but not turned into metrics
+        self.properties: dict[str, Any] = {}
+
+    def put(self, name: str, value: float, unit: str = "Count") -> None:
+        self.values[name] = value
+        self.units[name] = unit
+
+    def append(self, name: str, value: float, unit: str = "Count") -> None:
+        # A record takes up to 100 values per metric, more than a stream batch holds
+        self.value_lists.setdefault(name, []).append(value)
+        self.units[name] = unit
+
+    @contextmanager
+    def time(self, stage: str) -> Iterator[None]:
+        # Stages entered more than once in a call (like decoding each record) add up
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            name = f"{stage}_ms"
+            self.put(
+                name,
+                self.values.get(name, 0) + (perf_counter() - start) * 1000,
+                "Milliseconds",
+            )
+
+    def to_record(self, timestamp_ms: Optional[int] = None) -> dict[str, Any]:
+        if timestamp_ms is None:
+            timestamp_ms = int(time() * 1000)
+
+        return {
+            "_aws": {
+                "Timestamp": timestamp_ms,
+                "CloudWatchMetrics": [
+                    {
+                        "Namespace": METRICS_NAMESPACE,
+                        "Dimensions": [["service"]],
+                        "Metrics": [
+                            {"Name": name, "Unit": unit}
+                            for name, unit in self.units.items()
+                        ],
+                    }
+                ],
+            },
+            "service": self.service,
+            **self.properties,
+            **{name: round(value, 3) for name, value in self.values.items()},
+            **{
+                name: [round(value, 3) for value in values]
+                for name, values in self.value_lists.items()
+            },
+        }
+
+    def emit(self) -> None:
+        print(dumps(self.to_record()))
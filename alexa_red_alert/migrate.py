@@ -0,0 +1,19 @@
+import argparse
+
+from alexa_red_alert.data_table import DataTable
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Migrate existing data table items")
+    parser.add_argument("--table-name", default="alexa-red-alert-data-table")
+    args = parser.parse_args()
+
+    data_table = DataTable.create_from_table_name(
+        args.table_name, use_re_alert_cache=False
+    )
+    print(f"Added {data_table.backfill_active_index()} live rows to the active index")
+    print(f"Moved the alert out of {data_table.normalize_alert_items()} district rows")
+
+
+if __name__ == "__main__":
+    main()
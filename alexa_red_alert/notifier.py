@@ -1,35 +1,188 @@
-from typing import Any
+from dataclasses import dataclass
+from functools import cache
+from time import time
+from typing import Any, Optional
 import json
 import os
+import traceback
 
-from boto3.dynamodb.transform import TypeDeserializer
 import boto3
 
+from alexa_red_alert.alert import get_published_at_s
+from alexa_red_alert.metrics import Metrics, log_verbose
+from alexa_red_alert.serialization import dumps
+
 RED_ALERT_TOPIC_ARN = os.environ["RED_ALERT_TOPIC_ARN"]
-DYNAMODB_TYPE_DESERIALIZER = TypeDeserializer()
-RED_ALERT_TOPIC = boto3.resource("sns").Topic(RED_ALERT_TOPIC_ARN)
-
-
-def process_record(record: dict[str, Any]) -> None:
-    new_image = DYNAMODB_TYPE_DESERIALIZER.deserialize(record["dynamodb"]["NewImage"])
-    message = {
-        "createdAtS": int(new_image["created_at_s"]),
-        "area": new_image["district"]["area_name"],
-        "district": new_image["district"]["english_name"],
-        "areaId": new_image["district"]["area_id"],
-        "districtId": new_image["district"]["district_id"],
-        "alert": new_image["alert_category"]["label"],
-        "description": new_image["alert_category"]["description"],
-        "alertId": new_image["alert"]["alert_id"],
+NOTIFY_EVENT_NAMES = {"INSERT", "MODIFY"}
+# The most entries a single PublishBatch call takes
+PUBLISH_BATCH_SIZE = 10
+
+
+@dataclass
+class PendingMessage:
+    sequence_number: str
+    message: dict[str, Any]
+    # When oref published the alert, the scanner first saw it and its row was written,
+    # for the ones that are known
+    timestamps_ms: dict[str, int]
+
+
+@cache
+def get_sns_client() -> Any:
+    # Created on first use instead of while importing, like DataTable's table
+    return boto3.client("sns")
+
+
+def get_message(record: dict[str, Any]) -> Optional[dict[str, Any]]:
+    # TTL deletes (REMOVE) have nothing to notify about, and rows only get a new
+    # created_at_s when an alert is written, so other updates (like migrations) must not
+    # notify again
+    if record["eventName"] not in NOTIFY_EVENT_NAMES:
+        return None
+
+    old_image = record["dynamodb"].get("OldImage", {})
+    new_image = record["dynamodb"]["NewImage"]
+    if old_image.get("created_at_s") == new_image["created_at_s"]:
+        return None
+
+    # Only the attributes the message needs are read from the raw DynamoDB JSON, the
+    # alert's location list is never decoded
+    district = new_image["district"]["M"]
+    alert_category = new_image["alert_category"]["M"]
+    return {
+        "createdAtS": int(new_image["created_at_s"]["N"]),
+        "area": district["area_name"]["S"],
+        "district": district["english_name"]["S"],
+        "areaId": district["area_id"]["S"],
+        "districtId": district["district_id"]["S"],
+        "alert": alert_category["label"]["S"],
+        "description": alert_category["description"]["S"],
+        "alertId": (
+            new_image["alert_id"]["S"]
+            if "alert_id" in new_image
+            # Rows written before alerts were stored separately
+            else new_image["alert"]["M"]["alert_id"]["S"]
+        ),
+    }
+
+
+def get_timestamps_ms(record: dict[str, Any], alert_id: str) -> dict[str, int]:
+    new_image = record["dynamodb"]["NewImage"]
+    timestamps_ms = {
+        name: int(new_image[name]["N"])
+        for name in ("detected_at_ms", "written_at_ms")
+        # Rows written before latency was tracked
+        if name in new_image
     }
-    print(json.dumps(message))
-    RED_ALERT_TOPIC.publish(Message=json.dumps(message))
+    if (published_at_s := get_published_at_s(alert_id)) is not None:
+        timestamps_ms["published_at_ms"] = int(published_at_s * 1000)
+
+    return timestamps_ms
 
 
-def lambda_handler(event: dict[str, Any], _: Any) -> None:
-    print(json.dumps(event))
+def get_latencies_ms(timestamps_ms: dict[str, int], sent_at_ms: int) -> dict[str, int]:
+    published_at_ms = timestamps_ms.get("published_at_ms")
+    detected_at_ms = timestamps_ms.get("detected_at_ms")
+    written_at_ms = timestamps_ms.get("written_at_ms")
+    latencies_ms = {}
+
+    if published_at_ms is not None:
+        latencies_ms["publish_to_send_ms"] = sent_at_ms - published_at_ms
+        if detected_at_ms is not None:
+            latencies_ms["publish_to_detection_ms"] = detected_at_ms - published_at_ms
+    if detected_at_ms is not None and written_at_ms is not None:
+        latencies_ms["detection_to_write_ms"] = written_at_ms - detected_at_ms
+    if written_at_ms is not None:
+        latencies_ms["write_to_send_ms"] = sent_at_ms - written_at_ms
+
+    return latencies_ms
+
+
+def publish_batch(messages: list[PendingMessage], metrics: Metrics) -> list[str]:
+    # Returns the sequence numbers of the messages that weren't published, and adds the
+    # latencies of the ones that were to the metrics
+    sent_at_ms = int(time() * 1000)
+    latencies_ms = [
+        get_latencies_ms(message.timestamps_ms, sent_at_ms) for message in messages
+    ]
+    try:
+        response = get_sns_client().publish_batch(
+            TopicArn=RED_ALERT_TOPIC_ARN,
+            PublishBatchRequestEntries=[
+                {
+                    "Id": str(i),
+                    "Message": dumps(message.message),
+                    # So subscribers can tell how late a message is without metrics
+                    "MessageAttributes": {
+                        name: {"DataType": "Number", "StringValue": str(value)}
+                        for name, value in message_latencies_ms.items()
+                    },
+                }
+                for i, (message, message_latencies_ms) in enumerate(
+                    zip(messages, latencies_ms)
+                )
+            ],
+        )
+    except Exception:
+        traceback.print_exc()
+        return [message.sequence_number for message in messages]
+
+    failed_ids = set()
+    for failed in response.get("Failed", []):
+        print(json.dumps({"publish_failed": failed}))
+        failed_ids.add(int(failed["Id"]))
+
+    for i, message_latencies_ms in enumerate(latencies_ms):
+        if i not in failed_ids:
+            for name, value in message_latencies_ms.items():
+                metrics.append(name, value, "Milliseconds")
+
+    return [messages[i].sequence_number for i in sorted(failed_ids)]
+
+
+def lambda_handler(event: dict[str, Any], _: Any) -> dict[str, Any]:
+    log_verbose(json.dumps(event))
+    metrics = Metrics("notifier")
+    failed_sequence_numbers = []
+    # Messages of the same alert and category go out together, in stream order
+    messages_by_alert: dict[tuple[str, str], list[PendingMessage]] = {}
 
     for record in event["Records"]:
-        process_record(record)
+        sequence_number = record["dynamodb"]["SequenceNumber"]
+        try:
+            with metrics.time("decode"):
+                message = get_message(record)
+                timestamps_ms = (
+                    get_timestamps_ms(record, message["alertId"]) if message else {}
+                )
+        except Exception:
+            traceback.print_exc()
+            failed_sequence_numbers.append(sequence_number)
+            continue
 
-    print("Completed")
+        if message is not None:
+            log_verbose(dumps(message))
+            messages_by_alert.setdefault(
+                (message["alertId"], message["alert"]), []
+            ).append(PendingMessage(sequence_number, message, timestamps_ms))
+
+    with metrics.time("publish"):
+        for messages in messages_by_alert.values():
+            for i in range(0, len(messages), PUBLISH_BATCH_SIZE):
+                failed_sequence_numbers.extend(
+                    publish_batch(messages[i : i + PUBLISH_BATCH_SIZE], metrics)
+                )
+
+    metrics.put("records", len(event["Records"]))
+    metrics.put(
+        "messages", sum(len(messages) for messages in messages_by_alert.values())
+    )
+    metrics.put("failed", len(failed_sequence_numbers))
+    metrics.emit()
+    # Only the failed records (and the ones after them in their shard) are retried
+    return {
+        "batchItemFailures": [
+            {"itemIdentifier": sequence_number}
+            for sequence_number in failed_sequence_numbers
+        ]
+    }
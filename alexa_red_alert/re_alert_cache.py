@@ -0,0 +1,66 @@
+from threading import Lock
+from typing import Optional
+
+
+# Warm-container copy of the re_alert_at_s each district row was last written with. It is
+# only used to skip writes the table would reject anyway, a miss (e.g. on a cold start)
+# always falls back to the authoritative conditional write. Shared by the upsert workers.
+class ReAlertCache:
+    def __init__(self, max_entries: int = 10_000):
+        self._max_entries = max_entries
+        self._re_alert_at_s_by_key: dict[tuple[str, str], int] = {}
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._re_alert_at_s_by_key)
+
+    def get(
+        self, district_id: str, category_code_name: str, now_s: int
+    ) -> Optional[int]:
+        key = (district_id, category_code_name)
+        with self._lock:
+            re_alert_at_s = self._re_alert_at_s_by_key.get(key)
+            if re_alert_at_s is None:
+                return None
+
+            if re_alert_at_s <= now_s:
+                del self._re_alert_at_s_by_key[key]
+                return None
+
+            return re_alert_at_s
+
+    def is_suppressed(
+        self, district_id: str, category_code_name: str, now_s: int
+    ) -> bool:
+        return self.get(district_id, category_code_name, now_s) is not None
+
+    def set(
+        self, district_id: str, category_code_name: str, re_alert_at_s: int, now_s: int
+    ) -> None:
+        with self._lock:
+            if len(self._re_alert_at_s_by_key) >= self._max_entries:
+                self._prune(now_s)
+
+            if len(self._re_alert_at_s_by_key) < self._max_entries:
+                self._re_alert_at_s_by_key[
+                    (district_id, category_code_name)
+                ] = re_alert_at_s
+
+    def prune(self, now_s: int) -> None:
+        with self._lock:
+            self._prune(now_s)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._re_alert_at_s_by_key.clear()
+
+    def _prune(self, now_s: int) -> None:
+        # In place, the caller holds the lock
+        expired = [
+            key
+            for key, re_alert_at_s in self._re_alert_at_s_by_key.items()
+            if re_alert_at_s <= now_s
+        ]
+        for key in expired:
+            del self._re_alert_at_s_by_key[key]
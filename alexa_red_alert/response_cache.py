@@ -0,0 +1,71 @@
+from concurrent.futures import Future
+from threading import Lock
+from time import monotonic
+from typing import Callable, Generic, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+# Warm-container cache of recently computed responses. Concurrent requests for a key
+# that is being computed wait for that computation instead of starting their own.
+class ResponseCache(Generic[T]):
+    def __init__(self, ttl_s: float, max_entries: int = 1_000):
+        self._ttl_s = ttl_s
+        self._max_entries = max_entries
+        self._lock = Lock()
+        self._entries: dict[Hashable, tuple[float, T]] = {}
+        self._in_flight: dict[Hashable, Future] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    @property
+    def counters(self) -> dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "coalesced": self.coalesced}
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], T]) -> T:
+        with self._lock:
+            now = monotonic()
+            entry = self._entries.get(key)
+            if entry and entry[0] > now:
+                self.hits += 1
+                return entry[1]
+
+            waiting_on = self._in_flight.get(key)
+            if waiting_on:
+                self.coalesced += 1
+            else:
+                self.misses += 1
+                in_flight: Future = Future()
+                self._in_flight[key] = in_flight
+
+        if waiting_on:
+            return waiting_on.result()
+
+        try:
+            value = compute()
+        except BaseException as e:
+            with self._lock:
+                del self._in_flight[key]
+            in_flight.set_exception(e)
+            raise
+
+        with self._lock:
+            if self._ttl_s > 0:
+                if len(self._entries) >= self._max_entries:
+                    self._prune(monotonic())
+                self._entries[key] = (monotonic() + self._ttl_s, value)
+            del self._in_flight[key]
+        in_flight.set_result(value)
+
+        return value
+
+    def _prune(self, now: float) -> None:
+        expired_keys = [
+            key for key, (expires_at, _) in self._entries.items() if expires_at <= now
+        ]
+        for key in expired_keys:
+            del self._entries[key]
+        if len(self._entries) >= self._max_entries:
+            self._entries.clear()
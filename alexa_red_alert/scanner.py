@@ -1,29 +1,301 @@
-from typing import Any
+from threading import Event, Thread
+from time import monotonic, sleep
+from typing import Any, Callable, Optional
+import json
 import os
+import random
 
-from alexa_red_alert.alert_checker import AlertChecker
+from alexa_red_alert.alert_checker import (
+    DEFAULT_SCAN_TIMEOUT_S,
+    OREF_BASE_URL,
+    AlertChecker,
+    ScanStatus,
+)
 from alexa_red_alert.data_table import DataTable
+from alexa_red_alert.metadata_snapshot import read_snapshot
+from alexa_red_alert.metrics import Metrics, log_verbose
+from alexa_red_alert.write_queue import PendingWrite, WriteQueue
 
-ALERT_CHECKER = AlertChecker()
+# The bundled snapshot is replaced by live metadata in the background once it's stale
+ALERT_CHECKER = AlertChecker(
+    metadata=read_snapshot(),
+    # A local stand-in (see benchmarks.oref_replay) for load tests
+    base_url=os.getenv("OREF_BASE_URL", OREF_BASE_URL),
+)
 DATA_TABLE = DataTable.create_from_table_name(os.environ["DATA_TABLE_NAME"])
 
+DEFAULT_INTERVAL_MS = int(os.getenv("SCAN_INTERVAL_MS", "500"))
+DEFAULT_JITTER_MS = int(os.getenv("SCAN_JITTER_MS", "100"))
+# Time kept free at the end of a loop invocation on top of the slowest iteration seen
+SAFETY_MARGIN_MS = int(os.getenv("SCAN_SAFETY_MARGIN_MS", "1000"))
+# Districts the pipelined loop's write stage upserts at a time
+WRITE_BATCH_SIZE = 500
+# Backoff of the write stage while batches keep failing
+WRITE_RETRY_BASE_S = 0.1
+WRITE_RETRY_MAX_S = 2.0
+
+
+def scan_once(
+    timeout_s: float = DEFAULT_SCAN_TIMEOUT_S,
+    verbose: bool = True,
+    metrics: Optional[Metrics] = None,
+    write_queue: Optional[WriteQueue] = None,
+) -> ScanStatus:
+    # The loop passes its own metrics, which it emits with the iteration's timings
+    if metrics is not None:
+        return _scan_once(timeout_s, verbose, metrics, write_queue)
+
+    metrics = Metrics("scanner")
+    try:
+        return _scan_once(timeout_s, verbose, metrics, write_queue)
+    finally:
+        metrics.emit()
+
+
+def _scan_once(
+    timeout_s: float,
+    verbose: bool,
+    metrics: Metrics,
+    write_queue: Optional[WriteQueue],
+) -> ScanStatus:
+    if write_queue is not None:
+        if dropped := write_queue.take_dropped():
+            # The write stage gave up on these, the scan hands their districts out again
+            print(f"Write stage dropped {dropped} districts, handing them out again")
+            ALERT_CHECKER.forget_last_scan()
+        for alert_id, district_ids, written_at in write_queue.take_written():
+            ALERT_CHECKER.mark_written(alert_id, district_ids, written_at)
 
-def lambda_handler(_: dict[str, Any], __: Any) -> None:
     if not ALERT_CHECKER.metadata_loaded:
         print("Loading metadata...")
-        ALERT_CHECKER.load_metadata()
+        with metrics.time("load_metadata"):
+            ALERT_CHECKER.load_metadata()
+        print(json.dumps({"metadata_timings_ms": ALERT_CHECKER.metadata_timings}))
+
+    with metrics.time("scan"):
+        scan_result = ALERT_CHECKER.scan(timeout_s=timeout_s)
+    for name, ms in ALERT_CHECKER.scan_timings.items():
+        metrics.put(f"scan_{name}", ms, "Milliseconds")
+    metrics.put("hedged", int(ALERT_CHECKER.scan_hedged))
+    metrics.properties["scan_status"] = scan_result.status.value
+
+    alert = scan_result.alert
+    if not alert or scan_result.status not in (
+        ScanStatus.NEW_ALERT,
+        ScanStatus.NEW_LOCATIONS,
+        ScanStatus.RE_ALERT,
+    ):
+        if verbose:
+            print(f"Scan result: {scan_result.status.value}, no new alerts found")
+        return scan_result.status
+
+    print(f"Scan result: {scan_result.status.value}, sending to database")
+    try:
+        with metrics.time("get_districts"):
+            districts = ALERT_CHECKER.get_districts(alert, scan_result.new_locations)
+        alert_category = ALERT_CHECKER.get_alert_category(alert)
+        detected_at_s = ALERT_CHECKER.get_first_seen_at_s(alert)
+
+        # The pipelined loop's write stage writes them, while the next scans go on
+        if write_queue is not None:
+            coalesced = write_queue.coalesced
+            rejected = write_queue.put(alert, districts, alert_category, detected_at_s)
+            metrics.put("queued_districts", len(districts) - len(rejected))
+            metrics.put("coalesced_districts", write_queue.coalesced - coalesced)
+            metrics.put("rejected_districts", len(rejected))
+            if rejected:
+                # Handed out again by the next scan, once there's room
+                print(f"Write queue full, rejected {len(rejected)} districts")
+                ALERT_CHECKER.forget_last_scan()
+            return scan_result.status
+
+        with metrics.time("upsert"):
+            upsert_result = DATA_TABLE.upsert_alert(
+                alert,
+                districts,
+                alert_category,
+                detected_at_s=detected_at_s,
+            )
+    except Exception:
+        ALERT_CHECKER.forget_last_scan()
+        raise
+
+    ALERT_CHECKER.mark_written(
+        alert.alert_id,
+        upsert_result.written_district_ids + upsert_result.suppressed_district_ids,
+    )
+    metrics.put("written_districts", len(upsert_result.written_district_ids))
+    metrics.put("suppressed_districts", len(upsert_result.suppressed_district_ids))
+    print(f"{alert.alert_id=} {alert_category.code_name=}")
+    log_verbose(f"{upsert_result=}")
+
+    return scan_result.status
+
+
+def write_batch(write_queue: WriteQueue, writes: list[PendingWrite]) -> bool:
+    # Returns whether every write succeeded
+    metrics = Metrics("scanner_writer")
+    metrics.put(
+        "queue_wait_ms",
+        (monotonic() - min(write.queued_at for write in writes)) * 1000,
+        "Milliseconds",
+    )
+    metrics.put("batch_districts", len(writes))
+    writes_by_alert: dict[tuple[str, str], list[PendingWrite]] = {}
+    for write in writes:
+        writes_by_alert.setdefault(
+            (write.alert.alert_id, write.alert_category.code_name), []
+        ).append(write)
+
+    written = 0
+    failed: list[PendingWrite] = []
+    with metrics.time("upsert"):
+        for alert_writes in writes_by_alert.values():
+            first = alert_writes[0]
+            try:
+                upsert_result = DATA_TABLE.upsert_alert(
+                    first.alert,
+                    [write.district for write in alert_writes],
+                    first.alert_category,
+                    detected_at_s=first.detected_at_s,
+                )
+                written += len(upsert_result.written_district_ids)
+                write_queue.report_written(
+                    first.alert.alert_id,
+                    upsert_result.written_district_ids
+                    + upsert_result.suppressed_district_ids,
+                    monotonic(),
+                )
+            except Exception as e:
+                print(f"Write failed: {e!r}")
+                failed.extend(alert_writes)
+
+    # Dropped writes are picked up by the next scan, which forgets its last one
+    dropped = write_queue.put_back(failed)
+    metrics.put("written_districts", written)
+    metrics.put("failed_districts", len(failed))
+    metrics.put("dropped_districts", len(dropped))
+    metrics.emit()
+
+    return not failed
+
+
+def write_pending(write_queue: WriteQueue, stop: Event) -> None:
+    # The pipelined loop's write stage, it drains the queue before stopping
+    failures = 0
+    while not stop.is_set() or len(write_queue):
+        if not (writes := write_queue.take(WRITE_BATCH_SIZE, timeout_s=0.1)):
+            continue
+
+        if write_batch(write_queue, writes):
+            failures = 0
+        else:
+            # Errors like throttling are given time to pass, and the put back writes are
+            # dropped after a few attempts instead of being retried in a tight loop
+            failures += 1
+            sleep(min(WRITE_RETRY_BASE_S * 2 ** (failures - 1), WRITE_RETRY_MAX_S))
+
+
+def run_loop(
+    get_remaining_time_ms: Callable[[], int],
+    interval_ms: int = DEFAULT_INTERVAL_MS,
+    jitter_ms: int = DEFAULT_JITTER_MS,
+    safety_margin_ms: int = SAFETY_MARGIN_MS,
+    duration_ms: Optional[int] = None,
+    pipelined: bool = False,
+) -> dict[str, Any]:
+    # Pipelined, scans only queue the districts of an alert for a write stage running
+    # alongside, so a slow write burst doesn't hold back detecting the next alert
+    write_queue = WriteQueue() if pipelined else None
+    stop_writing = Event()
+    writer: Optional[Thread] = None
+    if write_queue is not None:
+        writer = Thread(
+            target=write_pending, args=(write_queue, stop_writing), daemon=True
+        )
+        writer.start()
+
+    iterations = 0
+    failures = 0
+    slowest_iteration_ms = 0.0
+    loop_start = next_start = monotonic()
+
+    def budget_ms() -> float:
+        remaining_ms: float = get_remaining_time_ms() - safety_margin_ms
+        if duration_ms is not None:
+            remaining_ms = min(
+                remaining_ms, duration_ms - (monotonic() - loop_start) * 1000
+            )
+        return remaining_ms
+
+    # Each iteration is scheduled from the previous one's planned start rather than its
+    # end, so the cadence doesn't drift by the time spent scanning
+    while budget_ms() > slowest_iteration_ms:
+        iteration_start = monotonic()
+        status: Optional[ScanStatus] = None
+        metrics = Metrics("scanner")
+        try:
+            # A hung oref request must give up while there's still time to stop cleanly
+            status = scan_once(
+                timeout_s=min(DEFAULT_SCAN_TIMEOUT_S, budget_ms() / 1000),
+                verbose=False,
+                metrics=metrics,
+                write_queue=write_queue,
+            )
+        except Exception as e:
+            failures += 1
+            print(f"Scan failed: {e!r}")
+
+        iteration_ms = (monotonic() - iteration_start) * 1000
+        slowest_iteration_ms = max(slowest_iteration_ms, iteration_ms)
+        iterations += 1
+        metrics.properties["iteration"] = iterations
+        metrics.properties["status"] = status.value if status else "failed"
+        metrics.put("iteration_ms", iteration_ms, "Milliseconds")
+        metrics.put("lag_ms", (iteration_start - next_start) * 1000, "Milliseconds")
+        if write_queue is not None:
+            metrics.put("queue_depth", len(write_queue))
+            if (oldest_queued_at := write_queue.oldest_queued_at) is not None:
+                metrics.put(
+                    "queue_age_ms",
+                    (monotonic() - oldest_queued_at) * 1000,
+                    "Milliseconds",
+                )
+        metrics.emit()
+
+        next_start = max(
+            next_start + (interval_ms + random.uniform(-jitter_ms, jitter_ms)) / 1000,
+            monotonic(),
+        )
+        sleep_ms = min(
+            (next_start - monotonic()) * 1000, budget_ms() - slowest_iteration_ms
+        )
+        if sleep_ms > 0:
+            sleep(sleep_ms / 1000)
+
+    if write_queue is not None and writer is not None:
+        # The writes still queued get what's left of the safety margin
+        stop_writing.set()
+        writer.join(max(get_remaining_time_ms() - safety_margin_ms / 2, 0) / 1000)
+        if dropped := write_queue.clear() + write_queue.take_dropped():
+            print(
+                f"Stopping with {dropped} districts unwritten, handing them out again"
+            )
+            ALERT_CHECKER.forget_last_scan()
 
-    alert = ALERT_CHECKER.scan()
-    if not alert:
-        print("No alerts found, exiting")
-        return
+    print(json.dumps({"request_stats": ALERT_CHECKER.request_stats}))
+    return {"iterations": iterations, "failures": failures}
 
-    print("Alerts found, sending to database")
-    districts = ALERT_CHECKER.get_districts(alert)
-    print(f"{districts=}")
 
-    alert_category = ALERT_CHECKER.get_alert_category(alert)
-    print(f"{alert_category=}")
+def lambda_handler(event: dict[str, Any], context: Any) -> Optional[dict[str, Any]]:
+    if not (event or {}).get("loop"):
+        scan_once()
+        return None
 
-    DATA_TABLE.upsert_alert(alert, districts, alert_category)
-    print("Completed")
+    return run_loop(
+        context.get_remaining_time_in_millis,
+        interval_ms=int(event.get("intervalMs", DEFAULT_INTERVAL_MS)),
+        jitter_ms=int(event.get("jitterMs", DEFAULT_JITTER_MS)),
+        duration_ms=int(event["durationMs"]) if "durationMs" in event else None,
+        pipelined=bool(event.get("pipelined")),
+    )
@@ -0,0 +1,29 @@
+from decimal import Decimal
+from typing import Any, Callable
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None  # type: ignore[assignment]
+
+
+def decimal_to_str(value: Any) -> str:
+    # DynamoDB numbers come back as Decimal, which the API has always returned as strings
+    if isinstance(value, Decimal):
+        return str(value)
+
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps_stdlib(value: Any, default: Callable[[Any], Any] = decimal_to_str) -> str:
+    return json.dumps(value, default=default, separators=(",", ":"), ensure_ascii=False)
+
+
+def dumps_orjson(value: Any, default: Callable[[Any], Any] = decimal_to_str) -> str:
+    # default is only called for the values orjson can't encode itself, from C
+    return orjson.dumps(value, default=default).decode()
+
+
+# orjson when it's installed, both write the same compact UTF-8 JSON
+dumps = dumps_orjson if orjson is not None else dumps_stdlib
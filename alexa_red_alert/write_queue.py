@@ -0,0 +1,141 @@
+from dataclasses import dataclass
+from threading import Condition
+from time import monotonic
+from typing import Optional
+
+from alexa_red_alert.alert import Alert
+from alexa_red_alert.alert_category import AlertCategory
+from alexa_red_alert.district import District
+
+
+@dataclass
+class PendingWrite:
+    alert: Alert
+    district: District
+    alert_category: AlertCategory
+    detected_at_s: Optional[float]
+    queued_at: float
+    # Failed attempts so far
+    attempts: int = 0
+
+    @property
+    def key(self) -> tuple[str, str]:
+        # The district row the write goes to
+        return self.district.district_id, self.alert_category.code_name
+
+
+# District writes handed from the fetching to the write stage of the pipelined scanner.
+# A newer alert for a district replaces its queued write, which would only have been
+# overwritten, and a full queue rejects writes instead of blocking the fetching.
+class WriteQueue:
+    def __init__(self, max_entries: int = 5_000, max_attempts: int = 3):
+        self._max_entries = max_entries
+        self._max_attempts = max_attempts
+        self._pending: dict[tuple[str, str], PendingWrite] = {}
+        self._condition = Condition()
+        # Writes given up on since the fetching side last took the count
+        self._dropped_since_taken = 0
+        # Alert id, district ids and monotonic time of each write since the fetching side
+        # last took them
+        self._written: list[tuple[str, list[str], float]] = []
+
+        self.coalesced = 0
+        self.rejected = 0
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    @property
+    def oldest_queued_at(self) -> Optional[float]:
+        with self._condition:
+            return min(
+                (write.queued_at for write in self._pending.values()), default=None
+            )
+
+    def put(
+        self,
+        alert: Alert,
+        districts: list[District],
+        alert_category: AlertCategory,
+        detected_at_s: Optional[float] = None,
+    ) -> list[District]:
+        # Returns the districts that didn't fit
+        now = monotonic()
+        rejected = []
+
+        with self._condition:
+            for district in districts:
+                write = PendingWrite(
+                    alert, district, alert_category, detected_at_s, now
+                )
+                if write.key in self._pending:
+                    # Keeps its place in line, so coalescing doesn't delay the write
+                    self.coalesced += 1
+                    write.queued_at = self._pending[write.key].queued_at
+                elif len(self._pending) >= self._max_entries:
+                    self.rejected += 1
+                    rejected.append(district)
+                    continue
+
+                self._pending[write.key] = write
+
+            self._condition.notify()
+
+        return rejected
+
+    def put_back(self, writes: list[PendingWrite]) -> list[PendingWrite]:
+        # For failed writes, unless a newer write for the district was queued meanwhile.
+        # Returns the writes given up on, out of attempts or because the queue is full.
+        dropped = []
+        with self._condition:
+            for write in writes:
+                write.attempts += 1
+                if write.key in self._pending:
+                    continue
+
+                if (
+                    write.attempts >= self._max_attempts
+                    or len(self._pending) >= self._max_entries
+                ):
+                    dropped.append(write)
+                else:
+                    self._pending[write.key] = write
+
+            self.dropped += len(dropped)
+            self._dropped_since_taken += len(dropped)
+            self._condition.notify()
+
+        return dropped
+
+    def take_dropped(self) -> int:
+        # The fetching side forgets its scan when writes were dropped, so their districts
+        # are handed out again
+        with self._condition:
+            dropped = self._dropped_since_taken
+            self._dropped_since_taken = 0
+            return dropped
+
+    def take(self, max_writes: int, timeout_s: float) -> list[PendingWrite]:
+        with self._condition:
+            self._condition.wait_for(lambda: self._pending, timeout_s)
+            keys = list(self._pending)[:max_writes]
+            return [self._pending.pop(key) for key in keys]
+
+    def clear(self) -> int:
+        with self._condition:
+            dropped = len(self._pending)
+            self._pending.clear()
+            return dropped
+
+    def report_written(
+        self, alert_id: str, district_ids: list[str], written_at: float
+    ) -> None:
+        with self._condition:
+            self._written.append((alert_id, district_ids, written_at))
+
+    def take_written(self) -> list[tuple[str, list[str], float]]:
+        # The fetching side starts the re-alert windows of the written districts
+        with self._condition:
+            written, self._written = self._written, []
+            return written
@@ -0,0 +1,107 @@
+"""Compare reading all active alerts with a table scan vs the active index.
+
+Runs against DynamoDB Local (see LOCAL_DYNAMODB_PORT), e.g.
+python -m benchmarks.active_index_benchmark --items 10000 --live 50
+"""
+from statistics import median
+from time import perf_counter, time
+from typing import Any, Callable
+import argparse
+
+from boto3.dynamodb.conditions import Attr
+
+from alexa_red_alert.data_table import DataTable, get_active_partition
+from tests import (
+    create_data_table,
+    create_local_dynamodb_client,
+    create_local_dynamodb_table,
+    reset_local_dynamodb,
+)
+
+
+def fill_table(table: Any, items: int, live: int) -> None:
+    now_s = int(time())
+
+    with table.batch_writer() as batch:
+        for i in range(items):
+            # Expired rows that TTL has not deleted yet
+            expires_at_s = now_s + 600 if i < live else now_s - 600
+            batch.put_item(
+                Item={
+                    "pk": f"AREA#{i % 100}",
+                    "sk": f"DISTRICT#{i}#CATEGORY#missiles",
+                    "pk1": f"DISTRICT#{i}",
+                    "sk1": "CATEGORY#missiles",
+                    "expires_at_s": expires_at_s,
+                    "active": get_active_partition(str(i)),
+                    "created_at_s": now_s,
+                    "district": {
+                        "area_name": f"area-{i % 100}",
+                        "area_id": str(i % 100),
+                        "district_id": str(i),
+                        "migun_time_s": 90,
+                    },
+                    "alert_category": {"label": "missiles", "description": "..."},
+                }
+            )
+
+
+def scan_all(table: Any) -> tuple[int, int]:
+    # The pre-index implementation of get_status_all
+    scan_kwargs = {
+        "ConsistentRead": True,
+        "FilterExpression": Attr("expires_at_s").gte(int(time())),
+    }
+    found = scanned = 0
+
+    while True:
+        result = table.scan(**scan_kwargs)
+        found += result["Count"]
+        scanned += result["ScannedCount"]
+
+        if last_evaluated_key := result.get("LastEvaluatedKey"):
+            scan_kwargs["ExclusiveStartKey"] = last_evaluated_key
+        else:
+            return found, scanned
+
+
+def query_all(data_table: DataTable) -> tuple[int, int]:
+    # Everything the index query reads is returned, so found == scanned
+    found = sum(1 for _ in data_table.get_status_all())
+    return found, found
+
+
+def measure(name: str, read: Callable[[], tuple[int, int]], repeat: int) -> None:
+    timings_ms = []
+
+    for _ in range(repeat):
+        start = perf_counter()
+        found, scanned = read()
+        timings_ms.append((perf_counter() - start) * 1000)
+
+    print(
+        f"{name}: found={found} scanned={scanned} "
+        f"median={median(timings_ms):.1f}ms max={max(timings_ms):.1f}ms"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--items", type=int, default=10_000)
+    parser.add_argument("--live", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    client = create_local_dynamodb_client()
+    reset_local_dynamodb(client)
+    create_data_table(client)
+    table = create_local_dynamodb_table()
+    fill_table(table, args.items, args.live)
+    data_table = DataTable(table=table)
+
+    measure("scan", lambda: scan_all(table), args.repeat)
+    measure("active index query", lambda: query_all(data_table), args.repeat)
+
+
+if __name__ == "__main__":
+    main()
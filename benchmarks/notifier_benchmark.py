@@ -0,0 +1,43 @@
+"""Compare the notifier's raw stream record decoding with a full TypeDeserializer pass.
+
+python -m benchmarks.notifier_benchmark --locations 300
+"""
+from timeit import timeit
+import argparse
+
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+
+from tests.notifier_test import create_image, create_record
+
+
+def main() -> None:
+    # Imported after tests, which sets the environment the notifier reads at import
+    # pylint: disable=import-outside-toplevel
+    from alexa_red_alert import notifier
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--locations", type=int, default=300)
+    parser.add_argument("--number", type=int, default=10_000)
+    args = parser.parse_args()
+
+    image = create_image("some-district-id", "some-alert-id", 1577836800)
+    # Rows written before alerts were stored separately carry every location
+    image["alert"] = TypeSerializer().serialize(
+        {
+            "alert_id": image.pop("alert_id")["S"],
+            "locations": [f"some-location-{i}" for i in range(args.locations)],
+        }
+    )
+    record = create_record("1", image)
+    deserializer = TypeDeserializer()
+
+    for name, decode in [
+        ("TypeDeserializer", lambda: deserializer.deserialize({"M": image})),
+        ("get_message", lambda: notifier.get_message(record)),
+    ]:
+        per_record_us = timeit(decode, number=args.number) / args.number * 1_000_000
+        print(f"{name}: {per_record_us:.1f}us per record")
+
+
+if __name__ == "__main__":
+    main()
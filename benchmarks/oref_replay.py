@@ -0,0 +1,208 @@
+"""Serve a local oref stand-in and replay an alert sequence on it.
+
+Recordings are JSON lines of {"at_s": seconds from the start, "alert": the alerts.json
+payload or null}, like the ones --record writes from the live site. Point the scanner at
+the stand-in with OREF_BASE_URL, e.g.
+python -m benchmarks.oref_replay --scenario rolling_barrage --speed 10 --port 8043
+python -m benchmarks.oref_replay --recording benchmarks/fixtures/barrage.jsonl
+python -m benchmarks.oref_replay --record storm.jsonl --duration-s 600
+"""
+from dataclasses import dataclass
+from pathlib import Path
+from threading import Event, Thread
+from time import monotonic, sleep
+from typing import Any, Callable, Optional
+import argparse
+import json
+
+import urllib3
+
+from benchmarks.oref_stand_in import (
+    ALERTS_PATH,
+    OrefStandIn,
+    create_raw_alert,
+    create_raw_alert_categories,
+    create_raw_districts,
+)
+
+
+@dataclass
+class ReplayStep:
+    at_s: float
+    # None between alerts
+    alert: Optional[dict[str, Any]]
+
+
+def get_location_names(districts: list[dict[str, Any]]) -> list[str]:
+    return [district["label_he"] for district in districts]
+
+
+def create_single_alert(locations: list[str], duration_s: float) -> list[ReplayStep]:
+    return [
+        ReplayStep(0, create_raw_alert("133475305490000000", locations[:10])),
+        ReplayStep(duration_s, None),
+    ]
+
+
+def create_rolling_barrage(
+    locations: list[str],
+    waves: int = 10,
+    locations_per_wave: int = 50,
+    interval_s: float = 5,
+) -> list[ReplayStep]:
+    # Each wave is a new alert id whose location list keeps growing within the wave, like
+    # oref adds locations to an alert as more launches are detected
+    steps = []
+    for wave in range(waves):
+        alert_id = str(133475305490000000 + wave * 100_000_000)
+        first = wave * locations_per_wave % len(locations)
+        for i in range(1, 6):
+            last = first + locations_per_wave * i // 5
+            steps.append(
+                ReplayStep(
+                    (wave + i / 6) * interval_s,
+                    create_raw_alert(alert_id, locations[first:last]),
+                )
+            )
+    steps.append(ReplayStep(waves * interval_s, None))
+    return steps
+
+
+def create_alternating_categories(
+    locations: list[str], alerts: int = 20, interval_s: float = 2
+) -> list[ReplayStep]:
+    # The same locations alerted with missiles and hostile aircraft in turns
+    steps = [
+        ReplayStep(
+            i * interval_s,
+            create_raw_alert(
+                str(133475305490000000 + i * 100_000_000),
+                locations[:30],
+                category_id="1" if i % 2 == 0 else "2",
+            ),
+        )
+        for i in range(alerts)
+    ]
+    steps.append(ReplayStep(alerts * interval_s, None))
+    return steps
+
+
+SCENARIOS: dict[str, Callable[[list[str]], list[ReplayStep]]] = {
+    "single_alert": lambda locations: create_single_alert(locations, duration_s=30),
+    "rolling_barrage": create_rolling_barrage,
+    "alternating_categories": create_alternating_categories,
+}
+
+
+def read_recording(path: Path) -> list[ReplayStep]:
+    with path.open(encoding="utf-8") as file:
+        return [ReplayStep(**json.loads(line)) for line in file if line.strip()]
+
+
+def record(path: Path, duration_s: float, interval_s: float) -> int:
+    # Polls the live site and writes every change of alerts.json
+    http_pool = urllib3.PoolManager()
+    last_body = None
+    changes = 0
+    start = monotonic()
+
+    with path.open("w", encoding="utf-8") as file:
+        while (at_s := monotonic() - start) < duration_s:
+            response = http_pool.request(
+                "GET",
+                f"https://www.oref.org.il{ALERTS_PATH}",
+                headers={
+                    "Referer": "https://www.oref.org.il/en",
+                    "X-Requested-With": "XMLHttpRequest",
+                },
+            )
+            body = response.data.decode("utf-8-sig").strip()
+            if response.status == 200 and body != last_body:
+                alert = json.loads(body) if body else None
+                file.write(json.dumps({"at_s": round(at_s, 3), "alert": alert}) + "\n")
+                last_body = body
+                changes += 1
+            sleep(interval_s)
+
+    return changes
+
+
+class Replayer:
+    # Plays steps back on a stand-in from a thread, speed 10 plays them 10 times faster
+    def __init__(
+        self, stand_in: OrefStandIn, steps: list[ReplayStep], speed: float = 1
+    ):
+        self._stand_in = stand_in
+        self._steps = sorted(steps, key=lambda step: step.at_s)
+        self._speed = speed
+        self._stopped = Event()
+        self._thread = Thread(target=self._run, daemon=True)
+        # Monotonic time each step was served from, for measuring detection lag
+        self.served_at: list[float] = []
+
+    @property
+    def done(self) -> bool:
+        return not self._thread.is_alive()
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        start = monotonic()
+        for step in self._steps:
+            wait_s = start + step.at_s / self._speed - monotonic()
+            if wait_s > 0 and self._stopped.wait(wait_s):
+                return
+
+            self._stand_in.set_alert(step.alert)
+            self.served_at.append(monotonic())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--scenario", choices=SCENARIOS, default="rolling_barrage")
+    parser.add_argument("--recording", type=Path)
+    parser.add_argument("--speed", type=float, default=1)
+    parser.add_argument("--port", type=int, default=8043)
+    parser.add_argument("--districts", type=int, default=1500)
+    # A saved GetDistricts.aspx response, instead of synthetic districts
+    parser.add_argument("--districts-file", type=Path)
+    parser.add_argument("--record", type=Path)
+    parser.add_argument("--duration-s", type=float, default=600)
+    parser.add_argument("--record-interval-s", type=float, default=0.5)
+    args = parser.parse_args()
+
+    if args.record:
+        changes = record(args.record, args.duration_s, args.record_interval_s)
+        print(f"Recorded {changes} changes to {args.record}")
+        return
+
+    districts = (
+        json.loads(args.districts_file.read_text(encoding="utf-8-sig"))
+        if args.districts_file
+        else create_raw_districts(args.districts)
+    )
+    steps = (
+        read_recording(args.recording)
+        if args.recording
+        else SCENARIOS[args.scenario](get_location_names(districts))
+    )
+
+    with OrefStandIn(districts, create_raw_alert_categories(), args.port) as stand_in:
+        print(f"Serving on {stand_in.base_url}, replaying {len(steps)} steps")
+        replayer = Replayer(stand_in, steps, args.speed)
+        replayer.start()
+        try:
+            while not replayer.done:
+                sleep(1)
+        except KeyboardInterrupt:
+            replayer.stop()
+        print(f"Replayed, served {stand_in.requests} requests")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from typing import Any, Optional
+import hashlib
+import json
+
+# urllib3 collapses the double slash AlertChecker requests districts with
+DISTRICTS_PATH = "/Shared/Ajax/GetDistricts.aspx?lang=en"
+ALERT_CATEGORIES_PATH = "/Leftovers/en.Leftovers.json"
+ALERTS_PATH = "/WarningMessages/alert/alerts.json"
+
+
+def create_raw_districts(count: int, areas: int = 30) -> list[dict[str, Any]]:
+    return [
+        {
+            "label": f"District {i}",
+            "value": f"code-{i}",
+            "id": str(i),
+            "areaid": i % areas,
+            "areaname": f"Area {i % areas}",
+            "label_he": f"מחוז {i}",
+            "migun_time": 90,
+        }
+        for i in range(count)
+    ]
+
+
+def create_raw_alert_categories() -> list[dict[str, Any]]:
+    return [
+        {
+            "category": 1,
+            "code": "missilealert",
+            "duration": 10,
+            "label": "Missiles",
+            "description1": "Enter the protected space",
+        },
+        {
+            "category": 2,
+            "code": "uav",
+            "duration": 10,
+            "label": "Hostile aircraft intrusion",
+            "description1": "Enter the protected space",
+        },
+    ]
+
+
+def create_raw_alert(
+    alert_id: str, locations: list[str], category_id: str = "1"
+) -> dict[str, Any]:
+    return {
+        "id": alert_id,
+        "cat": category_id,
+        "title": "ירי רקטות וטילים",
+        "data": locations,
+        "desc": "היכנסו למרחב המוגן ושהו בו 10 דקות",
+    }
+
+
+class OrefStandIn:
+    # Serves the oref endpoints AlertChecker reads from memory, with ETag/304 on the
+    # alerts like the real CDN, and counts the requests it got per path
+    def __init__(
+        self,
+        districts: list[dict[str, Any]],
+        alert_categories: list[dict[str, Any]],
+        port: int = 0,
+    ):
+        self._bodies = {
+            DISTRICTS_PATH: json.dumps(districts).encode("utf-8-sig"),
+            ALERT_CATEGORIES_PATH: json.dumps(alert_categories).encode("utf-8-sig"),
+        }
+        self._lock = Lock()
+        self.request_counts: dict[str, int] = {}
+        self.set_alert(None)
+
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep-alive, so a scan costs what it costs against a pooled connection
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self) -> None:  # pylint: disable=invalid-name
+                status, headers, body = stand_in.get_response(
+                    self.path, self.headers.get("If-None-Match")
+                )
+                self.send_response(status)
+                for name, value in {**headers, "Content-Length": len(body)}.items():
+                    self.send_header(name, str(value))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *_: Any) -> None:
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self._thread = Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    @property
+    def requests(self) -> int:
+        return sum(self.request_counts.values())
+
+    def set_alert(self, raw_alert: Optional[dict[str, Any]]) -> None:
+        # oref serves an empty body between alerts
+        body = b"" if raw_alert is None else json.dumps(raw_alert).encode("utf-8-sig")
+        with self._lock:
+            self._bodies[ALERTS_PATH] = body
+
+    def get_response(
+        self, path: str, if_none_match: Optional[str]
+    ) -> tuple[int, dict[str, str], bytes]:
+        with self._lock:
+            self.request_counts[path] = self.request_counts.get(path, 0) + 1
+            body = self._bodies.get(path)
+
+        if body is None:
+            return 404, {}, b""
+
+        etag = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+        headers = {"Content-Type": "application/json", "ETag": etag}
+        if if_none_match == etag:
+            return 304, headers, b""
+
+        return 200, headers, body
+
+    def __enter__(self) -> "OrefStandIn":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *_: Any) -> None:
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,271 @@
+"""Offline benchmarks of the scan -> resolve -> upsert -> notify pipeline and /status.
+
+Runs against DynamoDB Local (see LOCAL_DYNAMODB_PORT) and a local stand-in for oref,
+records p50/p99 and requests per call of each case and compares them with the stored
+baseline, exiting non-zero on a regression, e.g.
+python -m benchmarks.pipeline_benchmark
+python -m benchmarks.pipeline_benchmark --update-baseline
+"""
+from contextlib import redirect_stdout
+from dataclasses import asdict, dataclass
+from functools import partial
+from pathlib import Path
+from threading import Lock
+from time import perf_counter
+from typing import Any, Callable, Optional
+from unittest.mock import patch
+import argparse
+import io
+import json
+import math
+import sys
+
+from boto3.dynamodb.types import TypeSerializer
+
+from alexa_red_alert.alert import parse_alert
+from alexa_red_alert.alert_checker import AlertChecker
+from alexa_red_alert.data_table import DataTable
+from alexa_red_alert.response_cache import ResponseCache
+from benchmarks.oref_stand_in import (
+    OrefStandIn,
+    create_raw_alert,
+    create_raw_alert_categories,
+    create_raw_districts,
+)
+from tests import (
+    create_data_table,
+    create_local_dynamodb_client,
+    create_local_dynamodb_table,
+    reset_local_dynamodb,
+)
+
+BASELINE_PATH = Path(__file__).parent / "baseline.json"
+UPSERT_DISTRICT_COUNTS = [1, 50, 500]
+STATUS_QUERIES = {
+    "all": {},
+    "area_ids": {"a": ["0", "1", "2"]},
+    "district_ids": {"d": ["0", "30", "60"]},
+    "full": {"full": ["1"]},
+    "exists_only": {"exists_only": ["1"]},
+}
+
+
+@dataclass
+class CaseResult:
+    p50_ms: float
+    p99_ms: float
+    # Requests to DynamoDB, oref and SNS, per call
+    requests: float
+
+
+class RequestCounter:
+    def __init__(self) -> None:
+        self.count = 0
+        self._lock = Lock()
+
+    def increment(self, **_: Any) -> None:
+        # Also called from the upsert and query workers
+        with self._lock:
+            self.count += 1
+
+
+class StubSnsClient:
+    def __init__(self, counter: RequestCounter):
+        self._counter = counter
+
+    def publish_batch(self, **_: Any) -> dict[str, Any]:
+        self._counter.increment()
+        return {"Failed": []}
+
+
+def percentile(timings_ms: list[float], percent: float) -> float:
+    # Nearest rank, so p99 of few iterations is the slowest one
+    ordered = sorted(timings_ms)
+    return ordered[max(math.ceil(len(ordered) * percent / 100) - 1, 0)]
+
+
+def measure(
+    run: Callable[[], Any],
+    count_requests: Callable[[], int],
+    iterations: int,
+    warmup: int,
+) -> CaseResult:
+    for _ in range(warmup):
+        run()
+
+    timings_ms = []
+    requests_before = count_requests()
+    for _ in range(iterations):
+        start = perf_counter()
+        run()
+        timings_ms.append((perf_counter() - start) * 1000)
+
+    return CaseResult(
+        p50_ms=round(percentile(timings_ms, 50), 3),
+        p99_ms=round(percentile(timings_ms, 99), 3),
+        requests=round((count_requests() - requests_before) / iterations, 2),
+    )
+
+
+def find_regressions(
+    results: dict[str, CaseResult],
+    baseline: dict[str, dict[str, float]],
+    tolerance: float,
+) -> list[str]:
+    regressions = []
+
+    for name, result in results.items():
+        if not (expected := baseline.get(name)):
+            continue
+
+        # Request counts are deterministic, any increase is a regression
+        if result.requests > expected["requests"]:
+            regressions.append(
+                f"{name}: {result.requests} requests, baseline {expected['requests']}"
+            )
+        for key in ("p50_ms", "p99_ms"):
+            if getattr(result, key) > expected[key] * (1 + tolerance):
+                regressions.append(
+                    f"{name}: {key}={getattr(result, key)}, baseline {expected[key]}"
+                )
+
+    return regressions
+
+
+def create_cases(
+    stand_in: OrefStandIn, table: Any, counter: RequestCounter, locations: int
+) -> dict[str, Callable[[], Any]]:
+    # Imported after tests, which sets the environment the handlers read at import
+    # pylint: disable=import-outside-toplevel
+    from alexa_red_alert import get_status_api, notifier
+
+    raw_alert = create_raw_alert(
+        "133475305490000000", [f"מחוז {i}" for i in range(locations)]
+    )
+    stand_in.set_alert(raw_alert)
+    alert_checker = AlertChecker(base_url=stand_in.base_url)
+    alert_checker.load_metadata()
+    # Past the first scan, which hands out every location, scans are steady state
+    alert_checker.scan()
+    alert = parse_alert(raw_alert)
+    districts = alert_checker.get_districts(alert)
+    alert_category = alert_checker.get_alert_category(alert)
+
+    # Every upsert writes, like the first scan of a new alert
+    data_table = DataTable(table=table, re_alert_at_s=0)
+    data_table.upsert_alert(alert, districts, alert_category)
+    get_status_api.DATA_TABLE = DataTable(table=table)
+    # Every request reads, like the first device asking each question
+    get_status_api.RESPONSE_CACHE = ResponseCache(ttl_s=0)
+
+    image = TypeSerializer().serialize(
+        table.get_item(Key={"pk": "AREA#0", "sk": "DISTRICT#0#CATEGORY#missilealert"})[
+            "Item"
+        ]
+    )["M"]
+    records = [
+        {
+            "eventName": "INSERT",
+            "dynamodb": {"SequenceNumber": str(i), "NewImage": image},
+        }
+        for i in range(100)
+    ]
+    patch.object(notifier, "get_sns_client", lambda: StubSnsClient(counter)).start()
+
+    cases: dict[str, Callable[[], Any]] = {
+        "parse_alert": partial(parse_alert, raw_alert),
+        "get_districts": partial(alert_checker.get_districts, alert),
+        "scan_unchanged": alert_checker.scan,
+    }
+    for count in UPSERT_DISTRICT_COUNTS:
+        cases[f"upsert_alert_{count}"] = partial(
+            data_table.upsert_alert, alert, districts[:count], alert_category
+        )
+    for name, params in STATUS_QUERIES.items():
+        cases[f"get_status_api_{name}"] = partial(
+            get_status_api.lambda_handler,
+            {"multiValueQueryStringParameters": params, "headers": {}},
+            None,
+        )
+    cases["notifier_get_message"] = partial(notifier.get_message, records[0])
+    cases["notifier_lambda_handler_100"] = partial(
+        notifier.lambda_handler, {"Records": records}, None
+    )
+
+    return cases
+
+
+def print_results(
+    results: dict[str, CaseResult], baseline: dict[str, dict[str, float]]
+) -> None:
+    for name, result in results.items():
+        expected = baseline.get(name)
+        compared = (
+            f" (baseline p50={expected['p50_ms']}ms p99={expected['p99_ms']}ms "
+            f"requests={expected['requests']})"
+            if expected
+            else ""
+        )
+        print(
+            f"{name}: p50={result.p50_ms}ms p99={result.p99_ms}ms "
+            f"requests={result.requests}{compared}"
+        )
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--districts", type=int, default=1500)
+    parser.add_argument("--locations", type=int, default=500)
+    # Timings against a local database are noisy, request counts are not
+    parser.add_argument("--tolerance", type=float, default=0.5)
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args(argv)
+
+    client = create_local_dynamodb_client()
+    reset_local_dynamodb(client)
+    create_data_table(client)
+    table = create_local_dynamodb_table()
+    counter = RequestCounter()
+    table.meta.client.meta.events.register("before-call.dynamodb", counter.increment)
+
+    with OrefStandIn(
+        create_raw_districts(args.districts), create_raw_alert_categories()
+    ) as stand_in:
+        # The handlers log every call, which would be most of what is measured
+        with redirect_stdout(io.StringIO()):
+            cases = create_cases(stand_in, table, counter, args.locations)
+            results = {
+                name: measure(
+                    run,
+                    lambda: counter.count + stand_in.requests,
+                    args.iterations,
+                    args.warmup,
+                )
+                for name, run in cases.items()
+            }
+
+    baseline = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+    print_results(results, baseline)
+
+    if args.update_baseline:
+        args.baseline.write_text(
+            json.dumps(
+                {name: asdict(result) for name, result in results.items()}, indent=2
+            )
+            + "\n"
+        )
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if regressions := find_regressions(results, baseline, args.tolerance):
+        print("Regressions:", *regressions, sep="\n")
+        return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
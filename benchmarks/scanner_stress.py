@@ -0,0 +1,107 @@
+"""Stress the scanner against the oref stand-in and DynamoDB Local.
+
+Replays a scenario (see benchmarks.oref_replay) at an accelerated speed while scanning
+back to back, and reports scan throughput, how long after a payload was served its
+locations were written, and the rows written, e.g.
+python -m benchmarks.scanner_stress --scenario rolling_barrage --speed 20
+"""
+from contextlib import redirect_stdout
+from pathlib import Path
+from statistics import median
+from time import monotonic
+import argparse
+import io
+
+from alexa_red_alert.alert_checker import AlertChecker, ScanStatus
+from alexa_red_alert.data_table import DataTable
+from alexa_red_alert.metrics import Metrics
+from benchmarks.oref_replay import SCENARIOS, Replayer, read_recording
+from benchmarks.oref_stand_in import OrefStandIn, create_raw_alert_categories, create_raw_districts
+from benchmarks.pipeline_benchmark import RequestCounter, percentile
+from tests import (
+    create_data_table,
+    create_local_dynamodb_client,
+    create_local_dynamodb_table,
+    reset_local_dynamodb,
+)
+
+HANDLED_STATUSES = {ScanStatus.NEW_ALERT, ScanStatus.NEW_LOCATIONS, ScanStatus.RE_ALERT}
+
+
+def main() -> None:
+    # Imported after tests, which sets the environment the scanner reads at import
+    # pylint: disable=import-outside-toplevel
+    from alexa_red_alert import scanner
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--scenario", choices=SCENARIOS, default="rolling_barrage")
+    parser.add_argument("--recording", type=Path)
+    parser.add_argument("--speed", type=float, default=10)
+    parser.add_argument("--districts", type=int, default=1500)
+    args = parser.parse_args()
+
+    client = create_local_dynamodb_client()
+    reset_local_dynamodb(client)
+    create_data_table(client)
+    table = create_local_dynamodb_table()
+    counter = RequestCounter()
+    table.meta.client.meta.events.register("before-call.dynamodb", counter.increment)
+
+    districts = create_raw_districts(args.districts)
+    steps = (
+        read_recording(args.recording)
+        if args.recording
+        else SCENARIOS[args.scenario]([district["label_he"] for district in districts])
+    )
+
+    with OrefStandIn(districts, create_raw_alert_categories()) as stand_in:
+        scanner.ALERT_CHECKER = AlertChecker(base_url=stand_in.base_url)
+        scanner.ALERT_CHECKER.load_metadata()
+        scanner.DATA_TABLE = DataTable(table=table)
+        replayer = Replayer(stand_in, steps, args.speed)
+
+        scan_ms: list[float] = []
+        lags_ms: list[float] = []
+        written = failures = 0
+        start = monotonic()
+        replayer.start()
+
+        # The scanner logs every scan, which would be most of what is measured
+        with redirect_stdout(io.StringIO()):
+            while not replayer.done:
+                scan_start = monotonic()
+                # The payload this scan can see at the latest
+                served_at = replayer.served_at[-1] if replayer.served_at else None
+                metrics = Metrics("scanner")
+                try:
+                    status = scanner.scan_once(verbose=False, metrics=metrics)
+                except Exception:
+                    failures += 1
+                    continue
+                finally:
+                    scan_ms.append((monotonic() - scan_start) * 1000)
+
+                if status in HANDLED_STATUSES and served_at is not None:
+                    lags_ms.append((monotonic() - served_at) * 1000)
+                    written += int(metrics.values.get("written_districts", 0))
+
+        elapsed_s = monotonic() - start
+
+    print(
+        f"{len(steps)} steps at {args.speed}x in {elapsed_s:.1f}s: "
+        f"{len(scan_ms) / elapsed_s:.1f} scans/s, failures={failures}, "
+        f"scan p50={median(scan_ms):.1f}ms p99={percentile(scan_ms, 99):.1f}ms"
+    )
+    if lags_ms:
+        print(
+            f"served to written: count={len(lags_ms)} p50={median(lags_ms):.0f}ms "
+            f"p99={percentile(lags_ms, 99):.0f}ms max={max(lags_ms):.0f}ms"
+        )
+    print(
+        f"rows written={written}, DynamoDB requests={counter.count}, "
+        f"oref requests={stand_in.requests}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Compare encoding /status payloads with DecimalEncoder vs serialization.
+
+python -m benchmarks.serialization_benchmark --alerts 500
+"""
+from decimal import Decimal
+from functools import partial
+from timeit import timeit
+from typing import Any
+import argparse
+import json
+
+from alexa_red_alert.alert_status import StatusView, parse_alert_status
+from alexa_red_alert.serialization import dumps_orjson, dumps_stdlib
+
+
+class DecimalEncoder(json.JSONEncoder):
+    # The encoder get_status_api used before serialization
+    def default(self, o: Any) -> Any:
+        if isinstance(o, Decimal):
+            return str(o)
+
+        return super().default(o)
+
+
+def create_payload(alerts: int) -> dict[str, Any]:
+    return {
+        "alerts": [
+            {
+                "pk": f"AREA#{i % 30}",
+                "sk": f"DISTRICT#{i}#CATEGORY#missilealert",
+                "created_at_s": Decimal("1577836800"),
+                "expires_at_s": Decimal("1577837760"),
+                "re_alert_at_s": Decimal("1577836920"),
+                "alert_id": "133475305490000000",
+                "district": {
+                    "area_name": "עוטף עזה",
+                    "area_id": str(i % 30),
+                    "district_id": str(i),
+                    "english_name": f"District {i}",
+                    "hebrew_name": f"מחוז {i}",
+                    "code": "91C0EAB7E2C14C370DEDF2B2FFE06635",
+                    "migun_time_s": Decimal("15"),
+                },
+                "alert_category": {
+                    "category_id": Decimal("1"),
+                    "code_name": "missilealert",
+                    "duration_minutes": Decimal("10"),
+                    "label": "ירי רקטות וטילים",
+                    "description": "היכנסו למרחב המוגן",
+                },
+            }
+            for i in range(alerts)
+        ],
+        "exists": True,
+        "full": True,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--alerts", type=int, default=500)
+    parser.add_argument("--number", type=int, default=200)
+    args = parser.parse_args()
+
+    full = create_payload(args.alerts)
+    # Summaries hold the ints parsed into AlertStatus, there are no Decimals left
+    summary = {
+        "alerts": [
+            {
+                "area": status.area,
+                "district_id": status.district_id,
+                "migun_time_s": str(status.migun_time_s),
+                "created_at_s": str(status.created_at_s),
+            }
+            for status in (
+                parse_alert_status(item, StatusView.SUMMARY) for item in full["alerts"]
+            )
+        ],
+        "exists": True,
+        "full": False,
+    }
+
+    for payload_name, payload in [("full", full), ("summary", summary)]:
+        for name, encode in [
+            ("DecimalEncoder", partial(json.dumps, payload, cls=DecimalEncoder)),
+            ("stdlib", partial(dumps_stdlib, payload)),
+            ("orjson", partial(dumps_orjson, payload)),
+        ]:
+            per_payload_ms = timeit(encode, number=args.number) / args.number * 1000
+            print(f"{payload_name} {name}: {per_payload_ms:.2f}ms per payload")
+
+
+if __name__ == "__main__":
+    main()
@@ -19,6 +19,23 @@ echo "-- Packaging code for lambda"
 rm -rf .dist
 mkdir -p .dist
 cp -R alexa_red_alert .dist
+# Built for the functions' arm64 runtime, not the machine deploying
+pip install \
+  --quiet \
+  --target .dist \
+  --platform manylinux2014_aarch64 \
+  --implementation cp \
+  --python-version 3.11 \
+  --only-binary=:all: \
+  -r requirements.txt
+
+echo "-- Bundling metadata snapshot"
+# Optional, oref geo-blocks some deploy machines and the functions fetch metadata live
+# without a snapshot
+if ! python -m alexa_red_alert.metadata_snapshot .dist/alexa_red_alert/metadata_snapshot.pickle; then
+  echo "WARNING: Couldn't build the metadata snapshot, deploying without it" >&2
+  rm -f .dist/alexa_red_alert/metadata_snapshot.pickle
+fi
 
 aws cloudformation package \
   --template-file "./infrastructure/resources.cf.yaml" \
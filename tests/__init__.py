@@ -3,6 +3,15 @@ import os
 
 import boto3
 
+from alexa_red_alert.data_table import ACTIVE_INDEX_ATTRIBUTES, ACTIVE_INDEX_NAME
+
+# The handler modules read their configuration from the environment at import time
+os.environ.setdefault("DATA_TABLE_NAME", "local-alexa-red-alert-data")
+os.environ.setdefault(
+    "RED_ALERT_TOPIC_ARN", "arn:aws:sns:il-central-1:000000000000:local-red-alert"
+)
+os.environ.setdefault("AWS_DEFAULT_REGION", "il-central-1")
+
 
 def create_local_dynamodb_client(local_port: Optional[int] = None) -> boto3.client:
     port = local_port or int(os.getenv("LOCAL_DYNAMODB_PORT", "8042"))
@@ -43,6 +52,8 @@ def create_data_table(client: boto3.client) -> str:
             {"AttributeName": "pk1", "AttributeType": "S"},
             {"AttributeName": "sk", "AttributeType": "S"},
             {"AttributeName": "sk1", "AttributeType": "S"},
+            {"AttributeName": "active", "AttributeType": "S"},
+            {"AttributeName": "expires_at_s", "AttributeType": "N"},
         ],
         TableName=table_name,
         KeySchema=[
@@ -59,6 +70,17 @@ def create_data_table(client: boto3.client) -> str:
                 ],
                 "Projection": {"ProjectionType": "ALL"},
             },
+            {
+                "IndexName": ACTIVE_INDEX_NAME,
+                "KeySchema": [
+                    {"AttributeName": "active", "KeyType": "HASH"},
+                    {"AttributeName": "expires_at_s", "KeyType": "RANGE"},
+                ],
+                "Projection": {
+                    "ProjectionType": "INCLUDE",
+                    "NonKeyAttributes": ACTIVE_INDEX_ATTRIBUTES,
+                },
+            },
         ],
     )
 
@@ -1,35 +1,489 @@
-# from unittest import TestCase
+from dataclasses import replace
+from threading import Event
+from typing import Any, Optional
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+import json
 
-# import boto3
+from freezegun import freeze_time
 
-# from alexa_red_alert.alert import Alert, parse_alert
-# from alexa_red_alert.alert_checker import AlertChecker
-# from tests import create_local_dynamodb_client, reset_local_dynamodb
+from alexa_red_alert.alert import Alert
+from alexa_red_alert.alert_category import AlertCategory
+from alexa_red_alert.alert_checker import AlertChecker, ScanResult, ScanStatus
+from alexa_red_alert.district import District
+from alexa_red_alert.location_index import build_location_index
+from alexa_red_alert.metadata import Metadata
 
 
-# class AlertCheckerTest(TestCase):
-#     dynamodb_client: boto3.client
+def create_response(
+    status: int = 200,
+    body: Optional[Any] = None,
+    headers: Optional[dict[str, str]] = None,
+) -> MagicMock:
+    response = MagicMock()
+    response.status = status
+    response.data = b"" if body is None else json.dumps(body).encode("utf-8-sig")
+    response.headers = headers or {}
+    return response
 
-#     @classmethod
-#     def setUpClass(cls) -> None:
-#         cls.maxDiff = None
-#         cls.dynamodb_client = create_local_dynamodb_client()
 
-#     def setUp(self) -> None:
-#         reset_local_dynamodb(self.dynamodb_client)
+class AlertCheckerTest(TestCase):
+    def setUp(self) -> None:
+        self.maxDiff = None
 
-#         self.alert_checker = AlertChecker()
+        http_pool_patcher = patch(
+            "alexa_red_alert.alert_checker.HTTP_POOL", autospec=True
+        )
+        self.mock_http_pool = http_pool_patcher.start()
+        self.addCleanup(http_pool_patcher.stop)
 
-#     def test_load_metadata(self) -> None:
-#         self.alert_checker.load_metadata()
-#         alert = parse_alert(
-#             {
-#                 "id": "133412344640000000",
-#                 "cat": "1",
-#                 "title": "ירי רקטות וטילים",
-#                 "data": ["שדרות, איבים, ניר עם", "כפר עזה", "נחל עוז", "סעד", "עלומים"],
-#                 "desc": "היכנסו למרחב המוגן ושהו בו 10 דקות",
-#             }
-#         )
+        self.district = District(
+            english_name="Kfar Aza",
+            code="some-code",
+            district_id="some-district-id",
+            area_id="some-area-id",
+            area_name="some-area-name",
+            hebrew_name="כפר עזה",
+            migun_time_s=15,
+        )
+        self.alert_category = AlertCategory(
+            category_id=1,
+            code_name="missilealert",
+            duration_minutes=10,
+            label="Missiles",
+            description="some-description",
+        )
+        self.metadata = Metadata(
+            location_index=build_location_index([self.district]),
+            alert_categories_by_id={"1": self.alert_category},
+            fetched_at_s=1577836800,
+        )
 
-#         self.alert_checker._save_to_db(alert)
+        self.alert_checker = AlertChecker(
+            metadata_ttl_s=60, min_forced_refresh_interval_s=30, metadata=self.metadata
+        )
+
+        freezer = freeze_time("2020-01-01T00:00:10Z")
+        freezer.start()
+        self.addCleanup(freezer.stop)
+
+        self.raw_alert = {
+            "id": "133412344640000000",
+            "cat": "1",
+            "title": "ירי רקטות וטילים",
+            "data": ["שדרות, איבים, ניר עם", "כפר עזה"],
+            "desc": "היכנסו למרחב המוגן ושהו בו 10 דקות",
+        }
+        self.alert = Alert(
+            alert_id="133412344640000000",
+            alert_category_id="1",
+            title="ירי רקטות וטילים",
+            locations=["שדרות, איבים, ניר עם", "כפר עזה"],
+            description="היכנסו למרחב המוגן ושהו בו 10 דקות",
+        )
+
+    def test_load_metadata(self) -> None:
+        responses = {
+            "GetDistricts.aspx": create_response(
+                body=[
+                    {
+                        "label": "Kfar Aza",
+                        "value": "some-code",
+                        "id": "some-district-id",
+                        "areaid": "some-area-id",
+                        "areaname": "some-area-name",
+                        "label_he": "כפר עזה",
+                        "migun_time": 15,
+                    }
+                ]
+            ),
+            "Leftovers": create_response(
+                body=[
+                    {
+                        "category": 1,
+                        "code": "missilealert",
+                        "duration": 10,
+                        "label": "Missiles",
+                        "description1": "some-description",
+                    }
+                ]
+            ),
+        }
+        self.mock_http_pool.request.side_effect = lambda method, url, headers: next(
+            response for path, response in responses.items() if path in url
+        )
+        alert_checker = AlertChecker()
+
+        alert_checker.load_metadata()
+
+        self.assertTrue(alert_checker.metadata_loaded)
+        self.assertEqual(
+            Metadata(
+                location_index=build_location_index([self.district]),
+                alert_categories_by_id={"1": self.alert_category},
+                fetched_at_s=1577836810,
+            ),
+            alert_checker.metadata,
+        )
+        self.assertEqual(
+            {
+                "districts_fetch_ms",
+                "districts_parse_ms",
+                "alert_categories_fetch_ms",
+                "alert_categories_parse_ms",
+                "location_index_ms",
+                "total_ms",
+            },
+            set(alert_checker.metadata_timings),
+        )
+
+    def test_get_districts(self) -> None:
+        actual = self.alert_checker.get_districts(self.alert, ["כפר עזה"])
+
+        self.assertEqual([self.district], actual)
+
+    def test_get_alert_category(self) -> None:
+        actual = self.alert_checker.get_alert_category(self.alert)
+
+        self.assertEqual(self.alert_category, actual)
+
+    @patch.object(AlertChecker, "load_metadata", autospec=True)
+    def test_get_districts_unknown_location_forces_refresh(
+        self, mock_load_metadata: MagicMock
+    ) -> None:
+        actual = self.alert_checker.get_districts(self.alert)
+        self.alert_checker.wait_for_metadata_refresh()
+
+        self.assertEqual([self.district], actual)
+
+        self.alert_checker.get_districts(self.alert)
+        self.alert_checker.wait_for_metadata_refresh()
+
+        mock_load_metadata.assert_called_once_with(self.alert_checker)
+
+        with freeze_time("2020-01-01T00:01:00Z"):
+            self.alert_checker.get_districts(self.alert)
+            self.alert_checker.wait_for_metadata_refresh()
+
+        self.assertEqual(2, mock_load_metadata.call_count)
+
+    @patch.object(AlertChecker, "refresh_metadata_in_background", autospec=True)
+    def test_scan_retries_unknown_locations(self, _: MagicMock) -> None:
+        self.mock_http_pool.request.return_value = create_response(body=self.raw_alert)
+        scan_result = self.alert_checker.scan()
+        self.alert_checker.get_districts(self.alert, scan_result.new_locations)
+
+        actual_1 = self.alert_checker.scan()
+        actual_2 = self.alert_checker.scan()
+
+        self.assertEqual(
+            ScanResult(
+                status=ScanStatus.NEW_LOCATIONS,
+                alert=self.alert,
+                new_locations=["שדרות, איבים, ניר עם"],
+            ),
+            actual_1,
+        )
+        self.assertEqual(ScanStatus.UNCHANGED, actual_2.status)
+
+    @patch.object(AlertChecker, "load_metadata", autospec=True)
+    def test_get_alert_category_unknown_forces_refresh(
+        self, mock_load_metadata: MagicMock
+    ) -> None:
+        self.alert.alert_category_id = "42"
+
+        with self.assertRaises(KeyError):
+            self.alert_checker.get_alert_category(self.alert)
+        self.alert_checker.wait_for_metadata_refresh()
+
+        mock_load_metadata.assert_called_once_with(self.alert_checker)
+
+    @patch.object(AlertChecker, "load_metadata", autospec=True)
+    def test_scan_refreshes_stale_metadata_in_background(
+        self, mock_load_metadata: MagicMock
+    ) -> None:
+        self.mock_http_pool.request.return_value = create_response()
+
+        self.alert_checker.scan()
+        self.alert_checker.wait_for_metadata_refresh()
+
+        mock_load_metadata.assert_not_called()
+
+        with freeze_time("2020-01-01T00:01:00Z"):
+            actual = self.alert_checker.scan()
+            self.alert_checker.wait_for_metadata_refresh()
+
+        self.assertEqual(ScanResult(status=ScanStatus.UNCHANGED), actual)
+        mock_load_metadata.assert_called_once_with(self.alert_checker)
+
+    @patch.object(AlertChecker, "_get_districts", autospec=True)
+    def test_refresh_failure_keeps_snapshot(
+        self, mock_get_districts: MagicMock
+    ) -> None:
+        mock_get_districts.side_effect = ValueError("Got status of 500")
+
+        self.assertTrue(self.alert_checker.refresh_metadata_in_background(force=True))
+        self.alert_checker.wait_for_metadata_refresh()
+
+        self.assertEqual(self.metadata, self.alert_checker.metadata)
+
+    def test_scan_requires_metadata(self) -> None:
+        with self.assertRaises(RuntimeError):
+            AlertChecker().scan()
+
+    def test_scan_bad_status(self) -> None:
+        self.mock_http_pool.request.return_value = create_response(status=500)
+
+        with self.assertRaises(ValueError):
+            self.alert_checker.scan()
+
+    def test_scan_no_alert(self) -> None:
+        self.mock_http_pool.request.return_value = create_response()
+
+        actual = self.alert_checker.scan()
+
+        self.assertEqual(ScanResult(status=ScanStatus.NO_ALERT), actual)
+
+    def test_scan_new_alert(self) -> None:
+        self.mock_http_pool.request.return_value = create_response(body=self.raw_alert)
+
+        actual = self.alert_checker.scan()
+
+        self.assertEqual(
+            ScanResult(
+                status=ScanStatus.NEW_ALERT,
+                alert=self.alert,
+                new_locations=["שדרות, איבים, ניר עם", "כפר עזה"],
+            ),
+            actual,
+        )
+
+    def test_scan_unchanged_body(self) -> None:
+        self.mock_http_pool.request.return_value = create_response(body=self.raw_alert)
+        self.alert_checker.scan()
+
+        with patch(
+            "alexa_red_alert.alert_checker.parse_alert", autospec=True
+        ) as mock_parse:
+            actual = self.alert_checker.scan()
+
+        self.assertEqual(
+            ScanResult(status=ScanStatus.UNCHANGED, alert=self.alert), actual
+        )
+        mock_parse.assert_not_called()
+
+    def test_scan_not_modified(self) -> None:
+        self.mock_http_pool.request.side_effect = [
+            create_response(
+                body=self.raw_alert,
+                headers={"ETag": '"some-etag"', "Last-Modified": "some-last-modified"},
+            ),
+            create_response(status=304),
+        ]
+        self.alert_checker.scan()
+
+        actual = self.alert_checker.scan()
+
+        self.assertEqual(
+            ScanResult(status=ScanStatus.UNCHANGED, alert=self.alert), actual
+        )
+        request_headers = self.mock_http_pool.request.call_args.kwargs["headers"]
+        self.assertEqual('"some-etag"', request_headers["If-None-Match"])
+        self.assertEqual("some-last-modified", request_headers["If-Modified-Since"])
+
+    def test_scan_same_alert_new_locations(self) -> None:
+        self.mock_http_pool.request.side_effect = [
+            create_response(body=self.raw_alert),
+            create_response(
+                body={**self.raw_alert, "data": ["כפר עזה", "נחל עוז", "סעד"]}
+            ),
+            create_response(body={**self.raw_alert, "data": ["נחל עוז"]}),
+        ]
+        self.alert_checker.scan()
+
+        actual_1 = self.alert_checker.scan()
+        actual_2 = self.alert_checker.scan()
+
+        self.assertEqual(ScanStatus.NEW_LOCATIONS, actual_1.status)
+        self.assertEqual(["נחל עוז", "סעד"], actual_1.new_locations)
+        self.assertEqual(ScanStatus.UNCHANGED, actual_2.status)
+        self.assertEqual([], actual_2.new_locations)
+
+    def test_scan_alert_after_no_alert_is_new(self) -> None:
+        self.mock_http_pool.request.side_effect = [
+            create_response(body=self.raw_alert),
+            create_response(),
+            create_response(body=self.raw_alert),
+        ]
+
+        actual = [self.alert_checker.scan().status for _ in range(3)]
+
+        self.assertEqual(
+            [ScanStatus.NEW_ALERT, ScanStatus.NO_ALERT, ScanStatus.NEW_ALERT], actual
+        )
+
+    def test_scan_hedges_slow_request(self) -> None:
+        release_first = Event()
+
+        def request(**_: Any) -> MagicMock:
+            if self.mock_http_pool.request.call_count == 1:
+                release_first.wait(5)
+                return create_response(body=self.raw_alert, headers={"ETag": '"1"'})
+            return create_response(body=self.raw_alert, headers={"ETag": '"2"'})
+
+        self.mock_http_pool.request.side_effect = request
+        alert_checker = AlertChecker(metadata=self.metadata, default_hedge_after_s=0.01)
+
+        actual = alert_checker.scan()
+        release_first.set()
+
+        self.assertEqual(ScanStatus.NEW_ALERT, actual.status)
+        self.assertTrue(alert_checker.scan_hedged)
+        self.assertEqual(
+            {"requests": 2, "hedged": 1, "hedge_wins": 1},
+            {
+                key: value
+                for key, value in alert_checker.request_stats.items()
+                if not key.endswith("_ms")
+            },
+        )
+        # The winning response is the one remembered
+        self.mock_http_pool.request.side_effect = None
+        self.mock_http_pool.request.return_value = create_response(status=304)
+        alert_checker.scan()
+        self.assertEqual(
+            '"2"',
+            self.mock_http_pool.request.call_args.kwargs["headers"]["If-None-Match"],
+        )
+
+    def test_scan_fast_request_not_hedged(self) -> None:
+        self.mock_http_pool.request.return_value = create_response(body=self.raw_alert)
+
+        self.alert_checker.scan()
+
+        self.assertFalse(self.alert_checker.scan_hedged)
+        request_stats = self.alert_checker.request_stats
+        self.assertEqual(
+            {"requests": 1, "hedged": 0, "hedge_wins": 0},
+            {
+                key: value
+                for key, value in request_stats.items()
+                if not key.endswith("_ms")
+            },
+        )
+        self.assertEqual(request_stats["p50_ms"], request_stats["p99_ms"])
+
+    def test_get_first_seen_at_s(self) -> None:
+        other_alert = replace(self.alert, alert_id="some-other-id")
+        self.mock_http_pool.request.return_value = create_response(body=self.raw_alert)
+
+        self.alert_checker.scan()
+        # A forgotten scan sees the alert as new again, but not for the first time
+        self.alert_checker.forget_last_scan()
+        with freeze_time("2020-01-01T00:00:20Z"):
+            self.alert_checker.scan()
+
+        self.assertEqual(1577836810, self.alert_checker.get_first_seen_at_s(self.alert))
+        self.assertIsNone(self.alert_checker.get_first_seen_at_s(other_alert))
+
+    def test_scan_unparsable_alert_not_remembered(self) -> None:
+        self.mock_http_pool.request.return_value = create_response(
+            body={"id": "some-id"}, headers={"ETag": '"some-etag"'}
+        )
+
+        for _ in range(2):
+            with self.assertRaises(KeyError):
+                self.alert_checker.scan()
+
+        self.assertNotIn(
+            "If-None-Match", self.mock_http_pool.request.call_args.kwargs["headers"]
+        )
+
+    @patch.object(AlertChecker, "refresh_metadata_in_background", autospec=True)
+    def test_scan_re_alert_due(self, _: MagicMock) -> None:
+        other_district = replace(
+            self.district, district_id="other-district-id", hebrew_name="נחל עוז"
+        )
+        alert_checker = AlertChecker(
+            metadata=replace(
+                self.metadata,
+                location_index=build_location_index([self.district, other_district]),
+            )
+        )
+        self.mock_http_pool.request.side_effect = [
+            create_response(body=self.raw_alert),
+            create_response(body={**self.raw_alert, "data": ["כפר עזה", "נחל עוז"]}),
+            create_response(status=304),
+            create_response(status=304),
+            create_response(status=304),
+        ]
+        alert_checker.scan()
+        alert_checker.mark_written(self.alert.alert_id, ["some-district-id"])
+        with freeze_time("2020-01-01T00:01:00Z"):
+            alert_checker.scan()
+            alert_checker.mark_written(self.alert.alert_id, ["other-district-id"])
+
+        with freeze_time("2020-01-01T00:02:00Z"):
+            actual_1 = alert_checker.scan()
+        with freeze_time("2020-01-01T00:02:10Z"):
+            actual_2 = alert_checker.scan()
+            alert_checker.mark_written(self.alert.alert_id, ["some-district-id"])
+        with freeze_time("2020-01-01T00:03:00Z"):
+            actual_3 = alert_checker.scan()
+
+        self.assertEqual(ScanStatus.UNCHANGED, actual_1.status)
+        self.assertEqual(
+            ScanResult(
+                status=ScanStatus.RE_ALERT,
+                alert=Alert(
+                    alert_id="133412344640000000",
+                    alert_category_id="1",
+                    title="ירי רקטות וטילים",
+                    locations=["כפר עזה", "נחל עוז"],
+                    description="היכנסו למרחב המוגן ושהו בו 10 דקות",
+                ),
+                new_locations=["כפר עזה"],
+            ),
+            actual_2,
+        )
+        self.assertEqual(ScanStatus.RE_ALERT, actual_3.status)
+        self.assertEqual(["נחל עוז"], actual_3.new_locations)
+
+    @patch.object(AlertChecker, "refresh_metadata_in_background", autospec=True)
+    def test_scan_re_alert_counts_from_write(self, _: MagicMock) -> None:
+        self.mock_http_pool.request.side_effect = [
+            create_response(body=self.raw_alert),
+            create_response(status=304),
+            create_response(status=304),
+            create_response(status=304),
+        ]
+        self.alert_checker.scan()
+
+        # Not due while the write is pending, then a window after the write
+        with freeze_time("2020-01-01T00:05:00Z"):
+            actual_1 = self.alert_checker.scan()
+            self.alert_checker.mark_written("some-other-alert-id", ["some-district-id"])
+            self.alert_checker.mark_written(self.alert.alert_id, ["some-district-id"])
+        with freeze_time("2020-01-01T00:06:59Z"):
+            actual_2 = self.alert_checker.scan()
+        with freeze_time("2020-01-01T00:07:00Z"):
+            actual_3 = self.alert_checker.scan()
+
+        self.assertEqual(ScanStatus.UNCHANGED, actual_1.status)
+        self.assertEqual(ScanStatus.UNCHANGED, actual_2.status)
+        self.assertEqual(ScanStatus.RE_ALERT, actual_3.status)
+        self.assertEqual(["כפר עזה"], actual_3.new_locations)
+
+    def test_forget_last_scan(self) -> None:
+        self.mock_http_pool.request.return_value = create_response(
+            body=self.raw_alert, headers={"ETag": '"some-etag"'}
+        )
+        self.alert_checker.scan()
+
+        self.alert_checker.forget_last_scan()
+        actual = self.alert_checker.scan()
+
+        self.assertEqual(ScanStatus.NEW_ALERT, actual.status)
+        self.assertNotIn(
+            "If-None-Match", self.mock_http_pool.request.call_args.kwargs["headers"]
+        )
@@ -0,0 +1,68 @@
+from decimal import Decimal
+from unittest import TestCase
+
+from alexa_red_alert.alert_status import AlertStatus, StatusView, get_projection, parse_alert_status
+
+
+class AlertStatusTest(TestCase):
+    def setUp(self) -> None:
+        self.maxDiff = None
+        self.item = {
+            "created_at_s": Decimal("1577836800"),
+            "district": {
+                "area_name": "some-area-name",
+                "area_id": "some-area-id",
+                "district_id": "some-district-id",
+                "migun_time_s": Decimal("15"),
+            },
+            "alert_category": {
+                "label": "some-label",
+                "description": "some-description",
+            },
+        }
+        self.expected = AlertStatus(
+            category="some-label",
+            area="some-area-name",
+            area_id="some-area-id",
+            district_id="some-district-id",
+            migun_time_s=15,
+            created_at_s=1577836800,
+            description="some-description",
+        )
+
+    def test_parse_alert_status_summary(self) -> None:
+        actual = parse_alert_status(self.item, StatusView.SUMMARY)
+
+        self.assertEqual(self.expected, actual)
+
+    def test_parse_alert_status_full(self) -> None:
+        self.expected.item = self.item
+
+        actual = parse_alert_status(self.item, StatusView.FULL)
+
+        self.assertEqual(self.expected, actual)
+
+    def test_get_projection(self) -> None:
+        self.assertEqual({}, get_projection(StatusView.FULL))
+        self.assertEqual(
+            {
+                "ProjectionExpression": (
+                    "#created_at_s, #alert_category.#label, "
+                    "#alert_category.#description, #district.#area_name, "
+                    "#district.#area_id, #district.#district_id, "
+                    "#district.#migun_time_s"
+                ),
+                "ExpressionAttributeNames": {
+                    "#alert_category": "alert_category",
+                    "#area_id": "area_id",
+                    "#area_name": "area_name",
+                    "#created_at_s": "created_at_s",
+                    "#description": "description",
+                    "#district": "district",
+                    "#district_id": "district_id",
+                    "#label": "label",
+                    "#migun_time_s": "migun_time_s",
+                },
+            },
+            get_projection(StatusView.SUMMARY),
+        )
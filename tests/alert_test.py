@@ -1,6 +1,6 @@
 from unittest import TestCase
 
-from alexa_red_alert.alert import Alert, parse_alert
+from alexa_red_alert.alert import Alert, get_published_at_s, parse_alert
 
 
 class AlertTest(TestCase):
@@ -26,3 +26,12 @@ class AlertTest(TestCase):
         actual = parse_alert(raw)
 
         self.assertEqual(expected, actual)
+
+    def test_get_published_at_s(self) -> None:
+        for alert_id, expected in [
+            ("133475305490000000", 1703056949.0),
+            ("some-alert-id", None),
+            ("0", None),
+        ]:
+            with self.subTest(alert_id=alert_id):
+                self.assertEqual(expected, get_published_at_s(alert_id))
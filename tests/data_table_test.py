@@ -1,15 +1,26 @@
 from copy import deepcopy
+from dataclasses import replace
 from decimal import Decimal
+from typing import Any
 from unittest import TestCase
-from unittest.mock import MagicMock, patch
+from unittest.mock import ANY, MagicMock, patch
 
+from boto3.dynamodb.conditions import Attr, Key
+from botocore.exceptions import ClientError
 from freezegun import freeze_time
 import boto3
 
 from alexa_red_alert.alert import Alert
 from alexa_red_alert.alert_category import AlertCategory
-from alexa_red_alert.data_table import DataTable
+from alexa_red_alert.alert_status import AlertStatus, StatusView
+from alexa_red_alert.data_table import (
+    DataTable,
+    UpsertResult,
+    build_expressions,
+    get_active_partition,
+)
 from alexa_red_alert.district import District
+from alexa_red_alert.re_alert_cache import ReAlertCache
 from tests import (
     create_data_table,
     create_local_dynamodb_client,
@@ -67,39 +78,60 @@ class DataTableTest(TestCase):
         self.table = create_local_dynamodb_table()
         self.data_table = DataTable(table=self.table, re_alert_at_s=100)
 
-    @patch("alexa_red_alert.data_table.DataTable", autospec=True)
-    def test_create_from_table_name(self, mock_data_table: MagicMock) -> None:
+    def scan_district_rows(self) -> list[dict[str, Any]]:
+        return self.table.scan(FilterExpression=Attr("pk").begins_with("AREA#"))[
+            "Items"
+        ]
+
+    def test_create_from_table_name(self) -> None:
         mock_dynamodb_resource = MagicMock()
 
         actual = DataTable.create_from_table_name(
             table_name="some-table-name",
             dynamodb_resource=mock_dynamodb_resource,
             re_alert_at_s=42,
+            use_re_alert_cache=False,
         )
 
-        self.assertEqual(mock_data_table.return_value, actual)
+        mock_dynamodb_resource.Table.assert_not_called()
+        self.assertEqual([], actual.resolve_alerts([]))
         mock_dynamodb_resource.Table.assert_called_once_with("some-table-name")
-        mock_data_table.assert_called_once_with(
-            mock_dynamodb_resource.Table.return_value, 42
-        )
 
+    @patch("alexa_red_alert.data_table.Config", autospec=True)
+    @patch("alexa_red_alert.data_table.ReAlertCache", autospec=True)
     @patch("alexa_red_alert.data_table.DataTable", autospec=True)
     @patch("alexa_red_alert.data_table.boto3.resource", autospec=True)
     def test_create_from_table_name_defaults(
-        self, mock_boto3_resource: MagicMock, mock_data_table: MagicMock
+        self,
+        mock_boto3_resource: MagicMock,
+        mock_data_table: MagicMock,
+        mock_re_alert_cache: MagicMock,
+        mock_config: MagicMock,
     ) -> None:
         actual = DataTable.create_from_table_name()
 
         self.assertEqual(mock_data_table.return_value, actual)
+        mock_boto3_resource.assert_not_called()
+        mock_data_table.assert_called_once_with(
+            re_alert_at_s=120,
+            max_workers=10,
+            re_alert_cache=mock_re_alert_cache.return_value,
+            table_factory=ANY,
+        )
+
+        table = mock_data_table.call_args.kwargs["table_factory"]()
+
+        self.assertEqual(mock_boto3_resource.return_value.Table.return_value, table)
+        mock_config.assert_called_once_with(
+            max_pool_connections=10,
+            retries={"mode": "adaptive", "max_attempts": 4},
+        )
         mock_boto3_resource.assert_called_once_with(
-            "dynamodb", region_name="il-central-1"
+            "dynamodb", region_name="il-central-1", config=mock_config.return_value
         )
         mock_boto3_resource.return_value.Table.assert_called_once_with(
             "alexa-red-alert-data-table"
         )
-        mock_data_table.assert_called_once_with(
-            mock_boto3_resource.return_value.Table.return_value, 120
-        )
 
     @freeze_time("2020-01-01")
     def test_upsert_alert(self) -> None:
@@ -107,6 +139,7 @@ class DataTableTest(TestCase):
             alert=self.alert,
             districts=self.districts,
             alert_category=self.alert_category,
+            detected_at_s=1577836799.5,
         )
         expected = [
             {
@@ -114,13 +147,7 @@ class DataTableTest(TestCase):
                 "sk": "DISTRICT#some-district-id-1#CATEGORY#some-code-name",
                 "pk1": "DISTRICT#some-district-id-1",
                 "sk1": "CATEGORY#some-code-name",
-                "alert": {
-                    "description": "some-description",
-                    "locations": ["some-location-1", "some-location-2"],
-                    "title": "some-title",
-                    "alert_category_id": "some-alert-category-id",
-                    "alert_id": "some-alert-id",
-                },
+                "alert_id": "some-alert-id",
                 "district": {
                     "area_name": "some-area-name-1",
                     "code": "some-code-1",
@@ -140,19 +167,16 @@ class DataTableTest(TestCase):
                     "code_name": "some-code-name",
                 },
                 "re_alert_at_s": Decimal("1577836900"),
+                "active": "ACTIVE#1",
+                "detected_at_ms": Decimal("1577836799500"),
+                "written_at_ms": Decimal("1577836800000"),
             },
             {
                 "pk": "AREA#some-area-id-2",
                 "sk": "DISTRICT#some-district-id-2#CATEGORY#some-code-name",
                 "pk1": "DISTRICT#some-district-id-2",
                 "sk1": "CATEGORY#some-code-name",
-                "alert": {
-                    "description": "some-description",
-                    "locations": ["some-location-1", "some-location-2"],
-                    "title": "some-title",
-                    "alert_category_id": "some-alert-category-id",
-                    "alert_id": "some-alert-id",
-                },
+                "alert_id": "some-alert-id",
                 "district": {
                     "area_name": "some-area-name-2",
                     "code": "some-code-2",
@@ -172,10 +196,13 @@ class DataTableTest(TestCase):
                     "code_name": "some-code-name",
                 },
                 "re_alert_at_s": Decimal("1577836900"),
+                "active": "ACTIVE#3",
+                "detected_at_ms": Decimal("1577836799500"),
+                "written_at_ms": Decimal("1577836800000"),
             },
         ]
 
-        actual = self.table.scan()["Items"]
+        actual = self.scan_district_rows()
 
         self.assertCountEqual(expected, actual)
 
@@ -186,13 +213,7 @@ class DataTableTest(TestCase):
                 "sk": "DISTRICT#some-district-id-1#CATEGORY#some-code-name",
                 "pk1": "DISTRICT#some-district-id-1",
                 "sk1": "CATEGORY#some-code-name",
-                "alert": {
-                    "description": "some-description",
-                    "locations": ["some-location-1", "some-location-2"],
-                    "title": "some-title",
-                    "alert_category_id": "some-alert-category-id",
-                    "alert_id": "some-alert-id",
-                },
+                "alert_id": "some-alert-id",
                 "district": {
                     "area_name": "some-area-name-1",
                     "code": "some-code-1",
@@ -212,6 +233,8 @@ class DataTableTest(TestCase):
                     "code_name": "some-code-name",
                 },
                 "re_alert_at_s": Decimal("1577836900"),
+                "active": "ACTIVE#1",
+                "written_at_ms": Decimal("1577836800000"),
             },
         ]
         expected_2 = [
@@ -221,13 +244,7 @@ class DataTableTest(TestCase):
                 "sk": "DISTRICT#some-district-id-2#CATEGORY#some-code-name",
                 "pk1": "DISTRICT#some-district-id-2",
                 "sk1": "CATEGORY#some-code-name",
-                "alert": {
-                    "description": "some-description",
-                    "locations": ["some-location-1", "some-location-2"],
-                    "title": "some-title",
-                    "alert_category_id": "some-alert-category-id",
-                    "alert_id": "some-alert-id",
-                },
+                "alert_id": "some-alert-id",
                 "district": {
                     "area_name": "some-area-name-2",
                     "code": "some-code-2",
@@ -247,6 +264,8 @@ class DataTableTest(TestCase):
                     "code_name": "some-code-name",
                 },
                 "re_alert_at_s": Decimal("1577836930"),
+                "active": "ACTIVE#3",
+                "written_at_ms": Decimal("1577836830000"),
             },
         ]
         expected_3 = deepcopy(expected_2)
@@ -254,6 +273,7 @@ class DataTableTest(TestCase):
             expected["created_at_s"] = Decimal("1577837100")
             expected["expires_at_s"] = Decimal("1577838060")
             expected["re_alert_at_s"] = Decimal("1577837200")
+            expected["written_at_ms"] = Decimal("1577837100000")
 
         with freeze_time("2020-01-01T00:00:00Z"):
             self.data_table.upsert_alert(
@@ -262,7 +282,7 @@ class DataTableTest(TestCase):
                 alert_category=self.alert_category,
             )
 
-        actual_1 = self.table.scan()["Items"]
+        actual_1 = self.scan_district_rows()
 
         self.assertCountEqual(expected_1, actual_1)
 
@@ -273,7 +293,7 @@ class DataTableTest(TestCase):
                 alert_category=self.alert_category,
             )
 
-        actual_2 = self.table.scan()["Items"]
+        actual_2 = self.scan_district_rows()
 
         self.assertCountEqual(expected_2, actual_2)
 
@@ -284,6 +304,432 @@ class DataTableTest(TestCase):
                 alert_category=self.alert_category,
             )
 
-        actual_3 = self.table.scan()["Items"]
+        actual_3 = self.scan_district_rows()
 
         self.assertCountEqual(expected_3, actual_3)
+
+    def test_upsert_alert_result(self) -> None:
+        with freeze_time("2020-01-01T00:00:00Z"):
+            actual_1 = self.data_table.upsert_alert(
+                alert=self.alert,
+                districts=self.districts[0:1],
+                alert_category=self.alert_category,
+            )
+
+        self.assertEqual(
+            UpsertResult(
+                written_district_ids=["some-district-id-1"],
+                suppressed_district_ids=[],
+            ),
+            actual_1,
+        )
+
+        with freeze_time("2020-01-01T00:00:30Z"):
+            actual_2 = self.data_table.upsert_alert(
+                alert=self.alert,
+                districts=self.districts,
+                alert_category=self.alert_category,
+            )
+
+        self.assertEqual(
+            UpsertResult(
+                written_district_ids=["some-district-id-2"],
+                suppressed_district_ids=["some-district-id-1"],
+            ),
+            actual_2,
+        )
+
+    def test_upsert_alert_no_districts(self) -> None:
+        actual = self.data_table.upsert_alert(
+            alert=self.alert, districts=[], alert_category=self.alert_category
+        )
+
+        self.assertEqual(UpsertResult(), actual)
+
+    def test_upsert_alert_errors_raised(self) -> None:
+        mock_table = MagicMock()
+        mock_client = mock_table.meta.client
+        mock_client.exceptions.ConditionalCheckFailedException = type(
+            "ConditionalCheckFailedException", (Exception,), {}
+        )
+        mock_client.update_item.side_effect = ClientError(
+            {"Error": {"Code": "ValidationException"}}, "UpdateItem"
+        )
+        data_table = DataTable(table=mock_table)
+
+        with self.assertRaises(ClientError):
+            data_table.upsert_alert(
+                alert=self.alert,
+                districts=self.districts,
+                alert_category=self.alert_category,
+            )
+
+        self.assertEqual(2, mock_client.update_item.call_count)
+
+    def test_upsert_alert_re_alert_cache(self) -> None:
+        re_alert_cache = ReAlertCache()
+        data_table = DataTable(
+            table=self.table, re_alert_at_s=100, re_alert_cache=re_alert_cache
+        )
+
+        with freeze_time("2020-01-01T00:00:00Z"):
+            data_table.upsert_alert(
+                alert=self.alert,
+                districts=self.districts[0:1],
+                alert_category=self.alert_category,
+            )
+
+        self.assertEqual(
+            1577836900,
+            re_alert_cache.get("some-district-id-1", "some-code-name", 1577836800),
+        )
+
+        with freeze_time("2020-01-01T00:00:30Z"), patch.object(
+            self.table.meta.client,
+            "update_item",
+            wraps=self.table.meta.client.update_item,
+        ) as mock_update_item:
+            actual = data_table.upsert_alert(
+                alert=self.alert,
+                districts=self.districts,
+                alert_category=self.alert_category,
+            )
+
+        self.assertEqual(
+            UpsertResult(
+                written_district_ids=["some-district-id-2"],
+                suppressed_district_ids=["some-district-id-1"],
+            ),
+            actual,
+        )
+        mock_update_item.assert_called_once()
+
+    @freeze_time("2020-01-01T00:00:30Z")
+    def test_upsert_alert_re_alert_cache_filled_from_rejected_write(self) -> None:
+        with freeze_time("2020-01-01T00:00:00Z"):
+            self.data_table.upsert_alert(
+                alert=self.alert,
+                districts=self.districts[0:1],
+                alert_category=self.alert_category,
+            )
+
+        re_alert_cache = ReAlertCache()
+        data_table = DataTable(
+            table=self.table, re_alert_at_s=100, re_alert_cache=re_alert_cache
+        )
+
+        actual = data_table.upsert_alert(
+            alert=self.alert,
+            districts=self.districts[0:1],
+            alert_category=self.alert_category,
+        )
+
+        self.assertEqual(
+            UpsertResult(suppressed_district_ids=["some-district-id-1"]), actual
+        )
+        self.assertEqual(
+            1577836900,
+            re_alert_cache.get("some-district-id-1", "some-code-name", 1577836830),
+        )
+
+    @freeze_time("2020-01-01T00:00:00Z")
+    def test_get_status_all(self) -> None:
+        self.data_table.upsert_alert(
+            alert=self.alert,
+            districts=self.districts,
+            alert_category=self.alert_category,
+        )
+        self.table.update_item(
+            Key={
+                "pk": "AREA#some-area-id-2",
+                "sk": "DISTRICT#some-district-id-2#CATEGORY#some-code-name",
+            },
+            UpdateExpression="SET expires_at_s = :expires_at_s",
+            ExpressionAttributeValues={":expires_at_s": 1577836799},
+        )
+
+        actual = list(self.data_table.get_status_all())
+
+        self.assertEqual(["some-area-id-1"], [status.area_id for status in actual])
+
+    @freeze_time("2020-01-01T00:00:00Z")
+    def test_backfill_active_index(self) -> None:
+        for district_id, expires_at_s in [
+            ("some-district-id-1", 1577837760),
+            ("some-district-id-2", 1577836799),
+        ]:
+            self.table.put_item(
+                Item={
+                    "pk": "AREA#some-area-id",
+                    "sk": f"DISTRICT#{district_id}#CATEGORY#some-code-name",
+                    "expires_at_s": expires_at_s,
+                }
+            )
+        # Written before the index was sharded
+        self.table.put_item(
+            Item={
+                "pk": "AREA#some-area-id",
+                "sk": "DISTRICT#some-district-id-3#CATEGORY#some-code-name",
+                "expires_at_s": 1577837760,
+                "active": "ACTIVE",
+            }
+        )
+
+        self.assertEqual(2, self.data_table.backfill_active_index())
+        self.assertEqual(0, self.data_table.backfill_active_index())
+        self.assertEqual(
+            {
+                "DISTRICT#some-district-id-1#CATEGORY#some-code-name": "ACTIVE#1",
+                "DISTRICT#some-district-id-3#CATEGORY#some-code-name": "ACTIVE#5",
+            },
+            {
+                item["sk"]: item["active"]
+                for item in self.table.scan()["Items"]
+                if "active" in item
+            },
+        )
+
+    @freeze_time("2020-01-01T00:00:00Z")
+    def test_get_status_all_shards(self) -> None:
+        districts = [
+            replace(self.districts[0], district_id=f"some-district-id-{i}")
+            for i in range(20)
+        ]
+        self.data_table.upsert_alert(
+            alert=self.alert,
+            districts=districts,
+            alert_category=self.alert_category,
+        )
+
+        actual = list(self.data_table.get_status_all())
+
+        self.assertLess(
+            1,
+            len({get_active_partition(district.district_id) for district in districts}),
+        )
+        self.assertTrue(self.data_table.has_status_all())
+        self.assertEqual(
+            sorted(district.district_id for district in districts),
+            sorted(status.district_id for status in actual),
+        )
+        # The index holds what the views read, not the write bookkeeping
+        self.assertNotIn("re_alert_at_s", actual[0].item or {})
+        self.assertEqual(self.alert.alert_id, (actual[0].item or {})["alert_id"])
+
+    @freeze_time("2020-01-01T00:00:00Z")
+    def test_get_status_by_district_ids(self) -> None:
+        self.data_table.upsert_alert(
+            alert=self.alert,
+            districts=self.districts,
+            alert_category=self.alert_category,
+        )
+
+        actual = list(
+            self.data_table.get_status_by_district_ids(
+                [
+                    "some-district-id-2",
+                    "some-unknown-district-id",
+                    "some-district-id-1",
+                    "some-district-id-2",
+                ]
+            )
+        )
+
+        self.assertEqual(
+            ["some-district-id-2", "some-district-id-1"],
+            [status.district_id for status in actual],
+        )
+
+    @freeze_time("2020-01-01T00:00:00Z")
+    def test_get_status_summary(self) -> None:
+        self.data_table.upsert_alert(
+            alert=self.alert,
+            districts=self.districts[0:1],
+            alert_category=self.alert_category,
+        )
+        expected = AlertStatus(
+            category="some-label-1",
+            area="some-area-name-1",
+            area_id="some-area-id-1",
+            district_id="some-district-id-1",
+            migun_time_s=100,
+            created_at_s=1577836800,
+            description="some-description-1",
+        )
+
+        for actual in [
+            self.data_table.get_status_all(StatusView.SUMMARY),
+            self.data_table.get_status_by_area_ids(
+                ["some-area-id-1"], StatusView.SUMMARY
+            ),
+            self.data_table.get_status_by_district_ids(
+                ["some-district-id-1"], StatusView.SUMMARY
+            ),
+        ]:
+            self.assertEqual([expected], list(actual))
+
+    def test_get_status_by_district_ids_empty(self) -> None:
+        self.assertEqual([], list(self.data_table.get_status_by_district_ids([])))
+
+    @freeze_time("2020-01-01T00:00:00Z")
+    def test_get_status_by_area_ids(self) -> None:
+        self.data_table.upsert_alert(
+            alert=self.alert,
+            districts=self.districts,
+            alert_category=self.alert_category,
+        )
+
+        actual = list(
+            self.data_table.get_status_by_area_ids(
+                ["some-area-id-2", "some-area-id-1", "some-area-id-2"]
+            )
+        )
+
+        self.assertEqual(
+            ["some-area-id-2", "some-area-id-1"],
+            [status.area_id for status in actual],
+        )
+
+    @freeze_time("2020-01-01T00:00:00Z")
+    def test_has_status(self) -> None:
+        self.assertFalse(self.data_table.has_status_all())
+
+        self.data_table.upsert_alert(
+            alert=self.alert,
+            districts=self.districts[0:1],
+            alert_category=self.alert_category,
+        )
+        # Expired rows in front of the live one have to be paged past
+        for i in range(3):
+            self.table.put_item(
+                Item={
+                    "pk": "AREA#some-area-id-1",
+                    "sk": f"DISTRICT#some-district-id-0{i}#CATEGORY#some-code-name",
+                    "expires_at_s": 1577836799,
+                }
+            )
+
+        self.assertTrue(self.data_table.has_status_all())
+        self.assertTrue(
+            self.data_table.has_status_by_area_ids(["some-area-id-2", "some-area-id-1"])
+        )
+        self.assertFalse(self.data_table.has_status_by_area_ids(["some-area-id-2"]))
+        self.assertFalse(self.data_table.has_status_by_area_ids([]))
+        self.assertTrue(
+            self.data_table.has_status_by_district_ids(["some-district-id-1"])
+        )
+        self.assertFalse(
+            self.data_table.has_status_by_district_ids(["some-district-id-2"])
+        )
+
+    @freeze_time("2020-01-01T00:00:00Z")
+    def test_has_status_expired_rows_in_one_query(self) -> None:
+        for i in range(20):
+            self.table.put_item(
+                Item={
+                    "pk": "AREA#some-area-id-1",
+                    "sk": f"DISTRICT#some-district-id-{i}#CATEGORY#some-code-name",
+                    "expires_at_s": 1577836799,
+                }
+            )
+        queries = []
+        self.table.meta.client.meta.events.register(
+            "before-call.dynamodb.Query",
+            lambda params, **_: queries.append(params),
+        )
+
+        self.assertFalse(self.data_table.has_status_by_area_ids(["some-area-id-1"]))
+        self.assertEqual(1, len(queries))
+
+    @freeze_time("2020-01-01T00:00:00Z")
+    def test_upsert_alert_stores_alert_once(self) -> None:
+        self.data_table.upsert_alert(
+            alert=self.alert,
+            districts=self.districts,
+            alert_category=self.alert_category,
+        )
+
+        actual = self.table.scan(FilterExpression=Attr("pk").begins_with("ALERT#"))
+
+        self.assertEqual(
+            [
+                {
+                    "pk": "ALERT#some-alert-id",
+                    "sk": "ALERT",
+                    "alert": {
+                        "description": "some-description",
+                        "locations": ["some-location-1", "some-location-2"],
+                        "title": "some-title",
+                        "alert_category_id": "some-alert-category-id",
+                        "alert_id": "some-alert-id",
+                    },
+                    "expires_at_s": Decimal("1577837760"),
+                }
+            ],
+            actual["Items"],
+        )
+
+    @freeze_time("2020-01-01T00:00:00Z")
+    def test_resolve_alerts(self) -> None:
+        self.data_table.upsert_alert(
+            alert=self.alert,
+            districts=self.districts[0:1],
+            alert_category=self.alert_category,
+        )
+        old_item = {"alert": {"alert_id": "some-old-alert-id"}}
+
+        items = [status.item for status in self.data_table.get_status_all()]
+        self.assertNotIn(None, items)
+
+        actual = self.data_table.resolve_alerts(
+            [item for item in items if item is not None] + [old_item]
+        )
+
+        self.assertEqual(
+            ["some-location-1", "some-location-2"], actual[0]["alert"]["locations"]
+        )
+        self.assertEqual(old_item, actual[1])
+
+    @freeze_time("2020-01-01T00:00:00Z")
+    def test_normalize_alert_items(self) -> None:
+        for district_id in ["some-district-id-1", "some-district-id-2"]:
+            self.table.put_item(
+                Item={
+                    "pk": "AREA#some-area-id",
+                    "sk": f"DISTRICT#{district_id}#CATEGORY#some-code-name",
+                    "alert": {"alert_id": "some-alert-id", "locations": ["a", "b"]},
+                    "expires_at_s": 1577837760,
+                    "created_at_s": 1577836800,
+                }
+            )
+
+        self.assertEqual(2, self.data_table.normalize_alert_items())
+        self.assertEqual(0, self.data_table.normalize_alert_items())
+
+        district_rows = self.scan_district_rows()
+        self.assertEqual(
+            [("some-alert-id", False)] * 2,
+            [(item["alert_id"], "alert" in item) for item in district_rows],
+        )
+        self.assertEqual(
+            ["a", "b"],
+            self.data_table.resolve_alerts(district_rows)[0]["alert"]["locations"],
+        )
+
+
+class BuildExpressionsTest(TestCase):
+    def test_build_expressions(self) -> None:
+        actual = build_expressions(
+            KeyConditionExpression=Key("pk").eq("some-pk"),
+            FilterExpression=Attr("expires_at_s").gte(42),
+        )
+
+        self.assertEqual(
+            {
+                "KeyConditionExpression": "#n0 = :v0",
+                "FilterExpression": "#n1 >= :v1",
+                "ExpressionAttributeNames": {"#n0": "pk", "#n1": "expires_at_s"},
+                "ExpressionAttributeValues": {":v0": "some-pk", ":v1": 42},
+            },
+            actual,
+        )
@@ -0,0 +1,223 @@
+from decimal import Decimal
+from typing import Any, Optional
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+import base64
+import gzip
+import json
+
+from alexa_red_alert import get_status_api
+from alexa_red_alert.alert_status import StatusView, parse_alert_status
+from alexa_red_alert.response_cache import ResponseCache
+
+
+class GetStatusApiTest(TestCase):
+    def setUp(self) -> None:
+        self.maxDiff = None
+
+        data_table_patcher = patch(
+            "alexa_red_alert.get_status_api.DATA_TABLE", autospec=True
+        )
+        self.mock_data_table = data_table_patcher.start()
+        self.addCleanup(data_table_patcher.stop)
+        self.mock_data_table.resolve_alerts.side_effect = lambda items: items
+
+        self.response_cache: ResponseCache[get_status_api.StatusBody] = ResponseCache(
+            ttl_s=60
+        )
+        response_cache_patcher = patch(
+            "alexa_red_alert.get_status_api.RESPONSE_CACHE", self.response_cache
+        )
+        response_cache_patcher.start()
+        self.addCleanup(response_cache_patcher.stop)
+
+        self.item = {
+            "created_at_s": Decimal("1577836800"),
+            "district": {
+                "area_name": "some-area-name",
+                "area_id": "some-area-id",
+                "district_id": "some-district-id",
+                "migun_time_s": Decimal("15"),
+            },
+            "alert_category": {
+                "label": "some-label",
+                "description": "some-description",
+            },
+        }
+
+        self.status = parse_alert_status(self.item, StatusView.FULL)
+
+    @staticmethod
+    def create_event(
+        params: dict[str, list[str]], headers: Optional[dict[str, str]] = None
+    ) -> dict[str, Any]:
+        return {"multiValueQueryStringParameters": params, "headers": headers}
+
+    def test_lambda_handler_summary(self) -> None:
+        self.mock_data_table.get_status_all.return_value = iter([self.status])
+
+        actual = get_status_api.lambda_handler(self.create_event({}), MagicMock())
+
+        self.assertEqual(200, actual["statusCode"])
+        self.assertEqual(
+            {
+                "alerts": [
+                    {
+                        "category": "some-label",
+                        "area": "some-area-name",
+                        "area_id": "some-area-id",
+                        "district_id": "some-district-id",
+                        "migun_time_s": "15",
+                        "created_at_s": "1577836800",
+                        "description": "some-description",
+                    }
+                ],
+                "exists": True,
+                "full": False,
+            },
+            json.loads(actual["body"]),
+        )
+
+    def test_lambda_handler_cached_by_normalized_query(self) -> None:
+        self.mock_data_table.get_status_by_area_ids.return_value = iter([])
+
+        get_status_api.lambda_handler(self.create_event({"a": ["2", "1"]}), MagicMock())
+        actual = get_status_api.lambda_handler(
+            self.create_event({"a": ["1", "2", "1"]}), MagicMock()
+        )
+
+        self.assertEqual(
+            {"alerts": [], "exists": False, "full": False}, json.loads(actual["body"])
+        )
+        self.mock_data_table.get_status_by_area_ids.assert_called_once_with(
+            ["1", "2"], StatusView.SUMMARY
+        )
+        self.assertEqual(
+            {"hits": 1, "misses": 1, "coalesced": 0}, self.response_cache.counters
+        )
+
+    def test_lambda_handler_full_cached_separately(self) -> None:
+        self.mock_data_table.get_status_all.side_effect = lambda _: iter([self.status])
+
+        get_status_api.lambda_handler(self.create_event({}), MagicMock())
+        actual = get_status_api.lambda_handler(
+            self.create_event({"full": ["1"]}), MagicMock()
+        )
+
+        self.assertTrue(json.loads(actual["body"])["full"])
+        self.assertEqual(2, self.mock_data_table.get_status_all.call_count)
+
+    def test_lambda_handler_district_ids(self) -> None:
+        self.mock_data_table.get_status_by_district_ids.return_value = iter(
+            [self.status]
+        )
+
+        actual = get_status_api.lambda_handler(
+            self.create_event({"d": ["2", "1", "2"]}), MagicMock()
+        )
+
+        self.assertTrue(json.loads(actual["body"])["exists"])
+        self.mock_data_table.get_status_by_district_ids.assert_called_once_with(
+            ["1", "2"], StatusView.SUMMARY
+        )
+
+    def test_lambda_handler_exists_only(self) -> None:
+        self.mock_data_table.has_status_by_area_ids.return_value = True
+
+        actual = get_status_api.lambda_handler(
+            self.create_event({"a": ["1"], "d": ["2"], "exists_only": ["1"]}),
+            MagicMock(),
+        )
+
+        self.assertEqual({"exists": True}, json.loads(actual["body"]))
+        self.mock_data_table.has_status_by_area_ids.assert_called_once_with(["1"])
+        self.mock_data_table.get_status_by_area_ids.assert_not_called()
+
+    def test_lambda_handler_full_resolves_alerts(self) -> None:
+        self.mock_data_table.get_status_all.return_value = iter([self.status])
+
+        get_status_api.lambda_handler(self.create_event({}), MagicMock())
+        self.mock_data_table.resolve_alerts.assert_not_called()
+
+        get_status_api.lambda_handler(self.create_event({"full": ["1"]}), MagicMock())
+        self.mock_data_table.resolve_alerts.assert_called_once()
+
+    def test_lambda_handler_not_modified(self) -> None:
+        self.mock_data_table.get_status_all.return_value = iter([])
+
+        first = get_status_api.lambda_handler(self.create_event({}), MagicMock())
+        etag = first["headers"]["etag"]
+        actual = get_status_api.lambda_handler(
+            self.create_event({}, {"If-None-Match": f'"other", W/{etag}'}),
+            MagicMock(),
+        )
+
+        self.assertEqual(200, first["statusCode"])
+        self.assertEqual(
+            {"statusCode": 304, "headers": first["headers"], "body": ""}, actual
+        )
+
+    def test_lambda_handler_etag_changes_with_alerts(self) -> None:
+        self.mock_data_table.get_status_all.side_effect = [
+            iter([]),
+            iter([self.status]),
+        ]
+
+        with patch("alexa_red_alert.get_status_api.RESPONSE_CACHE", ResponseCache(0)):
+            first = get_status_api.lambda_handler(self.create_event({}), MagicMock())
+            actual = get_status_api.lambda_handler(
+                self.create_event({}, {"if-none-match": first["headers"]["etag"]}),
+                MagicMock(),
+            )
+
+        self.assertEqual(200, actual["statusCode"])
+        self.assertNotEqual(first["headers"]["etag"], actual["headers"]["etag"])
+
+    @patch("alexa_red_alert.get_status_api.GZIP_MIN_BYTES", 10)
+    def test_lambda_handler_gzip(self) -> None:
+        self.mock_data_table.get_status_all.return_value = iter([self.status])
+
+        actual = get_status_api.lambda_handler(
+            self.create_event({}, {"Accept-Encoding": "gzip, deflate"}), MagicMock()
+        )
+
+        self.assertTrue(actual["isBase64Encoded"])
+        self.assertEqual("gzip", actual["headers"]["content-encoding"])
+        body = json.loads(gzip.decompress(base64.b64decode(actual["body"])))
+        self.assertEqual("some-district-id", body["alerts"][0]["district_id"])
+
+    def test_lambda_handler_small_body_not_gzipped(self) -> None:
+        self.mock_data_table.get_status_all.return_value = iter([])
+
+        actual = get_status_api.lambda_handler(
+            self.create_event({}, {"Accept-Encoding": "gzip"}), MagicMock()
+        )
+
+        self.assertNotIn("content-encoding", actual["headers"])
+        self.assertEqual(
+            {"alerts": [], "exists": False, "full": False}, json.loads(actual["body"])
+        )
+
+    @patch("alexa_red_alert.get_status_api.Metrics.emit", autospec=True)
+    def test_lambda_handler_emits_metrics(self, mock_emit: MagicMock) -> None:
+        self.mock_data_table.get_status_by_area_ids.return_value = iter([self.status])
+
+        for _ in range(2):
+            get_status_api.lambda_handler(
+                self.create_event({"a": ["some-area-id"]}), MagicMock()
+            )
+
+        computed, cached = [call.args[0] for call in mock_emit.call_args_list]
+        self.assertEqual(
+            {
+                "query": "area_ids",
+                "exists_only": False,
+                "full": False,
+                "status_code": 200,
+                "response_cache": {"hits": 0, "misses": 1, "coalesced": 0},
+            },
+            computed.properties,
+        )
+        self.assertEqual({"read_ms", "encode_ms", "total_ms"}, set(computed.values))
+        # Answered from the cache, so no table read is timed
+        self.assertEqual({"total_ms"}, set(cached.values))
@@ -0,0 +1,55 @@
+from unittest import TestCase
+import os
+import subprocess
+import sys
+
+# Time the package's own modules may spend importing a handler, in ms. Third-party
+# imports (boto3, urllib3) are left out, they are the same with or without a regression
+# like creating AWS clients at import time, which alone takes tens of ms.
+IMPORT_BUDGET_MS = 30
+HANDLER_MODULES = [
+    "alexa_red_alert.get_status_api",
+    "alexa_red_alert.notifier",
+    "alexa_red_alert.scanner",
+]
+
+
+def measure_import_ms(module: str) -> dict[str, float]:
+    # A fresh interpreter, so nothing is imported yet, like in a cold Lambda
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        check=True,
+        env={**os.environ, "AWS_ACCESS_KEY_ID": "local", "AWS_SECRET_ACCESS_KEY": ""},
+        text=True,
+    )
+    self_ms_by_module = {}
+
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+
+        self_us, _, name = line.removeprefix("import time:").split("|")
+        self_ms_by_module[name.strip()] = int(self_us) / 1000
+
+    return self_ms_by_module
+
+
+class ImportTimeTest(TestCase):
+    def test_handler_import_time(self) -> None:
+        for module in HANDLER_MODULES:
+            with self.subTest(module=module):
+                self_ms_by_module = measure_import_ms(module)
+                package_ms_by_module = {
+                    name: self_ms
+                    for name, self_ms in self_ms_by_module.items()
+                    if name.startswith("alexa_red_alert")
+                }
+
+                self.assertIn(module, package_ms_by_module)
+                self.assertLess(
+                    sum(package_ms_by_module.values()),
+                    IMPORT_BUDGET_MS,
+                    package_ms_by_module,
+                )
@@ -0,0 +1,53 @@
+from io import StringIO
+from unittest import TestCase
+import json
+import math
+
+from alexa_red_alert.latency_report import collect_latencies, get_histogram, write_report
+
+
+class LatencyReportTest(TestCase):
+    def setUp(self) -> None:
+        self.maxDiff = None
+
+    def test_collect_latencies(self) -> None:
+        lines = [
+            "2023-12-20T07:22:31 some-stream "
+            + json.dumps({"service": "notifier", "write_to_send_ms": [100, 200]}),
+            json.dumps({"service": "notifier", "write_to_send_ms": [300]}),
+            json.dumps({"service": "scanner", "write_to_send_ms": [400]}),
+            "START RequestId: some-request-id",
+            "{not json",
+        ]
+
+        actual = collect_latencies(lines)
+
+        self.assertEqual(
+            {
+                "publish_to_detection_ms": [],
+                "detection_to_write_ms": [],
+                "write_to_send_ms": [100, 200, 300],
+                "publish_to_send_ms": [],
+            },
+            actual,
+        )
+
+    def test_get_histogram(self) -> None:
+        actual = get_histogram([50, 100, 101, 40_000])
+
+        self.assertEqual((100, 2), actual[0])
+        self.assertEqual((250, 1), actual[1])
+        self.assertEqual((math.inf, 1), actual[-1])
+        self.assertEqual(4, sum(count for _, count in actual))
+
+    def test_write_report(self) -> None:
+        out = StringIO()
+
+        write_report({"write_to_send_ms": [100, 200, 300], "other_ms": []}, out)
+
+        lines = out.getvalue().splitlines()
+        self.assertEqual(
+            "write_to_send_ms: count=3 p50=200ms p90=300ms p99=300ms max=300ms",
+            lines[0],
+        )
+        self.assertEqual("other_ms: no messages", lines[-1])
@@ -0,0 +1,26 @@
+from unittest import TestCase
+
+from alexa_red_alert.latency_window import LatencyWindow
+
+
+class LatencyWindowTest(TestCase):
+    def test_percentile(self) -> None:
+        latency_window = LatencyWindow()
+        for latency_s in range(1, 101):
+            latency_window.add(latency_s / 100)
+
+        self.assertEqual(100, len(latency_window))
+        self.assertEqual(0.5, latency_window.percentile(50))
+        self.assertEqual(0.95, latency_window.percentile(95))
+        self.assertEqual(1.0, latency_window.percentile(100))
+
+    def test_percentile_empty(self) -> None:
+        self.assertIsNone(LatencyWindow().percentile(95))
+
+    def test_keeps_latest(self) -> None:
+        latency_window = LatencyWindow(size=2)
+        for latency_s in [3.0, 1.0, 2.0]:
+            latency_window.add(latency_s)
+
+        self.assertEqual(2, len(latency_window))
+        self.assertEqual(2.0, latency_window.percentile(100))
@@ -0,0 +1,73 @@
+from unittest import TestCase
+
+from alexa_red_alert.district import District
+from alexa_red_alert.location_index import (
+    ResolvedLocations,
+    build_location_index,
+    normalize_location_name,
+)
+
+
+def create_district(district_id: str, area_id: str, hebrew_name: str) -> District:
+    return District(
+        english_name=f"District {district_id}",
+        code=f"some-code-{district_id}",
+        district_id=district_id,
+        area_id=area_id,
+        area_name=f"some-area-name-{area_id}",
+        hebrew_name=hebrew_name,
+        migun_time_s=15,
+    )
+
+
+class LocationIndexTest(TestCase):
+    def setUp(self) -> None:
+        self.maxDiff = None
+        self.kfar_aza = create_district("1", "10", "כפר עזה")
+        self.sderot = create_district("2", "10", "שדרות")
+        self.tel_aviv = create_district("3", "20", "תל אביב - מרכז העיר")
+        self.bnei_brak = create_district("4", "20", "בני ברק")
+        self.index = build_location_index(
+            [self.kfar_aza, self.sderot, self.tel_aviv, self.bnei_brak]
+        )
+
+    def test_normalize_location_name(self) -> None:
+        self.assertEqual("ג'לג'וליה", normalize_location_name(" ג׳לג׳וליה "))
+        self.assertEqual(
+            "תל אביב-מרכז העיר", normalize_location_name("תל  אביב – מרכז העיר")
+        )
+        self.assertEqual("district 1", normalize_location_name("District  1"))
+
+    def test_build_location_index(self) -> None:
+        self.assertEqual(
+            {"10": [self.kfar_aza, self.sderot], "20": [self.tel_aviv, self.bnei_brak]},
+            self.index.districts_by_area_id,
+        )
+        self.assertEqual(self.sderot, self.index.districts_by_id["2"])
+
+    def test_resolve(self) -> None:
+        actual = self.index.resolve(
+            [
+                "תל אביב-מרכז העיר",
+                "כפר עזה",
+                "some-unknown-location",
+                "שדרות ",
+                "district 4",
+                "תל אביב - מרכז העיר",
+            ]
+        )
+
+        self.assertEqual(
+            ResolvedLocations(
+                districts_by_area_id={
+                    "20": [self.tel_aviv, self.bnei_brak],
+                    "10": [self.kfar_aza, self.sderot],
+                },
+                unknown_locations=["some-unknown-location"],
+            ),
+            actual,
+        )
+        self.assertEqual(
+            [self.tel_aviv, self.bnei_brak, self.kfar_aza, self.sderot],
+            actual.districts,
+        )
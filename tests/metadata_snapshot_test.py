@@ -0,0 +1,87 @@
+from pathlib import Path
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+import pickle
+
+from alexa_red_alert.alert_category import AlertCategory
+from alexa_red_alert.district import District
+from alexa_red_alert.location_index import build_location_index
+from alexa_red_alert.metadata import Metadata
+from alexa_red_alert.metadata_snapshot import measure_cold_start, read_snapshot, write_snapshot
+
+
+class MetadataSnapshotTest(TestCase):
+    def setUp(self) -> None:
+        self.maxDiff = None
+
+        directory = mkdtemp()
+        self.addCleanup(rmtree, directory)
+        self.path = Path(directory) / "metadata_snapshot.pickle"
+
+        self.metadata = Metadata(
+            location_index=build_location_index(
+                [
+                    District(
+                        english_name="Sapir",
+                        code="91C0EAB7E2C14C370DEDF2B2FFE06635",
+                        district_id="952",
+                        area_id="29",
+                        area_name="Arava",
+                        hebrew_name="ספיר",
+                        migun_time_s=180,
+                    )
+                ]
+            ),
+            alert_categories_by_id={
+                "1": AlertCategory(
+                    category_id=1,
+                    code_name="missilealert",
+                    duration_minutes=10,
+                    label="Missiles",
+                    description="some-description",
+                )
+            },
+            fetched_at_s=1577836800,
+        )
+
+    def test_write_and_read_snapshot(self) -> None:
+        write_snapshot(self.metadata, self.path)
+
+        actual = read_snapshot(self.path)
+
+        self.assertEqual(self.metadata, actual)
+
+    def test_read_snapshot_missing(self) -> None:
+        self.assertIsNone(read_snapshot(self.path))
+
+    def test_read_snapshot_corrupt(self) -> None:
+        self.path.write_bytes(b"not-a-pickle")
+
+        self.assertIsNone(read_snapshot(self.path))
+
+    def test_read_snapshot_wrong_type(self) -> None:
+        self.path.write_bytes(pickle.dumps({"some": "dict"}))
+
+        self.assertIsNone(read_snapshot(self.path))
+
+    @patch("alexa_red_alert.alert_checker.AlertChecker.scan", autospec=True)
+    @patch("alexa_red_alert.alert_checker.AlertChecker.load_metadata", autospec=True)
+    def test_measure_cold_start(
+        self, mock_load_metadata: MagicMock, mock_scan: MagicMock
+    ) -> None:
+        write_snapshot(self.metadata, self.path)
+
+        actual = measure_cold_start(self.path)
+
+        self.assertEqual({"live_metadata_ms", "snapshot_ms"}, set(actual))
+        mock_load_metadata.assert_called_once()
+        self.assertEqual(2, mock_scan.call_count)
+
+    def test_measure_cold_start_without_snapshot(self) -> None:
+        with patch(
+            "alexa_red_alert.alert_checker.AlertChecker.load_metadata", autospec=True
+        ), patch("alexa_red_alert.alert_checker.AlertChecker.scan", autospec=True):
+            with self.assertRaises(RuntimeError):
+                measure_cold_start(self.path)
@@ -0,0 +1,58 @@
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from alexa_red_alert.metrics import Metrics, log_verbose
+
+
+class MetricsTest(TestCase):
+    def test_to_record(self) -> None:
+        metrics = Metrics("some-service")
+        metrics.put("some_count", 3)
+        metrics.put("some_ms", 1.23456, "Milliseconds")
+        metrics.properties["some-property"] = "some-value"
+
+        actual = metrics.to_record(timestamp_ms=1577836800000)
+
+        self.assertEqual(
+            {
+                "_aws": {
+                    "Timestamp": 1577836800000,
+                    "CloudWatchMetrics": [
+                        {
+                            "Namespace": "AlexaRedAlert",
+                            "Dimensions": [["service"]],
+                            "Metrics": [
+                                {"Name": "some_count", "Unit": "Count"},
+                                {"Name": "some_ms", "Unit": "Milliseconds"},
+                            ],
+                        }
+                    ],
+                },
+                "service": "some-service",
+                "some-property": "some-value",
+                "some_count": 3,
+                "some_ms": 1.235,
+            },
+            actual,
+        )
+
+    @patch("alexa_red_alert.metrics.perf_counter", autospec=True)
+    def test_time_adds_up_stages(self, mock_perf_counter: MagicMock) -> None:
+        mock_perf_counter.side_effect = [1.0, 1.5, 2.0, 2.25]
+        metrics = Metrics("some-service")
+
+        for _ in range(2):
+            with metrics.time("some_stage"):
+                pass
+
+        self.assertEqual({"some_stage_ms": 750}, metrics.values)
+        self.assertEqual({"some_stage_ms": "Milliseconds"}, metrics.units)
+
+    @patch("builtins.print", autospec=True)
+    def test_log_verbose(self, mock_print: MagicMock) -> None:
+        for verbose_logging in [False, True]:
+            mock_print.reset_mock()
+            with patch("alexa_red_alert.metrics.VERBOSE_LOGGING", verbose_logging):
+                log_verbose("some-payload")
+
+            self.assertEqual(verbose_logging, mock_print.called)
@@ -0,0 +1,248 @@
+from typing import Any, Optional
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+import json
+
+from boto3.dynamodb.types import TypeSerializer
+from freezegun import freeze_time
+
+from alexa_red_alert import notifier
+
+
+def create_image(district_id: str, alert_id: str, created_at_s: int) -> dict[str, Any]:
+    return TypeSerializer().serialize(
+        {
+            "created_at_s": created_at_s,
+            "district": {
+                "area_name": "some-area-name",
+                "english_name": f"some-english-name-{district_id}",
+                "area_id": "some-area-id",
+                "district_id": district_id,
+            },
+            "alert_category": {
+                "label": "some-label",
+                "description": "some-description",
+            },
+            "alert_id": alert_id,
+        }
+    )["M"]
+
+
+def create_record(
+    sequence_number: str,
+    new_image: dict[str, Any],
+    old_image: Optional[dict[str, Any]] = None,
+) -> dict[str, Any]:
+    dynamodb = {"SequenceNumber": sequence_number, "NewImage": new_image}
+    if old_image is not None:
+        dynamodb["OldImage"] = old_image
+
+    return {"eventName": "MODIFY" if old_image else "INSERT", "dynamodb": dynamodb}
+
+
+class NotifierTest(TestCase):
+    def setUp(self) -> None:
+        get_sns_client_patcher = patch("alexa_red_alert.notifier.get_sns_client")
+        self.mock_sns_client = get_sns_client_patcher.start().return_value
+        self.addCleanup(get_sns_client_patcher.stop)
+        self.mock_sns_client.publish_batch.return_value = {"Failed": []}
+
+    def published_district_ids(self) -> list[list[str]]:
+        return [
+            [
+                json.loads(entry["Message"])["districtId"]
+                for entry in call.kwargs["PublishBatchRequestEntries"]
+            ]
+            for call in self.mock_sns_client.publish_batch.call_args_list
+        ]
+
+    def test_lambda_handler_batches_by_alert(self) -> None:
+        records = [
+            create_record(str(i), create_image(f"d{i}", "some-alert-id", 100))
+            for i in range(12)
+        ]
+        records.insert(1, create_record("99", create_image("d99", "other-id", 100)))
+
+        actual = notifier.lambda_handler({"Records": records}, MagicMock())
+
+        self.assertEqual({"batchItemFailures": []}, actual)
+        self.assertEqual(
+            [[f"d{i}" for i in range(10)], ["d10", "d11"], ["d99"]],
+            self.published_district_ids(),
+        )
+        self.assertEqual(
+            {
+                "createdAtS": 100,
+                "area": "some-area-name",
+                "district": "some-english-name-d0",
+                "areaId": "some-area-id",
+                "districtId": "d0",
+                "alert": "some-label",
+                "description": "some-description",
+                "alertId": "some-alert-id",
+            },
+            json.loads(
+                self.mock_sns_client.publish_batch.call_args_list[0].kwargs[
+                    "PublishBatchRequestEntries"
+                ][0]["Message"]
+            ),
+        )
+
+    def test_lambda_handler_skips_unchanged_records(self) -> None:
+        image = create_image("d1", "some-alert-id", 100)
+
+        actual = notifier.lambda_handler(
+            {"Records": [create_record("1", image, image)]}, MagicMock()
+        )
+
+        self.assertEqual({"batchItemFailures": []}, actual)
+        self.mock_sns_client.publish_batch.assert_not_called()
+
+    def test_lambda_handler_reports_failures(self) -> None:
+        self.mock_sns_client.publish_batch.side_effect = [
+            {"Failed": [{"Id": "1", "Code": "InternalError", "SenderFault": False}]},
+            RuntimeError("some-error"),
+        ]
+        bad_image = create_image("d3", "some-alert-id", 100)
+        del bad_image["district"]
+
+        actual = notifier.lambda_handler(
+            {
+                "Records": [
+                    create_record("1", create_image("d1", "some-alert-id", 100)),
+                    create_record("2", create_image("d2", "some-alert-id", 100)),
+                    create_record("3", bad_image),
+                    create_record("4", create_image("d4", "other-id", 100)),
+                ]
+            },
+            MagicMock(),
+        )
+
+        self.assertEqual(
+            {
+                "batchItemFailures": [
+                    {"itemIdentifier": "3"},
+                    {"itemIdentifier": "2"},
+                    {"itemIdentifier": "4"},
+                ]
+            },
+            actual,
+        )
+
+    def test_lambda_handler_skips_removed_records(self) -> None:
+        actual = notifier.lambda_handler(
+            {
+                "Records": [
+                    {
+                        "eventName": "REMOVE",
+                        "dynamodb": {
+                            "SequenceNumber": "1",
+                            "OldImage": create_image("d1", "some-alert-id", 100),
+                        },
+                    }
+                ]
+            },
+            MagicMock(),
+        )
+
+        self.assertEqual({"batchItemFailures": []}, actual)
+        self.mock_sns_client.publish_batch.assert_not_called()
+
+    def test_lambda_handler_re_alert_notifies(self) -> None:
+        notifier.lambda_handler(
+            {
+                "Records": [
+                    create_record(
+                        "1",
+                        create_image("d1", "some-alert-id", 200),
+                        create_image("d1", "some-alert-id", 100),
+                    )
+                ]
+            },
+            MagicMock(),
+        )
+
+        self.assertEqual([["d1"]], self.published_district_ids())
+
+    def test_lambda_handler_alert_copied_into_row(self) -> None:
+        image = create_image("d1", "some-alert-id", 100)
+        image["alert"] = {"M": {"alert_id": image.pop("alert_id")}}
+
+        notifier.lambda_handler({"Records": [create_record("1", image)]}, MagicMock())
+
+        self.assertEqual(
+            "some-alert-id",
+            json.loads(
+                self.mock_sns_client.publish_batch.call_args.kwargs[
+                    "PublishBatchRequestEntries"
+                ][0]["Message"]
+            )["alertId"],
+        )
+
+    @patch("alexa_red_alert.notifier.Metrics.emit", autospec=True)
+    def test_lambda_handler_emits_metrics(self, mock_emit: MagicMock) -> None:
+        image = create_image("d1", "some-alert-id", 100)
+
+        notifier.lambda_handler(
+            {
+                "Records": [
+                    create_record("1", image),
+                    create_record("2", image, image),
+                ]
+            },
+            MagicMock(),
+        )
+
+        metrics = mock_emit.call_args.args[0]
+        self.assertEqual(
+            {"records": 2, "messages": 1, "failed": 0},
+            {
+                name: value
+                for name, value in metrics.values.items()
+                if not name.endswith("_ms")
+            },
+        )
+        self.assertIn("decode_ms", metrics.values)
+        self.assertIn("publish_ms", metrics.values)
+
+    @freeze_time("2023-12-20T07:22:31Z")
+    @patch("alexa_red_alert.notifier.Metrics.emit", autospec=True)
+    def test_lambda_handler_latencies(self, mock_emit: MagicMock) -> None:
+        image = create_image("d1", "133475305490000000", 1703056950)
+        image["detected_at_ms"] = {"N": "1703056950000"}
+        image["written_at_ms"] = {"N": "1703056950250"}
+
+        notifier.lambda_handler({"Records": [create_record("1", image)]}, MagicMock())
+
+        expected = {
+            "publish_to_send_ms": 2000,
+            "publish_to_detection_ms": 1000,
+            "detection_to_write_ms": 250,
+            "write_to_send_ms": 750,
+        }
+        self.assertEqual(
+            {
+                name: {"DataType": "Number", "StringValue": str(value)}
+                for name, value in expected.items()
+            },
+            self.mock_sns_client.publish_batch.call_args.kwargs[
+                "PublishBatchRequestEntries"
+            ][0]["MessageAttributes"],
+        )
+        self.assertEqual(
+            {name: [value] for name, value in expected.items()},
+            mock_emit.call_args.args[0].value_lists,
+        )
+
+    def test_lambda_handler_latencies_of_old_rows(self) -> None:
+        notifier.lambda_handler(
+            {"Records": [create_record("1", create_image("d1", "some-alert-id", 100))]},
+            MagicMock(),
+        )
+
+        self.assertEqual(
+            {},
+            self.mock_sns_client.publish_batch.call_args.kwargs[
+                "PublishBatchRequestEntries"
+            ][0]["MessageAttributes"],
+        )
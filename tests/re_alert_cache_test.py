@@ -0,0 +1,103 @@
+from threading import Thread
+from unittest import TestCase
+import sys
+
+from alexa_red_alert.re_alert_cache import ReAlertCache
+
+
+class ReAlertCacheTest(TestCase):
+    def setUp(self) -> None:
+        self.maxDiff = None
+        self.re_alert_cache = ReAlertCache(max_entries=2)
+
+    def test_get_miss(self) -> None:
+        self.assertIsNone(self.re_alert_cache.get("some-district-id", "some-code", 100))
+        self.assertFalse(
+            self.re_alert_cache.is_suppressed("some-district-id", "some-code", 100)
+        )
+
+    def test_get_hit(self) -> None:
+        self.re_alert_cache.set("some-district-id", "some-code", 200, 100)
+
+        self.assertEqual(
+            200, self.re_alert_cache.get("some-district-id", "some-code", 199)
+        )
+        self.assertTrue(
+            self.re_alert_cache.is_suppressed("some-district-id", "some-code", 199)
+        )
+        self.assertIsNone(
+            self.re_alert_cache.get("some-district-id", "other-code", 199)
+        )
+
+    def test_get_expired(self) -> None:
+        self.re_alert_cache.set("some-district-id", "some-code", 200, 100)
+
+        self.assertIsNone(self.re_alert_cache.get("some-district-id", "some-code", 200))
+        self.assertEqual(0, len(self.re_alert_cache))
+
+    def test_set_full_prunes_expired(self) -> None:
+        self.re_alert_cache.set("some-district-id-1", "some-code", 150, 100)
+        self.re_alert_cache.set("some-district-id-2", "some-code", 300, 100)
+        self.re_alert_cache.set("some-district-id-3", "some-code", 300, 200)
+
+        self.assertEqual(2, len(self.re_alert_cache))
+        self.assertIsNone(
+            self.re_alert_cache.get("some-district-id-1", "some-code", 200)
+        )
+        self.assertEqual(
+            300, self.re_alert_cache.get("some-district-id-3", "some-code", 200)
+        )
+
+    def test_set_full_drops_new_entries(self) -> None:
+        self.re_alert_cache.set("some-district-id-1", "some-code", 300, 100)
+        self.re_alert_cache.set("some-district-id-2", "some-code", 300, 100)
+        self.re_alert_cache.set("some-district-id-3", "some-code", 300, 100)
+
+        self.assertEqual(2, len(self.re_alert_cache))
+        self.assertIsNone(
+            self.re_alert_cache.get("some-district-id-3", "some-code", 100)
+        )
+
+    def test_clear(self) -> None:
+        self.re_alert_cache.set("some-district-id", "some-code", 200, 100)
+
+        self.re_alert_cache.clear()
+
+        self.assertEqual(0, len(self.re_alert_cache))
+
+    def test_concurrent_set_and_prune(self) -> None:
+        re_alert_cache = ReAlertCache(max_entries=1000)
+        kept: list[str] = []
+
+        def fill(thread_id: int) -> None:
+            # Mostly expired entries, which keep the cache full so that sets prune, and
+            # every 80th one an entry that must survive the pruning
+            for i in range(8000):
+                district_id = f"some-district-id-{thread_id}-{i}"
+                if i % 80 == 0:
+                    kept.append(district_id)
+                    re_alert_cache.set(district_id, "some-code", 1_000_000, 1)
+                else:
+                    re_alert_cache.set(district_id, "some-code", 1, 1)
+
+        threads = [Thread(target=fill, args=(thread_id,)) for thread_id in range(8)]
+        # Switches threads often enough to interleave the sets with pruning
+        switch_interval_s = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setswitchinterval(switch_interval_s)
+
+        self.assertEqual(800, len(kept))
+        self.assertEqual(
+            [],
+            [
+                district_id
+                for district_id in kept
+                if re_alert_cache.get(district_id, "some-code", 1) is None
+            ],
+        )
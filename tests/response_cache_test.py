@@ -0,0 +1,100 @@
+from threading import Event, Thread
+from time import sleep
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+from freezegun import freeze_time
+
+from alexa_red_alert.response_cache import ResponseCache
+
+
+class ResponseCacheTest(TestCase):
+    def setUp(self) -> None:
+        self.maxDiff = None
+        self.response_cache: ResponseCache[str] = ResponseCache(
+            ttl_s=0.5, max_entries=2
+        )
+
+    def test_get_or_compute_hit(self) -> None:
+        compute = MagicMock(return_value="some-body")
+
+        with freeze_time("2020-01-01T00:00:00Z"):
+            actual_1 = self.response_cache.get_or_compute("some-key", compute)
+        with freeze_time("2020-01-01T00:00:00.400Z"):
+            actual_2 = self.response_cache.get_or_compute("some-key", compute)
+
+        self.assertEqual(["some-body", "some-body"], [actual_1, actual_2])
+        compute.assert_called_once_with()
+        self.assertEqual(
+            {"hits": 1, "misses": 1, "coalesced": 0}, self.response_cache.counters
+        )
+
+    def test_get_or_compute_expired(self) -> None:
+        compute = MagicMock(side_effect=["some-body-1", "some-body-2"])
+
+        with freeze_time("2020-01-01T00:00:00Z"):
+            self.response_cache.get_or_compute("some-key", compute)
+        with freeze_time("2020-01-01T00:00:00.500Z"):
+            actual = self.response_cache.get_or_compute("some-key", compute)
+
+        self.assertEqual("some-body-2", actual)
+        self.assertEqual(2, self.response_cache.misses)
+
+    def test_get_or_compute_error_not_cached(self) -> None:
+        compute = MagicMock(side_effect=[ValueError("some-error"), "some-body"])
+
+        with self.assertRaises(ValueError):
+            self.response_cache.get_or_compute("some-key", compute)
+        actual = self.response_cache.get_or_compute("some-key", compute)
+
+        self.assertEqual("some-body", actual)
+
+    def test_get_or_compute_full_evicts(self) -> None:
+        for key in ["some-key-1", "some-key-2", "some-key-3"]:
+            self.response_cache.get_or_compute(key, lambda: "some-body")
+
+        compute = MagicMock(return_value="some-body")
+        self.response_cache.get_or_compute("some-key-3", compute)
+
+        compute.assert_not_called()
+
+    def test_get_or_compute_coalesces_concurrent_requests(self) -> None:
+        started = Event()
+        release = Event()
+        compute_calls = []
+
+        def compute() -> str:
+            compute_calls.append(1)
+            started.set()
+            release.wait(5)
+            return "some-body"
+
+        results: list[str] = []
+        owner = Thread(
+            target=lambda: results.append(
+                self.response_cache.get_or_compute("some-key", compute)
+            )
+        )
+        owner.start()
+        started.wait(5)
+        waiters = [
+            Thread(
+                target=lambda: results.append(
+                    self.response_cache.get_or_compute("some-key", compute)
+                )
+            )
+            for _ in range(3)
+        ]
+        for waiter in waiters:
+            waiter.start()
+        while self.response_cache.coalesced < 3:
+            sleep(0.001)
+        release.set()
+        for thread in [owner, *waiters]:
+            thread.join()
+
+        self.assertEqual(["some-body"] * 4, results)
+        self.assertEqual(1, len(compute_calls))
+        self.assertEqual(
+            {"hits": 0, "misses": 1, "coalesced": 3}, self.response_cache.counters
+        )
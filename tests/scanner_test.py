@@ -0,0 +1,520 @@
+from threading import Event
+from typing import Any
+from unittest import TestCase
+from unittest.mock import ANY, MagicMock, call, patch
+
+from alexa_red_alert import scanner
+from alexa_red_alert.alert import Alert
+from alexa_red_alert.alert_category import AlertCategory
+from alexa_red_alert.alert_checker import ScanResult, ScanStatus
+from alexa_red_alert.data_table import UpsertResult
+from alexa_red_alert.metrics import Metrics
+from alexa_red_alert.write_queue import WriteQueue
+from tests.write_queue_test import create_district
+
+
+class FakeClock:
+    def __init__(self, remaining_ms: float):
+        self.now_s = 0.0
+        self.remaining_ms = remaining_ms
+
+    def monotonic(self) -> float:
+        return self.now_s
+
+    def sleep(self, seconds: float) -> None:
+        self.advance(seconds * 1000)
+
+    def advance(self, ms: float) -> None:
+        self.now_s += ms / 1000
+        self.remaining_ms -= ms
+
+    def get_remaining_time_ms(self) -> int:
+        return int(self.remaining_ms)
+
+
+class ScannerTest(TestCase):
+    def setUp(self) -> None:
+        self.maxDiff = None
+        self.clock = FakeClock(remaining_ms=10_000)
+
+        for target, new in [
+            ("alexa_red_alert.scanner.monotonic", self.clock.monotonic),
+            ("alexa_red_alert.scanner.sleep", self.clock.sleep),
+            ("alexa_red_alert.scanner.random.uniform", lambda a, b: 0.0),
+        ]:
+            patcher = patch(target, new)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.alert_category = AlertCategory(
+            category_id=1,
+            code_name="missilealert",
+            duration_minutes=10,
+            label="Missiles",
+            description="some-description",
+        )
+
+        scan_once_patcher = patch("alexa_red_alert.scanner.scan_once", autospec=True)
+        self.mock_scan_once = scan_once_patcher.start()
+        self.addCleanup(scan_once_patcher.stop)
+
+    def test_lambda_handler_single_scan(self) -> None:
+        actual = scanner.lambda_handler({}, MagicMock())
+
+        self.assertIsNone(actual)
+        self.mock_scan_once.assert_called_once_with()
+
+    def test_run_loop_stops_before_deadline(self) -> None:
+        def scan_once(
+            timeout_s: float, verbose: bool, metrics: Metrics, write_queue: None
+        ) -> ScanStatus:
+            self.assertFalse(verbose)
+            self.assertIsNone(write_queue)
+            metrics.put("some-metric", 1)
+            self.assertLessEqual(timeout_s, 3.0)
+            self.clock.advance(100)
+            return ScanStatus.UNCHANGED
+
+        self.mock_scan_once.side_effect = scan_once
+
+        actual = scanner.run_loop(
+            self.clock.get_remaining_time_ms,
+            interval_ms=500,
+            jitter_ms=0,
+            safety_margin_ms=1000,
+        )
+
+        # 10s budget, 1s margin plus the 100ms slowest iteration, 500ms cadence
+        self.assertEqual({"iterations": 18, "failures": 0}, actual)
+        self.assertGreater(self.clock.remaining_ms, 1000)
+
+    def test_run_loop_continues_after_failures(self) -> None:
+        self.clock.remaining_ms = 2000
+        self.mock_scan_once.side_effect = [
+            ValueError("Got status of 500"),
+            ScanStatus.NO_ALERT,
+        ]
+
+        actual = scanner.run_loop(
+            self.clock.get_remaining_time_ms,
+            interval_ms=500,
+            jitter_ms=0,
+            safety_margin_ms=1000,
+        )
+
+        self.assertEqual({"iterations": 2, "failures": 1}, actual)
+
+    def test_run_loop_stops_after_duration(self) -> None:
+        self.mock_scan_once.return_value = ScanStatus.UNCHANGED
+
+        actual = scanner.run_loop(
+            self.clock.get_remaining_time_ms,
+            interval_ms=500,
+            jitter_ms=0,
+            safety_margin_ms=1000,
+            duration_ms=2000,
+        )
+
+        self.assertEqual({"iterations": 4, "failures": 0}, actual)
+
+    def test_run_loop_request_timeout_within_budget(self) -> None:
+        self.clock.remaining_ms = 2500
+        self.mock_scan_once.return_value = ScanStatus.UNCHANGED
+
+        scanner.run_loop(
+            self.clock.get_remaining_time_ms,
+            interval_ms=500,
+            jitter_ms=0,
+            safety_margin_ms=1000,
+        )
+
+        self.assertEqual(
+            [
+                call(timeout_s=1.5, verbose=False, metrics=ANY, write_queue=None),
+                call(timeout_s=1.0, verbose=False, metrics=ANY, write_queue=None),
+            ],
+            self.mock_scan_once.call_args_list[:2],
+        )
+
+    @patch("alexa_red_alert.scanner.Metrics.emit", autospec=True)
+    def test_run_loop_emits_iteration_metrics(self, mock_emit: MagicMock) -> None:
+        self.clock.remaining_ms = 2000
+
+        def scan_once(metrics: Metrics, **_: Any) -> ScanStatus:
+            metrics.put("scan_fetch_ms", 80, "Milliseconds")
+            self.clock.advance(100)
+            return ScanStatus.UNCHANGED
+
+        self.mock_scan_once.side_effect = scan_once
+
+        scanner.run_loop(
+            self.clock.get_remaining_time_ms,
+            interval_ms=500,
+            jitter_ms=0,
+            safety_margin_ms=1000,
+        )
+
+        metrics = mock_emit.call_args_list[0].args[0]
+        self.assertEqual(
+            {"iteration": 1, "status": "unchanged"},
+            metrics.properties,
+        )
+        self.assertEqual(
+            {"scan_fetch_ms": 80, "iteration_ms": 100, "lag_ms": 0},
+            metrics.values,
+        )
+
+    @patch("alexa_red_alert.scanner.DATA_TABLE")
+    def test_run_loop_pipelined(self, mock_data_table: MagicMock) -> None:
+        self.clock.remaining_ms = 2000
+        alert = Alert(
+            alert_id="some-alert-id",
+            alert_category_id="1",
+            title="some-title",
+            locations=["some-location"],
+            description="some-description",
+        )
+
+        def scan_once(write_queue: WriteQueue, **_: Any) -> ScanStatus:
+            # What a scan finding an alert queues
+            write_queue.put(alert, [create_district("d1")], self.alert_category)
+            self.clock.advance(100)
+            return ScanStatus.NEW_ALERT
+
+        self.mock_scan_once.side_effect = scan_once
+
+        actual = scanner.run_loop(
+            self.clock.get_remaining_time_ms,
+            interval_ms=500,
+            jitter_ms=0,
+            safety_margin_ms=1000,
+            pipelined=True,
+        )
+
+        self.assertEqual({"iterations": 2, "failures": 0}, actual)
+        # Both scans were written, or coalesced into one write if the first was still
+        # queued
+        for upsert_call in mock_data_table.upsert_alert.call_args_list:
+            self.assertEqual(
+                call(
+                    alert,
+                    [create_district("d1")],
+                    self.alert_category,
+                    detected_at_s=None,
+                ),
+                upsert_call,
+            )
+        self.assertIn(mock_data_table.upsert_alert.call_count, (1, 2))
+
+    @patch("alexa_red_alert.scanner.DATA_TABLE")
+    def test_write_batch_puts_back_failures(self, mock_data_table: MagicMock) -> None:
+        write_queue = WriteQueue()
+        alerts = [
+            Alert(
+                alert_id=alert_id,
+                alert_category_id="1",
+                title="some-title",
+                locations=["some-location"],
+                description="some-description",
+            )
+            for alert_id in ["some-alert-id", "other-alert-id"]
+        ]
+        write_queue.put(alerts[0], [create_district("d1")], self.alert_category)
+        write_queue.put(alerts[1], [create_district("d2")], self.alert_category)
+        mock_data_table.upsert_alert.side_effect = [
+            RuntimeError("some-error"),
+            UpsertResult(written_district_ids=["d2"]),
+        ]
+
+        scanner.write_batch(write_queue, write_queue.take(10, timeout_s=0))
+
+        self.assertEqual(
+            ["d1"],
+            [write.district.district_id for write in write_queue.take(10, timeout_s=0)],
+        )
+        self.assertEqual([("other-alert-id", ["d2"], 0.0)], write_queue.take_written())
+
+    @patch("alexa_red_alert.scanner.DATA_TABLE")
+    def test_write_pending_backs_off_and_drops_failing_writes(
+        self, mock_data_table: MagicMock
+    ) -> None:
+        write_queue = WriteQueue(max_attempts=3)
+        write_queue.put(
+            Alert(
+                alert_id="some-alert-id",
+                alert_category_id="1",
+                title="some-title",
+                locations=["some-location"],
+                description="some-description",
+            ),
+            [create_district("d1")],
+            self.alert_category,
+        )
+        mock_data_table.upsert_alert.side_effect = RuntimeError("AccessDenied")
+        stop = Event()
+        stop.set()
+
+        with patch("alexa_red_alert.scanner.sleep") as mock_sleep:
+            scanner.write_pending(write_queue, stop)
+
+        self.assertEqual(3, mock_data_table.upsert_alert.call_count)
+        self.assertEqual([call(0.1), call(0.2), call(0.4)], mock_sleep.call_args_list)
+        self.assertEqual(0, len(write_queue))
+        self.assertEqual(1, write_queue.take_dropped())
+
+    @patch("alexa_red_alert.scanner.run_loop", autospec=True)
+    def test_lambda_handler_loop(self, mock_run_loop: MagicMock) -> None:
+        mock_context = MagicMock()
+
+        actual = scanner.lambda_handler(
+            {"loop": True, "intervalMs": 250, "jitterMs": 50, "durationMs": 55000},
+            mock_context,
+        )
+
+        self.assertEqual(mock_run_loop.return_value, actual)
+        self.assertEqual(
+            [
+                call(
+                    mock_context.get_remaining_time_in_millis,
+                    interval_ms=250,
+                    jitter_ms=50,
+                    duration_ms=55000,
+                    pipelined=False,
+                )
+            ],
+            mock_run_loop.call_args_list,
+        )
+
+
+class ScanOnceTest(TestCase):
+    def setUp(self) -> None:
+        self.maxDiff = None
+
+        alert_checker_patcher = patch("alexa_red_alert.scanner.ALERT_CHECKER")
+        self.mock_alert_checker = alert_checker_patcher.start()
+        self.addCleanup(alert_checker_patcher.stop)
+        self.mock_alert_checker.scan_timings = {}
+        self.mock_alert_checker.scan_hedged = False
+
+        data_table_patcher = patch("alexa_red_alert.scanner.DATA_TABLE")
+        self.mock_data_table = data_table_patcher.start()
+        self.addCleanup(data_table_patcher.stop)
+
+        self.alert_category = AlertCategory(
+            category_id=1,
+            code_name="missilealert",
+            duration_minutes=10,
+            label="Missiles",
+            description="some-description",
+        )
+        self.alert = Alert(
+            alert_id="some-alert-id",
+            alert_category_id="1",
+            title="some-title",
+            locations=["some-location-1", "some-location-2"],
+            description="some-description",
+        )
+        self.districts = [create_district("d1"), create_district("d2")]
+        self.mock_alert_checker.metadata_loaded = True
+        self.mock_alert_checker.get_districts.return_value = self.districts
+        self.mock_alert_checker.get_alert_category.return_value = self.alert_category
+        self.mock_alert_checker.get_first_seen_at_s.return_value = 99.5
+        self.mock_data_table.upsert_alert.return_value = UpsertResult(
+            written_district_ids=["d1", "d2"]
+        )
+
+    def test_scan_once_loads_metadata(self) -> None:
+        self.mock_alert_checker.metadata_loaded = False
+        self.mock_alert_checker.metadata_timings = {}
+        self.mock_alert_checker.scan.return_value = ScanResult(
+            status=ScanStatus.NO_ALERT
+        )
+
+        scanner.scan_once(metrics=Metrics("scanner"))
+
+        self.mock_alert_checker.load_metadata.assert_called_once_with()
+
+    def test_scan_once_nothing_to_write(self) -> None:
+        for status in [ScanStatus.NO_ALERT, ScanStatus.UNCHANGED]:
+            with self.subTest(status=status):
+                self.mock_alert_checker.scan.return_value = ScanResult(
+                    status=status, alert=self.alert
+                )
+
+                actual = scanner.scan_once(metrics=Metrics("scanner"))
+
+                self.assertEqual(status, actual)
+                self.mock_alert_checker.get_districts.assert_not_called()
+                self.mock_data_table.upsert_alert.assert_not_called()
+
+    def test_scan_once_writes_handed_out_locations(self) -> None:
+        for status in [
+            ScanStatus.NEW_ALERT,
+            ScanStatus.NEW_LOCATIONS,
+            ScanStatus.RE_ALERT,
+        ]:
+            with self.subTest(status=status):
+                self.mock_data_table.upsert_alert.reset_mock()
+                self.mock_alert_checker.scan.return_value = ScanResult(
+                    status=status, alert=self.alert, new_locations=["some-location-2"]
+                )
+                metrics = Metrics("scanner")
+
+                actual = scanner.scan_once(timeout_s=2, metrics=metrics)
+
+                self.assertEqual(status, actual)
+                self.mock_alert_checker.scan.assert_called_with(timeout_s=2)
+                self.mock_alert_checker.get_districts.assert_called_with(
+                    self.alert, ["some-location-2"]
+                )
+                self.mock_data_table.upsert_alert.assert_called_once_with(
+                    self.alert, self.districts, self.alert_category, detected_at_s=99.5
+                )
+                self.assertEqual(2, metrics.values["written_districts"])
+                self.assertEqual(0, metrics.values["suppressed_districts"])
+                self.assertEqual(status.value, metrics.properties["scan_status"])
+                self.mock_alert_checker.forget_last_scan.assert_not_called()
+
+    @patch.object(Metrics, "emit", autospec=True)
+    def test_scan_once_emits_own_metrics(self, mock_emit: MagicMock) -> None:
+        self.mock_alert_checker.scan.return_value = ScanResult(
+            status=ScanStatus.UNCHANGED
+        )
+
+        scanner.scan_once()
+
+        mock_emit.assert_called_once_with(ANY)
+
+    def test_scan_once_forgets_scan_when_handling_fails(self) -> None:
+        self.mock_alert_checker.scan.return_value = ScanResult(
+            status=ScanStatus.NEW_ALERT, alert=self.alert, new_locations=["x"]
+        )
+
+        for name, mock_method in [
+            ("get_districts", self.mock_alert_checker.get_districts),
+            ("get_alert_category", self.mock_alert_checker.get_alert_category),
+            ("upsert_alert", self.mock_data_table.upsert_alert),
+        ]:
+            with self.subTest(name=name):
+                self.mock_alert_checker.forget_last_scan.reset_mock()
+                mock_method.side_effect = RuntimeError("some-error")
+
+                with self.assertRaises(RuntimeError):
+                    scanner.scan_once(metrics=Metrics("scanner"))
+
+                self.mock_alert_checker.forget_last_scan.assert_called_once_with()
+                self.mock_alert_checker.mark_written.assert_not_called()
+                mock_method.side_effect = None
+
+    def test_scan_once_queues_writes(self) -> None:
+        write_queue = WriteQueue()
+        write_queue.put(self.alert, [create_district("d2")], self.alert_category)
+        self.mock_alert_checker.scan.return_value = ScanResult(
+            status=ScanStatus.NEW_ALERT, alert=self.alert, new_locations=["x"]
+        )
+        metrics = Metrics("scanner")
+
+        actual = scanner.scan_once(metrics=metrics, write_queue=write_queue)
+
+        self.assertEqual(ScanStatus.NEW_ALERT, actual)
+        self.mock_data_table.upsert_alert.assert_not_called()
+        # The coalesced write keeps its place in line
+        self.assertEqual(
+            [("d2", 99.5), ("d1", 99.5)],
+            [
+                (write.district.district_id, write.detected_at_s)
+                for write in write_queue.take(10, timeout_s=0)
+            ],
+        )
+        self.assertEqual(
+            {"queued_districts": 2, "coalesced_districts": 1, "rejected_districts": 0},
+            {
+                name: metrics.values[name]
+                for name in [
+                    "queued_districts",
+                    "coalesced_districts",
+                    "rejected_districts",
+                ]
+            },
+        )
+        self.mock_alert_checker.forget_last_scan.assert_not_called()
+
+    def test_scan_once_forgets_scan_when_write_queue_full(self) -> None:
+        write_queue = WriteQueue(max_entries=1)
+        self.mock_alert_checker.scan.return_value = ScanResult(
+            status=ScanStatus.NEW_ALERT, alert=self.alert, new_locations=["x"]
+        )
+        metrics = Metrics("scanner")
+
+        scanner.scan_once(metrics=metrics, write_queue=write_queue)
+
+        self.assertEqual(1, len(write_queue))
+        self.assertEqual(1, metrics.values["rejected_districts"])
+        self.mock_alert_checker.forget_last_scan.assert_called_once_with()
+
+    def test_scan_once_forgets_scan_after_dropped_writes(self) -> None:
+        write_queue = WriteQueue(max_attempts=1)
+        write_queue.put(
+            Alert(
+                alert_id="some-alert-id",
+                alert_category_id="1",
+                title="some-title",
+                locations=["some-location"],
+                description="some-description",
+            ),
+            [create_district("d1")],
+            self.alert_category,
+        )
+        write_queue.put_back(write_queue.take(10, timeout_s=0))
+        self.mock_alert_checker.scan.return_value = ScanResult(
+            status=ScanStatus.UNCHANGED
+        )
+
+        actual = scanner.scan_once(
+            timeout_s=1, metrics=Metrics("scanner"), write_queue=write_queue
+        )
+
+        self.assertEqual(ScanStatus.UNCHANGED, actual)
+        self.assertEqual(
+            [call.forget_last_scan(), call.scan(timeout_s=1)],
+            [
+                method_call
+                for method_call in self.mock_alert_checker.method_calls
+                if method_call[0] in ("forget_last_scan", "scan")
+            ],
+        )
+
+    def test_scan_once_marks_written_districts(self) -> None:
+        alert = Alert(
+            alert_id="some-alert-id",
+            alert_category_id="1",
+            title="some-title",
+            locations=["some-location-1", "some-location-2"],
+            description="some-description",
+        )
+        self.mock_alert_checker.scan.return_value = ScanResult(
+            status=ScanStatus.NEW_ALERT, alert=alert, new_locations=alert.locations
+        )
+        self.mock_data_table.upsert_alert.return_value = UpsertResult(
+            written_district_ids=["d1"], suppressed_district_ids=["d2"]
+        )
+
+        scanner.scan_once(metrics=Metrics("scanner"))
+
+        self.mock_alert_checker.mark_written.assert_called_once_with(
+            "some-alert-id", ["d1", "d2"]
+        )
+
+    def test_scan_once_marks_districts_written_by_write_stage(self) -> None:
+        write_queue = WriteQueue()
+        write_queue.report_written("some-alert-id", ["d1"], 100)
+        self.mock_alert_checker.scan.return_value = ScanResult(
+            status=ScanStatus.UNCHANGED
+        )
+
+        scanner.scan_once(metrics=Metrics("scanner"), write_queue=write_queue)
+
+        self.mock_alert_checker.mark_written.assert_called_once_with(
+            "some-alert-id", ["d1"], 100
+        )
+        self.mock_alert_checker.forget_last_scan.assert_not_called()
@@ -0,0 +1,26 @@
+from decimal import Decimal
+from unittest import TestCase
+
+from alexa_red_alert.serialization import dumps_orjson, dumps_stdlib
+
+
+class SerializationTest(TestCase):
+    def setUp(self) -> None:
+        self.value = {
+            "alerts": [{"area": "ערבה", "migun_time_s": Decimal("15"), "id": 1}],
+            "exists": True,
+        }
+
+    def test_dumps_stdlib(self) -> None:
+        self.assertEqual(
+            '{"alerts":[{"area":"ערבה","migun_time_s":"15","id":1}],"exists":true}',
+            dumps_stdlib(self.value),
+        )
+
+    def test_dumps_backends_match(self) -> None:
+        self.assertEqual(dumps_stdlib(self.value), dumps_orjson(self.value))
+
+    def test_dumps_unsupported_type(self) -> None:
+        for dumps in [dumps_stdlib, dumps_orjson]:
+            with self.assertRaises(TypeError):
+                dumps({"value": object()})
@@ -0,0 +1,151 @@
+from dataclasses import replace
+from unittest import TestCase
+
+from alexa_red_alert.alert import Alert
+from alexa_red_alert.alert_category import AlertCategory
+from alexa_red_alert.district import District
+from alexa_red_alert.write_queue import WriteQueue
+
+
+def create_district(district_id: str) -> District:
+    return District(
+        english_name=f"some-english-name-{district_id}",
+        code="some-code",
+        district_id=district_id,
+        area_id="some-area-id",
+        area_name="some-area-name",
+        hebrew_name=f"some-hebrew-name-{district_id}",
+        migun_time_s=15,
+    )
+
+
+class WriteQueueTest(TestCase):
+    def setUp(self) -> None:
+        self.maxDiff = None
+        self.write_queue = WriteQueue(max_entries=3)
+        self.alert = Alert(
+            alert_id="some-alert-id",
+            alert_category_id="1",
+            title="some-title",
+            locations=["some-location"],
+            description="some-description",
+        )
+        self.newer_alert = replace(self.alert, alert_id="newer-alert-id")
+        self.alert_category = AlertCategory(
+            category_id=1,
+            code_name="missilealert",
+            duration_minutes=10,
+            label="Missiles",
+            description="some-description",
+        )
+
+    def test_take_in_order(self) -> None:
+        self.write_queue.put(
+            self.alert,
+            [create_district("d1"), create_district("d2")],
+            self.alert_category,
+        )
+
+        actual_1 = self.write_queue.take(1, timeout_s=0)
+        actual_2 = self.write_queue.take(10, timeout_s=0)
+
+        self.assertEqual(["d1"], [write.district.district_id for write in actual_1])
+        self.assertEqual(["d2"], [write.district.district_id for write in actual_2])
+        self.assertEqual([], self.write_queue.take(10, timeout_s=0))
+
+    def test_put_coalesces_newer_alert(self) -> None:
+        self.write_queue.put(
+            self.alert,
+            [create_district("d1"), create_district("d2")],
+            self.alert_category,
+        )
+
+        self.write_queue.put(
+            self.newer_alert,
+            [create_district("d2")],
+            self.alert_category,
+            detected_at_s=100,
+        )
+
+        actual = self.write_queue.take(10, timeout_s=0)
+        self.assertEqual(1, self.write_queue.coalesced)
+        self.assertEqual(
+            [("d1", "some-alert-id", None), ("d2", "newer-alert-id", 100)],
+            [
+                (write.district.district_id, write.alert.alert_id, write.detected_at_s)
+                for write in actual
+            ],
+        )
+
+    def test_put_rejects_when_full(self) -> None:
+        districts = [create_district(f"d{i}") for i in range(4)]
+
+        actual = self.write_queue.put(self.alert, districts, self.alert_category)
+
+        self.assertEqual([districts[3]], actual)
+        self.assertEqual(3, len(self.write_queue))
+        self.assertEqual(1, self.write_queue.rejected)
+
+    def test_put_back_keeps_newer_writes(self) -> None:
+        self.write_queue.put(
+            self.alert,
+            [create_district("d1"), create_district("d2")],
+            self.alert_category,
+        )
+        failed = self.write_queue.take(10, timeout_s=0)
+        self.write_queue.put(
+            self.newer_alert, [create_district("d1")], self.alert_category
+        )
+
+        self.write_queue.put_back(failed)
+
+        self.assertEqual(
+            [("d1", "newer-alert-id"), ("d2", "some-alert-id")],
+            [
+                (write.district.district_id, write.alert.alert_id)
+                for write in self.write_queue.take(10, timeout_s=0)
+            ],
+        )
+
+    def test_put_back_drops_after_max_attempts(self) -> None:
+        write_queue = WriteQueue(max_attempts=2)
+        write_queue.put(self.alert, [create_district("d1")], self.alert_category)
+
+        first = write_queue.put_back(write_queue.take(10, timeout_s=0))
+        second = write_queue.put_back(write_queue.take(10, timeout_s=0))
+
+        self.assertEqual([], first)
+        self.assertEqual(["d1"], [write.district.district_id for write in second])
+        self.assertEqual(0, len(write_queue))
+        self.assertEqual(1, write_queue.take_dropped())
+        self.assertEqual(0, write_queue.take_dropped())
+
+    def test_put_back_drops_when_full(self) -> None:
+        self.write_queue.put(self.alert, [create_district("d1")], self.alert_category)
+        failed = self.write_queue.take(10, timeout_s=0)
+        self.write_queue.put(
+            self.alert,
+            [create_district("d2"), create_district("d3"), create_district("d4")],
+            self.alert_category,
+        )
+
+        actual = self.write_queue.put_back(failed)
+
+        self.assertEqual(failed, actual)
+        self.assertEqual(1, self.write_queue.dropped)
+        self.assertEqual(1, self.write_queue.take_dropped())
+
+    def test_take_written(self) -> None:
+        self.write_queue.report_written("some-alert-id", ["d1", "d2"], 100)
+
+        self.assertEqual(
+            [("some-alert-id", ["d1", "d2"], 100)], self.write_queue.take_written()
+        )
+        self.assertEqual([], self.write_queue.take_written())
+
+    def test_clear(self) -> None:
+        self.write_queue.put(self.alert, [create_district("d1")], self.alert_category)
+
+        self.assertEqual(1, self.write_queue.clear())
+        self.assertEqual(0, len(self.write_queue))
+        self.assertIsNone(self.write_queue.oldest_queued_at)